@@ -12,8 +12,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import sql
-import requests
-import time
+import geocoding
+import rate_scheduler
 
 def create_geocoding_cache_table():
     """Crée la table de cache de géocodage"""
@@ -22,43 +22,24 @@ def create_geocoding_cache_table():
             CREATE TABLE IF NOT EXISTS geocoding_cache (
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 address VARCHAR(500) NOT NULL UNIQUE,
+                address_key VARCHAR(500) DEFAULT NULL,
                 latitude DECIMAL(10, 8),
                 longitude DECIMAL(11, 8),
+                source VARCHAR(20) DEFAULT NULL,
+                retry_after TIMESTAMP NULL DEFAULT NULL,
                 geocoded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                INDEX idx_address (address)
+                INDEX idx_address (address),
+                INDEX idx_address_key (address_key)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
         """)
         print("✅ Table geocoding_cache créée")
 
-def geocode_address(address):
-    """Géocode une adresse via Nominatim"""
-    try:
-        response = requests.get(
-            'https://nominatim.openstreetmap.org/search',
-            params={
-                'q': address,
-                'format': 'json',
-                'limit': 1,
-                'countrycodes': 'fr'  # Limiter à la France
-            },
-            headers={'User-Agent': 'Carette-RSE-Dashboard/1.0'},
-            timeout=5
-        )
-        
-        if response.status_code == 200:
-            results = response.json()
-            if results:
-                return {
-                    'lat': float(results[0]['lat']),
-                    'lon': float(results[0]['lon'])
-                }
-    except Exception as e:
-        print(f"❌ Erreur géocodage pour '{address}': {e}")
-    
-    return None
-
+@rate_scheduler.batch()
 def geocode_all_addresses():
-    """Géocode toutes les adresses uniques des employés"""
+    """
+    Géocode toutes les adresses uniques des employés.
+    Le débit BAN / Nominatim est respecté par rate_scheduler.
+    """
     with sql.db_cursor() as cur:
         # Récupérer toutes les adresses uniques
         cur.execute("""
@@ -74,34 +55,18 @@ def geocode_all_addresses():
         print(f"📍 {len(addresses)} adresses à géocoder")
         
         for i, address in enumerate(addresses, 1):
-            # Vérifier si déjà dans le cache
-            cur.execute("SELECT latitude, longitude FROM geocoding_cache WHERE address = %s", (address,))
-            cached = cur.fetchone()
-            
-            if cached and cached['latitude']:
-                print(f"✓ [{i}/{len(addresses)}] {address} (déjà en cache)")
-                continue
-            
-            # Géocoder
-            print(f"🔍 [{i}/{len(addresses)}] Géocodage de: {address}")
-            coords = geocode_address(address)
+            # Caches mémoire/MySQL (adresses normalisées) puis BAN / Nominatim
+            print(f"🔍 [{i}/{len(addresses)}] {address}")
+            coords = geocoding.geocode(address, cur)
             
             if coords:
-                cur.execute("""
-                    INSERT INTO geocoding_cache (address, latitude, longitude)
-                    VALUES (%s, %s, %s)
-                    ON DUPLICATE KEY UPDATE 
-                        latitude = VALUES(latitude),
-                        longitude = VALUES(longitude),
-                        geocoded_at = CURRENT_TIMESTAMP
-                """, (address, coords['lat'], coords['lon']))
-                print(f"   ✅ Géocodé: {coords['lat']}, {coords['lon']}")
+                print(f"   ✅ {coords[1]}, {coords[0]}")
             else:
                 print(f"   ⚠️  Échec du géocodage")
-            
-            # Respecter les limites de l'API (1 req/sec)
-            if i < len(addresses):
-                time.sleep(1.1)
+        
+        stats = geocoding.get_stats()
+        print(f"\n📊 {stats['memory_hits'] + stats['db_hits']} en cache, {stats['ban']} BAN, "
+              f"{stats['nominatim']} Nominatim, {stats['not_found'] + stats['negative_hits']} introuvable(s)")
 
 if __name__ == '__main__':
     print("🗺️  Configuration du système de géocodage\n")
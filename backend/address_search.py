@@ -0,0 +1,291 @@
+"""
+Autocomplétion d'adresses (/api/geocode/search, appelé à chaque frappe du widget).
+
+- Clé de cache : requête normalisée comme geocoding.normalize_address, sauf
+  le dernier mot, en cours de frappe (pas d'expansion d'abréviation :
+  "12 rue de la pl" peut encore devenir "12 rue de la plaine")
+- LRU en mémoire du processus (CARETTE_AUTOCOMPLETE_CACHE_SIZE) avec TTL
+  (CARETTE_AUTOCOMPLETE_TTL) ; les fournisseurs sont toujours interrogés avec
+  CARETTE_AUTOCOMPLETE_FETCH_LIMIT résultats, quel que soit le limit demandé
+- Préfixe : "12 rue de la p" est servi en filtrant localement les résultats
+  en cache de "12 rue de la" si le filtrage en garde au moins limit, ou si
+  la liste en cache était complète (moins de résultats que demandés)
+- Fournisseurs en course : la BAN part tout de suite, Nominatim en parallèle
+  si la BAN n'a pas donné de résultat exploitable après
+  CARETTE_AUTOCOMPLETE_HEDGE_DELAY secondes (0 = les deux immédiatement).
+  Le premier résultat exploitable gagne. Nominatim interdit l'autocomplétion
+  à chaque frappe : il ne sert qu'en secours.
+
+Les recherches simultanées d'une même clé partagent un seul appel (single_flight).
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as futures_wait
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+import rate_scheduler
+import single_flight
+from geocoding import BAN_URL, NOMINATIM_URL, normalize_address
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_CACHE_SIZE = int(os.getenv('CARETTE_AUTOCOMPLETE_CACHE_SIZE', '5000'))
+AUTOCOMPLETE_TTL = int(os.getenv('CARETTE_AUTOCOMPLETE_TTL', '86400'))
+AUTOCOMPLETE_FETCH_LIMIT = int(os.getenv('CARETTE_AUTOCOMPLETE_FETCH_LIMIT', '20'))
+AUTOCOMPLETE_HEDGE_DELAY = float(os.getenv('CARETTE_AUTOCOMPLETE_HEDGE_DELAY', '0.3'))
+AUTOCOMPLETE_TIMEOUT = float(os.getenv('CARETTE_AUTOCOMPLETE_TIMEOUT', '5'))
+# Score BAN minimum (0-1) pour préférer la BAN à Nominatim
+AUTOCOMPLETE_BAN_MIN_SCORE = float(os.getenv('CARETTE_AUTOCOMPLETE_BAN_MIN_SCORE', '0.5'))
+
+# Préfixe le plus court (caractères) dont les résultats servent au filtrage local
+MIN_PREFIX_LENGTH = 3
+# Durée de vie (s) des résultats obtenus pendant la panne d'un fournisseur
+DEGRADED_TTL = 300
+USER_AGENT = 'Carette-Carpool-Widget/1.0'
+
+# clé → (résultats formatés, source, liste complète, expiration)
+_memory: "OrderedDict[str, Tuple[List[Dict], str, bool, float]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {
+    'hits': 0,
+    'prefix_hits': 0,
+    'misses': 0,
+    'ban': 0,
+    'nominatim': 0,
+    'empty': 0,
+    'errors': 0,
+}
+_flights = single_flight.get_group('autocomplete')
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix='autocomplete')
+
+
+def _incr(counter: str):
+    with _lock:
+        _stats[counter] += 1
+
+
+def search_key(query: str) -> str:
+    """Clé de cache d'une saisie (dernier mot non développé s'il est en cours de frappe)"""
+    return normalize_address(query, partial=query[-1:].isalnum())
+
+
+def matches(key: str, label: str) -> bool:
+    """Le libellé contient tous les mots de la clé (le dernier comme début de mot)"""
+    words = key.split()
+    if not words:
+        return True
+    label_words = normalize_address(label).split()
+    known = set(label_words)
+    if any(word not in known for word in words[:-1]):
+        return False
+    return any(label_word.startswith(words[-1]) for label_word in label_words)
+
+
+# ============================================================================
+# Cache
+# ============================================================================
+
+def _memory_get(key: str):
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        if entry[3] < time.time():
+            del _memory[key]
+            return None
+        _memory.move_to_end(key)
+        return entry
+
+
+def _memory_set(key: str, features: List[Dict], source: str, complete: bool, ttl: float = AUTOCOMPLETE_TTL):
+    with _lock:
+        _memory[key] = (features, source, complete, time.time() + ttl)
+        _memory.move_to_end(key)
+        while len(_memory) > AUTOCOMPLETE_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def _from_prefix(key: str, limit: int):
+    """Résultats filtrés du plus long préfixe en cache de la clé (None si insuffisants)"""
+    for end in range(len(key) - 1, MIN_PREFIX_LENGTH - 1, -1):
+        entry = _memory_get(key[:end])
+        if entry is None:
+            continue
+        features, source, complete, _ = entry
+        filtered = [feature for feature in features if matches(key, feature['label'])]
+        if complete or len(filtered) >= limit:
+            return filtered, source, complete
+        return None
+    return None
+
+
+def clear_memory():
+    with _lock:
+        _memory.clear()
+
+
+# ============================================================================
+# Fournisseurs
+# ============================================================================
+
+def _search_ban(query: str) -> Optional[List[Dict]]:
+    """Résultats BAN formatés, None si aucun n'atteint le score minimum"""
+    response = rate_scheduler.request(BAN_URL, params={'q': query, 'limit': AUTOCOMPLETE_FETCH_LIMIT},
+                                      headers={'User-Agent': USER_AGENT}, timeout=AUTOCOMPLETE_TIMEOUT)
+    response.raise_for_status()
+    features = response.json().get('features') or []
+    if max((f.get('properties', {}).get('score', 0) for f in features), default=0) <= AUTOCOMPLETE_BAN_MIN_SCORE:
+        return None
+
+    results = []
+    for feature in features:
+        props = feature.get('properties', {})
+        coords = feature.get('geometry', {}).get('coordinates', [])
+        results.append({
+            'label': props.get('label', ''),
+            'name': props.get('name', ''),
+            'postcode': props.get('postcode', ''),
+            'city': props.get('city', ''),
+            'context': props.get('context', ''),
+            'type': props.get('type', ''),
+            'score': props.get('score', 0),
+            'lon': coords[0] if len(coords) > 0 else None,
+            'lat': coords[1] if len(coords) > 1 else None
+        })
+    return results
+
+
+def _search_nominatim(query: str) -> List[Dict]:
+    response = rate_scheduler.request(NOMINATIM_URL,
+                                      params={'q': query, 'format': 'json', 'limit': AUTOCOMPLETE_FETCH_LIMIT,
+                                              'addressdetails': 1},
+                                      headers={'User-Agent': USER_AGENT}, timeout=AUTOCOMPLETE_TIMEOUT)
+    response.raise_for_status()
+    return [{
+        'label': item.get('display_name', ''),
+        'name': item.get('name', ''),
+        'type': item.get('type', ''),
+        'lon': float(item.get('lon', 0)),
+        'lat': float(item.get('lat', 0))
+    } for item in response.json()]
+
+
+PROVIDERS = [('ban', _search_ban), ('nominatim', _search_nominatim)]
+
+
+def search_upstream(query: str, hedge_delay: Optional[float] = None):
+    """
+    Course entre fournisseurs (voir osrm_client.hedged) : le suivant est lancé
+    après hedge_delay secondes sans résultat exploitable, ou dès qu'un
+    fournisseur échoue. Une liste vide n'est retenue qu'en dernier recours.
+
+    Returns:
+        (résultats, source, definitive) — definitive est False si un
+        fournisseur était injoignable (réponse à ne garder que peu de temps)
+    """
+    hedge_delay = AUTOCOMPLETE_HEDGE_DELAY if hedge_delay is None else hedge_delay
+    deadline = time.monotonic() + AUTOCOMPLETE_TIMEOUT
+    pending = {}
+    next_index = 0
+    fallback = None
+    definitive = True
+
+    while True:
+        if not pending or (next_index < len(PROVIDERS) and hedge_delay <= 0):
+            if next_index >= len(PROVIDERS):
+                break
+            name, provider = PROVIDERS[next_index]
+            pending[_executor.submit(metrics.bind(provider), query)] = name
+            next_index += 1
+            continue
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            definitive = False
+            break
+        wait_time = min(hedge_delay, remaining) if next_index < len(PROVIDERS) else remaining
+        done, _ = futures_wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = pending.pop(future)
+            try:
+                results = future.result()
+            except Exception as e:
+                logger.warning(f"⚠️ Autocomplétion {name} indisponible pour '{query}': {e}")
+                definitive = False
+                continue
+            if results:
+                _incr(name)
+                return results, name, definitive
+            if results is not None and fallback is None:
+                fallback = (results, name)
+
+        # Pas de résultat exploitable : lancer le fournisseur suivant en parallèle
+        if next_index < len(PROVIDERS):
+            name, provider = PROVIDERS[next_index]
+            pending[_executor.submit(metrics.bind(provider), query)] = name
+            next_index += 1
+
+    if fallback is not None:
+        return fallback[0], fallback[1], definitive
+    return [], 'none', definitive
+
+
+def _fetch(query: str, key: str):
+    entry = _memory_get(key)
+    if entry is not None:
+        return entry[0], entry[1]
+    features, source, definitive = search_upstream(query)
+    if not features:
+        _incr('empty' if definitive else 'errors')
+    if definitive:
+        # Liste vide jamais complète : une saisie plus longue peut trouver un résultat
+        _memory_set(key, features, source, 0 < len(features) < AUTOCOMPLETE_FETCH_LIMIT)
+    elif features:
+        # Fournisseur en panne : résultats du secours gardés peu de temps (jamais complets)
+        _memory_set(key, features, source, False, min(DEGRADED_TTL, AUTOCOMPLETE_TTL))
+    return features, source
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+def search(query: str, limit: int = 5) -> Tuple[List[Dict], str]:
+    """
+    Suggestions d'adresses pour une saisie (brute, espace finale comprise).
+
+    Returns:
+        (résultats formatés, source) — source 'ban', 'nominatim' ou 'none'
+    """
+    key = search_key(query or '')  # avant strip : une espace finale termine le dernier mot
+    query = (query or '').strip()
+    if not key:
+        return [], 'none'
+
+    entry = _memory_get(key)
+    if entry is not None:
+        _incr('hits')
+        return entry[0][:limit], entry[1]
+
+    from_prefix = _from_prefix(key, limit)
+    if from_prefix is not None:
+        _incr('prefix_hits')
+        return from_prefix[0][:limit], from_prefix[1]
+
+    _incr('misses')
+    features, source = _flights.do(key, _fetch, query, key)
+    return features[:limit], source
+
+
+def get_stats() -> Dict:
+    """Compteurs du cache d'autocomplétion et appels par fournisseur"""
+    with _lock:
+        stats = dict(_stats)
+        stats['memory_size'] = len(_memory)
+    lookups = stats['hits'] + stats['prefix_hits'] + stats['misses']
+    stats['hit_ratio'] = round((stats['hits'] + stats['prefix_hits']) / lookups, 4) if lookups else 0.0
+    return stats
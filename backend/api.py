@@ -9,13 +9,14 @@ from flask_limiter.util import get_remote_address
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import logging
-import requests
 from pymysql.err import IntegrityError
 import math
 import json
 import sys
 import os
+import time
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
 
 # Charger variables d'environnement
 load_dotenv()
@@ -33,9 +34,13 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 # Import des modules DB, buffer géographique et validation
 import sql
+import geocoding
 import init_carpool_tables
+import metrics
+import osrm_client
+import single_flight
 from route_buffer import create_buffer_from_route, create_buffer_simple
-from temporal_buffer import create_temporal_buffer, calculate_detour_time_osrm, haversine_distance
+from temporal_buffer import create_temporal_buffer, calculate_detour_time_osrm, calculate_detour_time_osrm_fast, haversine_distance, detour_lower_bound
 from validation import (
     validate_coordinates, sanitize_text, validate_datetime,
     validate_integer, validate_user_id, validate_email
@@ -156,6 +161,9 @@ limiter = Limiter(
     storage_uri=storage_uri
 )
 
+# Chronométrage par requête (SQL, OSRM/géocodeurs, SMTP) et endpoint /metrics
+metrics.register_metrics(app, limiter)
+
 
 def estimate_realistic_duration(distance_meters, route_data=None):
     """
@@ -193,6 +201,9 @@ def estimate_realistic_duration(distance_meters, route_data=None):
     return int(duration_seconds)
 
 
+_osrm_route_flights = single_flight.get_group('osrm_route')
+
+
 def calculate_osrm_route(waypoints, get_alternatives=False):
     """
     Calcule un itinéraire via OSRM avec support des alternatives
@@ -207,53 +218,42 @@ def calculate_osrm_route(waypoints, get_alternatives=False):
     if not waypoints or len(waypoints) < 2:
         return {"error": "Au moins 2 points requis"}
     
-    # Serveurs OSRM avec fallback
-    servers = [
-        'https://router.project-osrm.org',
-        'https://routing.openstreetmap.de/routed-car',
-        'http://router.project-osrm.org'
-    ]
-    
-    # Construire URL avec coordonnées
-    coords_str = ';'.join([f"{lon},{lat}" for lon, lat in waypoints])
-    
-    for server in servers:
-        try:
-            url = f"{server}/route/v1/driving/{coords_str}"
-            params = {
-                'overview': 'full',
-                'geometries': 'geojson',
-                'steps': 'true'
-            }
-            
-            if get_alternatives:
-                params['alternatives'] = 3
-            
-            resp = requests.get(url, params=params, timeout=10)
-            
-            if resp.status_code == 200:
-                data = resp.json()
-                
-                if data.get('code') == 'Ok' and 'routes' in data:
-                    routes = data['routes']
-                    
-                    result = {
-                        'route': routes[0],
-                        'alternatives': routes[1:] if get_alternatives and len(routes) > 1 else []
-                    }
-                    
-                    # Ajouter durées réalistes estimées
-                    for r in [result['route']] + result['alternatives']:
-                        r['realistic_duration'] = estimate_realistic_duration(
-                            r.get('distance', 0),
-                            r
-                        )
-                    
-                    return result
+    # Les demandes identiques simultanées partagent un seul appel OSRM
+    try:
+        key = (tuple((float(lon), float(lat)) for lon, lat in waypoints), bool(get_alternatives))
+    except (TypeError, ValueError):
+        return {"error": "Coordonnées invalides"}
+    return _osrm_route_flights.do(key, _fetch_osrm_route, waypoints, get_alternatives)
+
+
+def _fetch_osrm_route(waypoints, get_alternatives):
+    """Appel OSRM de calculate_osrm_route (voir single_flight)"""
+    # Serveurs OSRM en couverture : le secours est interrogé en parallèle si le
+    # principal tarde, les serveurs en échec répété sont ignorés temporairement
+    data = osrm_client.route_hedged(
+        waypoints,
+        overview='full',
+        geometries='geojson',
+        steps=True,
+        alternatives=3 if get_alternatives else None,
+        timeout=10
+    )
+    if data:
+        routes = data['routes']
         
-        except Exception as e:
-            print(f"⚠️ OSRM {server} failed: {e}")
-            continue
+        result = {
+            'route': routes[0],
+            'alternatives': routes[1:] if get_alternatives and len(routes) > 1 else []
+        }
+        
+        # Ajouter durées réalistes estimées
+        for r in [result['route']] + result['alternatives']:
+            r['realistic_duration'] = estimate_realistic_duration(
+                r.get('distance', 0),
+                r
+            )
+        
+        return result
     
     return {"error": "Tous les serveurs OSRM ont échoué"}
 
@@ -2063,23 +2063,11 @@ def calculate_pickup_times():
             return jsonify({'error': 'Could not calculate route timing'}), 500
         
         # Calculer la route du point de pickup à la destination
-        pickup_to_dest_url = f"https://router.project-osrm.org/route/v1/driving/{search_point[0]},{search_point[1]};{end_point[0]},{end_point[1]}?overview=false"
-        
-        try:
-            resp = requests.get(pickup_to_dest_url, timeout=5)
-            if resp.ok:
-                route_info = resp.json()
-                if route_info.get('code') == 'Ok' and route_info.get('routes'):
-                    segment_distance_m = route_info['routes'][0]['distance']
-                    segment_duration_s = route_info['routes'][0]['duration']
-                    segment_distance_km = segment_distance_m / 1000
-                else:
-                    return jsonify({'error': 'Could not calculate segment route'}), 500
-            else:
-                return jsonify({'error': 'OSRM routing failed'}), 500
-        except Exception as e:
-            logger.error(f"Error calculating segment route: {e}")
-            return jsonify({'error': 'Routing service error'}), 500
+        segment = osrm_client.route_summary([search_point, end_point])
+        if not segment:
+            return jsonify({'error': 'Could not calculate segment route'}), 500
+        segment_duration_s, segment_distance_m = segment
+        segment_distance_km = segment_distance_m / 1000
         
         # Calculer le prix du segment selon tarif BlaBlaCar
         # Vérifier si l'offre inclut les péages
@@ -2096,21 +2084,11 @@ def calculate_pickup_times():
         
         # Temps pour aller du départ au point de pickup (approximation: detour_time / 2)
         # Plus précis: calculer la route start -> search_point
-        start_to_pickup_url = f"https://router.project-osrm.org/route/v1/driving/{start_point[0]},{start_point[1]};{search_point[0]},{search_point[1]}?overview=false"
-        
-        try:
-            resp = requests.get(start_to_pickup_url, timeout=5)
-            if resp.ok:
-                route_info = resp.json()
-                if route_info.get('code') == 'Ok' and route_info.get('routes'):
-                    time_to_pickup_s = route_info['routes'][0]['duration']
-                    time_to_pickup_min = time_to_pickup_s / 60
-                else:
-                    # Fallback: utiliser detour_time / 2
-                    time_to_pickup_min = detour_time / 2
-            else:
-                time_to_pickup_min = detour_time / 2
-        except:
+        time_to_pickup_s = osrm_client.route_duration([start_point, search_point])
+        if time_to_pickup_s is not None:
+            time_to_pickup_min = time_to_pickup_s / 60
+        else:
+            # Fallback: utiliser detour_time / 2
             time_to_pickup_min = detour_time / 2
         
         # Heure de pickup = heure de départ + temps pour arriver au pickup
@@ -2161,8 +2139,8 @@ if __name__ == '__main__':
 @app.route('/api/geocode/search', methods=['GET'])
 @limiter.limit("60 per minute")
 def search_geocode():
-    """Proxy pour recherche d'adresse (BAN puis Nominatim en fallback)"""
-    from urllib.parse import quote as url_quote
+    """Proxy pour recherche d'adresse (cache par préfixe, BAN et Nominatim en course)"""
+    import address_search
     
     query = request.args.get('q', '').strip()
     limit = request.args.get('limit', '5')
@@ -2172,59 +2150,14 @@ def search_geocode():
     
     # Validation de la limite
     try:
-        limit_int = validate_integer(limit, min_val=1, max_val=20, field_name="limit")
-        limit = str(limit_int)
+        limit = validate_integer(limit, min_val=1, max_val=20, field_name="limit")
     except ValueError:
-        limit = '5'
+        limit = 5
     
     try:
-        # API BAN (Base Adresse Nationale - France)
-        ban_url = f"https://api-adresse.data.gouv.fr/search/?q={url_quote(query)}&limit={limit}"
-        ban_resp = requests.get(ban_url, timeout=10)
-        
-        if ban_resp.status_code == 200:
-            ban_data = ban_resp.json()
-            if ban_data.get('features'):
-                best_score = max((f.get('properties', {}).get('score', 0) for f in ban_data['features']), default=0)
-                
-                if best_score > 0.5:
-                    # Formater résultats BAN
-                    ban_features = []
-                    for feature in ban_data['features']:
-                        props = feature.get('properties', {})
-                        coords = feature.get('geometry', {}).get('coordinates', [])
-                        ban_features.append({
-                            'label': props.get('label', ''),
-                            'name': props.get('name', ''),
-                            'postcode': props.get('postcode', ''),
-                            'city': props.get('city', ''),
-                            'context': props.get('context', ''),
-                            'type': props.get('type', ''),
-                            'score': props.get('score', 0),
-                            'lon': coords[0] if len(coords) > 0 else None,
-                            'lat': coords[1] if len(coords) > 1 else None
-                        })
-                    return jsonify({'features': ban_features, 'source': 'ban'})
-        
-        # Fallback Nominatim (couverture mondiale)
-        nom_url = f"https://nominatim.openstreetmap.org/search?format=json&q={url_quote(query)}&limit={limit}&addressdetails=1"
-        nom_headers = {'User-Agent': 'Carette-Carpool-Widget/1.0'}
-        nom_resp = requests.get(nom_url, headers=nom_headers, timeout=10)
-        
-        if nom_resp.status_code == 200:
-            nom_data = nom_resp.json()
-            nom_features = []
-            for item in nom_data:
-                nom_features.append({
-                    'label': item.get('display_name', ''),
-                    'name': item.get('name', ''),
-                    'type': item.get('type', ''),
-                    'lon': float(item.get('lon', 0)),
-                    'lat': float(item.get('lat', 0))
-                })
-            return jsonify({'features': nom_features, 'source': 'nominatim'})
-        
-        return jsonify({'features': [], 'source': 'none'})
+        # Saisie brute : l'espace finale indique que le dernier mot est complet
+        features, source = address_search.search(request.args.get('q', ''), limit)
+        return jsonify({'features': features, 'source': source})
         
     except Exception as e:
         logger.error(f"Error in search_geocode: {str(e)}")
@@ -2237,7 +2170,9 @@ def search_geocode():
 @app.route('/api/geocode/reverse', methods=['GET'])
 @limiter.limit("60 per minute")
 def reverse_geocode():
-    """Géocodage inversé (coordonnées -> adresse)"""
+    """Géocodage inversé (coordonnées -> adresse), en cache par case de ~25 m"""
+    import reverse_geocoding
+    
     lat = request.args.get('lat')
     lon = request.args.get('lon')
     
@@ -2248,13 +2183,11 @@ def reverse_geocode():
         # Validation des coordonnées
         lon, lat = validate_coordinates(lon, lat)
         
-        # Nominatim reverse geocoding
-        url = f"https://nominatim.openstreetmap.org/reverse?format=json&lat={lat}&lon={lon}"
-        headers = {'User-Agent': 'Carette-Carpool-Widget/1.0'}
-        resp = requests.get(url, headers=headers, timeout=10)
+        # Nominatim reverse geocoding (caches mémoire et MySQL)
+        data = reverse_geocoding.reverse_geocode(lon, lat)
         
-        if resp.status_code == 200:
-            return jsonify(resp.json())
+        if data is not None:
+            return jsonify(data)
         else:
             return jsonify({'error': 'Géocodage inversé échoué'}), 500
     
@@ -2270,6 +2203,36 @@ def reverse_geocode():
             return jsonify({"error": "Erreur serveur"}), 500
 
 
+def compute_direct_routes(departure_coords, destination_coords):
+    """
+    Calcule les trajets directs aller (domicile → site) et retour (site → domicile)
+    d'une offre récurrente, stockés avec l'offre pour éviter de les recalculer
+    à chaque recherche.
+    
+    Returns:
+        Dict {direct_duration_outbound, direct_distance_outbound,
+              direct_duration_return, direct_distance_return} (secondes / mètres, None si échec)
+    """
+    result = {
+        'direct_duration_outbound': None,
+        'direct_distance_outbound': None,
+        'direct_duration_return': None,
+        'direct_distance_return': None
+    }
+    if not departure_coords or not destination_coords:
+        return result
+    
+    outbound = osrm_client.route_summary([departure_coords, destination_coords])
+    if outbound:
+        result['direct_duration_outbound'], result['direct_distance_outbound'] = outbound
+    
+    return_trip = osrm_client.route_summary([destination_coords, departure_coords])
+    if return_trip:
+        result['direct_duration_return'], result['direct_distance_return'] = return_trip
+    
+    return result
+
+
 @app.route('/api/v2/offers/recurrent', methods=['POST'])
 @limiter.limit("10 per minute")
 def create_recurrent_offer():
@@ -2410,6 +2373,9 @@ def create_recurrent_offer():
         route_outbound = data.get('route_outbound')
         route_return = data.get('route_return')
         
+        # Trajets directs aller/retour : propriété fixe de l'offre, calculée une seule fois
+        direct_routes = compute_direct_routes(departure_coords, destination_coords)
+        
         # Insérer dans la base de données
         with sql.db_cursor() as cur:
             cur.execute("""
@@ -2417,8 +2383,10 @@ def create_recurrent_offer():
                 (company_id, site_id, departure, destination, departure_coords, destination_coords,
                  recurrent_time, time_return, monday, tuesday, wednesday, thursday, friday, saturday, sunday,
                  seats, route_outbound, route_return, max_detour_time, color_outbound, color_return,
-                 driver_email, driver_name, driver_phone, status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'active')
+                 driver_email, driver_name, driver_phone,
+                 direct_duration_outbound, direct_distance_outbound,
+                 direct_duration_return, direct_distance_return, status)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, 'active')
             """, (
                 company_id, site_id, departure, destination,
                 json.dumps(departure_coords) if departure_coords else None,
@@ -2433,7 +2401,9 @@ def create_recurrent_offer():
                 max_detour_time,
                 color_outbound,
                 color_return,
-                driver_email, driver_name, driver_phone
+                driver_email, driver_name, driver_phone,
+                direct_routes['direct_duration_outbound'], direct_routes['direct_distance_outbound'],
+                direct_routes['direct_duration_return'], direct_routes['direct_distance_return']
             ))
             
             offer_id = cur.lastrowid
@@ -2513,66 +2483,11 @@ def geocode_address_auto(address, cur):
     if not address or address.strip() == '':
         return None
     
-    address = address.strip()
-    
-    # Vérifier d'abord dans le cache
-    cur.execute("SELECT latitude, longitude FROM geocoding_cache WHERE address = %s", (address,))
-    cached = cur.fetchone()
-    
-    if cached and cached['latitude']:
-        return {
-            'lat': float(cached['latitude']),
-            'lon': float(cached['longitude'])
-        }
-    
-    # Géocoder via Nominatim
-    try:
-        response = requests.get(
-            'https://nominatim.openstreetmap.org/search',
-            params={
-                'q': address,
-                'format': 'json',
-                'limit': 1,
-                'countrycodes': 'fr'
-            },
-            headers={'User-Agent': 'Carette-RSE-Dashboard/1.0'},
-            timeout=3
-        )
-        
-        if response.status_code == 200:
-            results = response.json()
-            if results:
-                lat = float(results[0]['lat'])
-                lon = float(results[0]['lon'])
-                
-                # Créer la table si elle n'existe pas
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS geocoding_cache (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        address VARCHAR(500) NOT NULL UNIQUE,
-                        latitude DECIMAL(10, 8),
-                        longitude DECIMAL(11, 8),
-                        geocoded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        INDEX idx_address (address)
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
-                """)
-                
-                # Stocker en cache
-                cur.execute("""
-                    INSERT INTO geocoding_cache (address, latitude, longitude)
-                    VALUES (%s, %s, %s)
-                    ON DUPLICATE KEY UPDATE 
-                        latitude = VALUES(latitude),
-                        longitude = VALUES(longitude),
-                        geocoded_at = CURRENT_TIMESTAMP
-                """, (address, lat, lon))
-                
-                logger.info(f"📍 Géocodé: {address} → {lat}, {lon}")
-                return {'lat': lat, 'lon': lon}
-    except Exception as e:
-        logger.warning(f"⚠️ Échec géocodage pour '{address}': {e}")
-    
-    return None
+    # Caches mémoire/MySQL, adresses normalisées, BAN puis Nominatim (voir geocoding)
+    coords = geocoding.geocode(address, cur)
+    if coords is None:
+        return None
+    return {'lat': coords[1], 'lon': coords[0]}
 
 
 @app.route('/api/v2/rse/submit', methods=['POST'])
@@ -2807,6 +2722,10 @@ def submit_rse_data():
                     habits_data['thursday'], habits_data['friday']
                 ))
                 logger.info(f"✨ Habitudes créées pour user_id={user_id}")
+            
+            # Habitudes/adresse changées : recalculer uniquement ses suggestions de covoiturage
+            from carpool_matching import invalidate_user_suggestions
+            invalidate_user_suggestions(user_id, cur)
         
         # Préparer les données pour l'email
         rse_data = {
@@ -2971,6 +2890,115 @@ L'équipe Carette
         return jsonify({'error': 'Erreur serveur'}), 500
 
 
+# Évaluation concurrente des détours en recherche récurrente
+SEARCH_WORKERS = int(os.getenv('CARETTE_SEARCH_WORKERS', '8'))
+SEARCH_DEADLINE_SECONDS = float(os.getenv('CARETTE_SEARCH_DEADLINE', '4'))
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix='detour-search')
+
+
+def evaluate_recurrent_detour(offer_id, dep_coords, dest_coords, user_point,
+                              direct_duration_outbound, direct_duration_return,
+                              remaining_outbound, remaining_return):
+    """
+    Calcule le détour OSRM d'un passager pour une offre récurrente
+    (aller d'abord, puis retour si l'aller ne convient pas).
+    Un sens dont le budget restant est None n'est pas évalué.
+    
+    Returns:
+        Tuple (sens compatible 'outbound'/'return' ou None, détour en minutes ou None)
+    
+    Raises:
+        osrm_client.RateLimited: aucun sens compatible et au moins un sens
+        non évalué faute de jeton OSRM (offre à renvoyer "pending")
+    """
+    directions = [
+        ('outbound', dep_coords, dest_coords, direct_duration_outbound, remaining_outbound),
+        ('return', dest_coords, dep_coords, direct_duration_return, remaining_return),
+    ]
+    rate_limited = None
+    for direction, start, end, direct_duration, remaining in directions:
+        if remaining is None:
+            continue
+        try:
+            logger.info(f"🔍 Calcul détour {direction} offre {offer_id}: start={start}, via={user_point}, end={end}")
+            with osrm_client.raise_rate_limited():
+                if direct_duration is not None:
+                    # Trajet direct précalculé : un seul appel OSRM (via le passager)
+                    detour = calculate_detour_time_osrm_fast(start, user_point, end, float(direct_duration) / 60)
+                else:
+                    detour = calculate_detour_time_osrm(start, user_point, end)
+            
+            if detour is not None and detour <= remaining:
+                logger.info(f"✅ Offre {offer_id} compatible ({direction}): détour {detour:.1f} min ≤ buffer restant {remaining:.1f} min")
+                return direction, detour
+            logger.info(f"❌ {direction} non compatible: détour={detour}, buffer restant={remaining:.1f}")
+        except osrm_client.RateLimited as e:
+            rate_limited = e
+        except Exception as e:
+            logger.warning(f"⚠️ Erreur calcul détour {direction} pour offre {offer_id}: {e}")
+    if rate_limited is not None:
+        raise rate_limited
+    return None, None
+
+
+def load_recurrent_reservation_stats(cur, offer_ids):
+    """
+    Charge en UNE requête les réservations confirmées/pending de plusieurs offres
+    récurrentes et les agrège par offre (évite 3 requêtes par offre en recherche).
+    
+    Returns:
+        Dict offer_id → {
+            'consumed_outbound': détour aller consommé (min),
+            'consumed_return': détour retour consommé (min),
+            'day_counts': {day: nb passagers},
+            'pickup_points': [{'coords': (lon, lat), 'address': str}] (confirmés uniquement)
+        }
+    """
+    day_columns = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+    stats = {
+        offer_id: {
+            'consumed_outbound': 0.0,
+            'consumed_return': 0.0,
+            'day_counts': {day: 0 for day in day_columns},
+            'pickup_points': []
+        }
+        for offer_id in offer_ids
+    }
+    if not offer_ids:
+        return stats
+    
+    placeholders = ','.join(['%s'] * len(offer_ids))
+    cur.execute(f"""
+        SELECT offer_id, status, detour_time_outbound, detour_time_return,
+               monday, tuesday, wednesday, thursday, friday, saturday, sunday,
+               meeting_point_coords, meeting_point_address
+        FROM carpool_reservations_recurrent
+        WHERE offer_id IN ({placeholders}) AND status IN ('confirmed', 'pending')
+    """, tuple(offer_ids))
+    
+    for res in cur.fetchall():
+        offer_stats = stats.get(res['offer_id'])
+        if offer_stats is None:
+            continue
+        
+        # Les pending "réservent" temporairement le budget et les places
+        offer_stats['consumed_outbound'] += float(res['detour_time_outbound'] or 0)
+        offer_stats['consumed_return'] += float(res['detour_time_return'] or 0)
+        for day in day_columns:
+            offer_stats['day_counts'][day] += int(res[day] or 0)
+        
+        # Seuls les pickups confirmés servent de points de rencontre
+        if res['status'] == 'confirmed' and res['meeting_point_coords']:
+            try:
+                coords = json.loads(res['meeting_point_coords'])
+                if isinstance(coords, (list, tuple)) and len(coords) == 2:
+                    offer_stats['pickup_points'].append({'coords': tuple(coords), 'address': res['meeting_point_address']})
+            except Exception:
+                continue
+    
+    return stats
+
+
 @app.route('/api/v2/offers/recurrent/search', methods=['POST'])
 @limiter.limit("60 per minute")
 def search_recurrent_offers():
@@ -2979,6 +3007,8 @@ def search_recurrent_offers():
         return jsonify({'error': 'API v2 non disponible'}), 503
     
     try:
+        # Échéance globale de la recherche (les détours non résolus reviennent "pending")
+        search_deadline = time.monotonic() + SEARCH_DEADLINE_SECONDS
         data = request.get_json()
 
         # Paramètres requis
@@ -3036,7 +3066,8 @@ def search_recurrent_offers():
                         monday, tuesday, wednesday, thursday, friday, saturday, sunday,
                         seats, max_detour_time,
                         route_outbound, route_return,
-                        created_at, status
+                        created_at, status,
+                        direct_duration_outbound, direct_duration_return
                     FROM carpool_offers_recurrent
                     WHERE site_id = %s 
                     AND status = 'active'
@@ -3046,6 +3077,10 @@ def search_recurrent_offers():
                 
                 cur.execute(query, (site_id,))
                 rows = cur.fetchall()
+                
+                # Détours consommés, places par jour et pickups : une seule requête pour toutes les offres
+                offer_ids = [row['id'] if isinstance(row, dict) else row[0] for row in rows]
+                reservation_stats = load_recurrent_reservation_stats(cur, offer_ids)
         except Exception as sql_error:
             logger.error(f"SQL error in recurrent search (site_id={site_id}): {sql_error}")
             return jsonify({'offers': [], 'count': 0}), 200
@@ -3055,15 +3090,19 @@ def search_recurrent_offers():
                    'departure', 'destination', 'departure_coords', 'destination_coords',
                    'recurrent_time', 'time_return',
                    'monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday',
-                   'seats', 'max_detour_time', 'route_outbound', 'route_return', 'created_at', 'status']
+                   'seats', 'max_detour_time', 'route_outbound', 'route_return', 'created_at', 'status',
+                   'direct_duration_outbound', 'direct_duration_return']
         
         # Point de recherche de l'utilisateur
         user_point = departure_coords  # [lon, lat]
         
-        offers = []
+        # Compteurs de la recherche : offres écartées sans OSRM vs routées
+        search_stats = {'candidates': len(rows), 'meeting_point': 0, 'pruned': 0, 'routed': 0, 'pending': 0}
+        
+        candidates = []
         for row in rows:
-            # Créer un dict depuis le tuple
-            row_dict = dict(zip(columns, row))
+            # Créer un dict depuis le tuple (ou réutiliser la ligne si curseur dictionnaire)
+            row_dict = dict(row) if isinstance(row, dict) else dict(zip(columns, row))
             
             # Parser les coordonnées et routes
             dep_coords = json.loads(row_dict['departure_coords']) if row_dict['departure_coords'] else None
@@ -3125,18 +3164,11 @@ def search_recurrent_offers():
             # Calculer le buffer de détour restant
             max_detour_time = row_dict['max_detour_time'] or 25  # 25 min par défaut (budget total)
             
-            # Récupérer le détour déjà consommé par les passagers confirmés ET pending
+            # Détour déjà consommé par les passagers confirmés ET pending
             # Les pending "réservent" temporairement le budget
-            with sql.db_cursor() as cur_inner:
-                cur_inner.execute("""
-                    SELECT COALESCE(SUM(detour_time_outbound), 0) as total_detour_out,
-                           COALESCE(SUM(detour_time_return), 0) as total_detour_ret
-                    FROM carpool_reservations_recurrent
-                    WHERE offer_id = %s AND status IN ('confirmed', 'pending')
-                """, (row_dict['id'],))
-                detour_consumed = cur_inner.fetchone()
-                consumed_outbound = float(detour_consumed['total_detour_out'] or 0)
-                consumed_return = float(detour_consumed['total_detour_ret'] or 0)
+            offer_stats = reservation_stats[row_dict['id']]
+            consumed_outbound = offer_stats['consumed_outbound']
+            consumed_return = offer_stats['consumed_return']
             
             # Calculer le budget restant
             remaining_buffer_outbound = max_detour_time - consumed_outbound
@@ -3146,22 +3178,9 @@ def search_recurrent_offers():
                        f"Consommé aller={consumed_outbound:.1f}min, retour={consumed_return:.1f}min | "
                        f"Restant aller={remaining_buffer_outbound:.1f}min, retour={remaining_buffer_return:.1f}min")
             
-            # Calculer le nombre maximum de passagers sur tous les jours de la semaine
+            # Nombre maximum de passagers sur tous les jours de la semaine
             # pour décrémenter les places disponibles
-            with sql.db_cursor() as cur_inner2:
-                cur_inner2.execute("""
-                    SELECT 
-                        SUM(monday) as mon, SUM(tuesday) as tue, SUM(wednesday) as wed,
-                        SUM(thursday) as thu, SUM(friday) as fri, SUM(saturday) as sat, SUM(sunday) as sun
-                    FROM carpool_reservations_recurrent
-                    WHERE offer_id = %s AND status IN ('confirmed', 'pending')
-                """, (row_dict['id'],))
-                day_counts = cur_inner2.fetchone()
-                max_passengers_per_day = max(
-                    int(day_counts[0] or 0), int(day_counts[1] or 0), int(day_counts[2] or 0),
-                    int(day_counts[3] or 0), int(day_counts[4] or 0), int(day_counts[5] or 0),
-                    int(day_counts[6] or 0)
-                )
+            max_passengers_per_day = max(offer_stats['day_counts'].values())
             
             # Calculer les places disponibles après réservations
             available_seats = max(0, row_dict['seats'] - max_passengers_per_day)
@@ -3174,28 +3193,8 @@ def search_recurrent_offers():
             recommended_meeting_point = None
             search_radius_m = 2000.0  # 2km pour considérer qu'on peut rejoindre un point existant
             
-            # Récupérer les pickups confirmés pour cette offre
-            pickup_points = []
-            try:
-                with sql.db_cursor() as cur_inner2:
-                    cur_inner2.execute(
-                        """
-                        SELECT meeting_point_coords, meeting_point_address
-                        FROM carpool_reservations_recurrent
-                        WHERE offer_id = %s AND status = 'confirmed'
-                        """,
-                        (row_dict['id'],)
-                    )
-                    for (mp_coords, mp_address) in cur_inner2.fetchall():
-                        if mp_coords:
-                            try:
-                                coords = json.loads(mp_coords)
-                                if isinstance(coords, (list, tuple)) and len(coords) == 2:
-                                    pickup_points.append({'coords': tuple(coords), 'address': mp_address})
-                            except Exception:
-                                continue
-            except Exception as e:
-                logger.warning(f"⚠️ Erreur récupération pickups pour offre {row_dict['id']}: {e}")
+            # Pickups confirmés pour cette offre
+            pickup_points = offer_stats['pickup_points']
 
             # Vérifier départ conducteur dans le rayon
             if dep_coords:
@@ -3228,10 +3227,10 @@ def search_recurrent_offers():
                     pass
 
             # Si un point de rencontre existe → compatible sans détour
+            evaluation = None
             if recommended_meeting_point:
-                is_compatible = True
+                search_stats['meeting_point'] += 1
                 compatible_direction = 'outbound' if recommended_meeting_point['address'] != row_dict['destination'] else 'return'
-                detour_time = 0.0
                 logger.info(f"✅ Offre {row_dict['id']} compatible via point existant (détour=0)")
             else:
                 # 2) SINON : calculer le détour pour un nouveau pickup
@@ -3240,58 +3239,98 @@ def search_recurrent_offers():
                     logger.info(f"❌ Offre {row_dict['id']} ignorée: budget de détour épuisé")
                     continue
                 
-                is_compatible = False
                 compatible_direction = None
-                detour_time = None
                 
-                # Vérifier l'aller (domicile → bureau) avec le buffer RESTANT
-                if remaining_buffer_outbound >= 0 and dep_coords and dest_coords:
-                    try:
-                        start = tuple(dep_coords)  # Départ conducteur
-                        end = tuple(dest_coords)   # Arrivée (bureau)
-                        
-                        # Calculer le temps de détour via OSRM
-                        logger.info(f"🔍 Calcul détour aller offre {row_dict['id']}: start={start}, via={user_tuple}, end={end}")
-                        detour = calculate_detour_time_osrm(start, user_tuple, end)
-                        
-                        logger.info(f"📊 Résultat détour aller: {detour} min (buffer restant: {remaining_buffer_outbound:.1f} min)")
-                        
-                        if detour is not None and detour <= remaining_buffer_outbound:
-                            is_compatible = True
-                            compatible_direction = 'outbound'
-                            detour_time = detour
-                            logger.info(f"✅ Offre {row_dict['id']} compatible (aller): détour {detour:.1f} min ≤ buffer restant {remaining_buffer_outbound:.1f} min")
-                        else:
-                            logger.info(f"❌ Aller non compatible: détour={detour}, buffer restant={remaining_buffer_outbound:.1f}")
-                    except Exception as e:
-                        logger.warning(f"⚠️ Erreur calcul détour aller pour offre {row_dict['id']}: {e}")
+                # Borne inférieure à vol d'oiseau : écarter sans appel OSRM les sens
+                # où même à vitesse maximale le détour dépasserait le budget
+                check_outbound = remaining_buffer_outbound >= 0 and dep_coords and dest_coords
+                check_return = remaining_buffer_return >= 0 and dep_coords and dest_coords
+                if check_outbound:
+                    direct_out = row_dict.get('direct_duration_outbound')
+                    min_detour_out = detour_lower_bound(
+                        tuple(dep_coords), user_tuple, tuple(dest_coords),
+                        float(direct_out) / 60 if direct_out is not None else None
+                    )
+                    if min_detour_out > remaining_buffer_outbound:
+                        logger.info(f"✂️ Offre {row_dict['id']} aller écartée sans OSRM: détour ≥ {min_detour_out:.1f} min")
+                        check_outbound = False
+                if check_return:
+                    direct_ret = row_dict.get('direct_duration_return')
+                    min_detour_ret = detour_lower_bound(
+                        tuple(dest_coords), user_tuple, tuple(dep_coords),
+                        float(direct_ret) / 60 if direct_ret is not None else None
+                    )
+                    if min_detour_ret > remaining_buffer_return:
+                        logger.info(f"✂️ Offre {row_dict['id']} retour écartée sans OSRM: détour ≥ {min_detour_ret:.1f} min")
+                        check_return = False
+                
+                if not (check_outbound or check_return):
+                    search_stats['pruned'] += 1
+                    logger.info(f"❌ Offre {row_dict['id']} ignorée: point utilisateur hors zone de détour")
+                    continue
+                
+                # Les appels OSRM des offres candidates tournent en parallèle (voir plus bas)
+                search_stats['routed'] += 1
+                evaluation = _search_executor.submit(
+                    metrics.bind(evaluate_recurrent_detour),
+                    row_dict['id'], tuple(dep_coords), tuple(dest_coords), user_tuple,
+                    row_dict.get('direct_duration_outbound'), row_dict.get('direct_duration_return'),
+                    remaining_buffer_outbound if check_outbound else None,
+                    remaining_buffer_return if check_return else None
+                )
             
-                # Vérifier le retour (bureau → domicile) si pas déjà compatible, avec le buffer RESTANT
-                if not is_compatible and remaining_buffer_return >= 0 and dep_coords and dest_coords:
+            candidates.append({
+                'row': row_dict,
+                'dep_coords': dep_coords,
+                'dest_coords': dest_coords,
+                'route_outbound': route_outbound,
+                'route_return': route_return,
+                'available_seats': available_seats,
+                'remaining_outbound': remaining_buffer_outbound,
+                'remaining_return': remaining_buffer_return,
+                'recommended_meeting_point': recommended_meeting_point,
+                'compatible_direction': compatible_direction,
+                'evaluation': evaluation
+            })
+        
+        # Attendre les détours OSRM jusqu'à l'échéance de la recherche :
+        # les offres non résolues à temps sont renvoyées "pending" au lieu de bloquer la réponse
+        evaluations = [c['evaluation'] for c in candidates if c['evaluation'] is not None]
+        if evaluations:
+            _, not_done = futures_wait(evaluations, timeout=max(0.0, search_deadline - time.monotonic()))
+            # Évaluations encore en file : annulées pour ne pas retarder les recherches suivantes
+            for evaluation in not_done:
+                evaluation.cancel()
+        
+        offers = []
+        for candidate in candidates:
+            row_dict = candidate['row']
+            evaluation = candidate['evaluation']
+            compatible_direction = candidate['compatible_direction']
+            detour_time = 0.0 if candidate['recommended_meeting_point'] else None
+            detour_status = 'resolved'
+            
+            if evaluation is not None:
+                if evaluation.done() and not evaluation.cancelled():
                     try:
-                        start = tuple(dest_coords)  # Départ bureau
-                        end = tuple(dep_coords)     # Arrivée domicile conducteur
-                        
-                        # Calculer le temps de détour via OSRM
-                        logger.info(f"🔍 Calcul détour retour offre {row_dict['id']}: start={start}, via={user_tuple}, end={end}")
-                        detour = calculate_detour_time_osrm(start, user_tuple, end)
-                        
-                        logger.info(f"📊 Résultat détour retour: {detour} min (buffer restant: {remaining_buffer_return:.1f} min)")
-                        
-                        if detour is not None and detour <= remaining_buffer_return:
-                            is_compatible = True
-                            compatible_direction = 'return'
-                            detour_time = detour
-                            logger.info(f"✅ Offre {row_dict['id']} compatible (retour): détour {detour:.1f} min ≤ buffer restant {remaining_buffer_return:.1f} min")
-                        else:
-                            logger.info(f"❌ Retour non compatible: détour={detour}, buffer restant={remaining_buffer_return:.1f}")
+                        compatible_direction, detour_time = evaluation.result()
+                    except osrm_client.RateLimited:
+                        # Débit OSRM dépassé : détour pas encore calculé, l'offre reste proposée
+                        detour_status = 'pending'
+                        search_stats['pending'] += 1
+                        logger.info(f"⏳ Offre {row_dict['id']}: détour non calculé (débit OSRM dépassé)")
                     except Exception as e:
-                        logger.warning(f"⚠️ Erreur calcul détour retour pour offre {row_dict['id']}: {e}")
-            
-            # Ne garder que les offres compatibles
-            if not is_compatible:
-                logger.info(f"❌ Offre {row_dict['id']} ignorée: point utilisateur hors zone de détour")
-                continue
+                        logger.warning(f"⚠️ Erreur calcul détour pour offre {row_dict['id']}: {e}")
+                        compatible_direction, detour_time = None, None
+                    if compatible_direction is None and detour_status != 'pending':
+                        logger.info(f"❌ Offre {row_dict['id']} ignorée: point utilisateur hors zone de détour")
+                        continue
+                else:
+                    # Calcul en cours (il se termine en arrière-plan et alimente le cache de routes)
+                    # ou annulé avant d'avoir commencé
+                    detour_status = 'pending'
+                    search_stats['pending'] += 1
+                    logger.info(f"⏳ Offre {row_dict['id']}: détour non résolu avant l'échéance ({SEARCH_DEADLINE_SECONDS}s)")
             
             # Construire la liste des jours actifs
             active_days = []
@@ -3304,7 +3343,7 @@ def search_recurrent_offers():
             masked_phone = row_dict['driver_phone'][:4] + '****' if row_dict['driver_phone'] else None
             
             # Calculer le budget restant pour affichage
-            remaining_detour = remaining_buffer_outbound if compatible_direction == 'outbound' else remaining_buffer_return
+            remaining_detour = candidate['remaining_return'] if compatible_direction == 'return' else candidate['remaining_outbound']
             
             offers.append({
                 'id': row_dict['id'],
@@ -3313,26 +3352,32 @@ def search_recurrent_offers():
                 'driver_phone_masked': masked_phone,
                 'departure': row_dict['departure'],
                 'destination': row_dict['destination'],
-                'departure_coords': dep_coords,
-                'destination_coords': dest_coords,
+                'departure_coords': candidate['dep_coords'],
+                'destination_coords': candidate['dest_coords'],
                 'recurrent_time': str(row_dict['recurrent_time']) if row_dict['recurrent_time'] else None,
                 'time_return': str(row_dict['time_return']) if row_dict.get('time_return') else None,
                 'days': active_days,
                 'seats': row_dict['seats'],
-                'seats_available': available_seats,  # Places après déduction du max de passagers sur tous les jours
+                'seats_available': candidate['available_seats'],  # Places après déduction du max de passagers sur tous les jours
                 'max_detour_time': row_dict['max_detour_time'],
                 'remaining_detour_time': round(remaining_detour, 1),
-                'route_outbound': route_outbound,
-                'route_return': route_return,
+                'route_outbound': candidate['route_outbound'],
+                'route_return': candidate['route_return'],
                 'created_at': row_dict['created_at'].strftime('%Y-%m-%d %H:%M:%S') if row_dict['created_at'] else None,
                 'compatible_direction': compatible_direction,
                 'detour_time_minutes': round(detour_time, 1) if detour_time is not None else None,
-                'recommended_meeting_point': recommended_meeting_point  # Point existant à rejoindre (ou None si nouveau pickup)
+                'detour_status': detour_status,  # 'pending' : détour pas encore calculé à l'échéance
+                'recommended_meeting_point': candidate['recommended_meeting_point']  # Point existant à rejoindre (ou None si nouveau pickup)
             })
         
+        logger.info(f"🔎 Recherche récurrente site {site_id}: {search_stats['candidates']} offre(s), "
+                    f"{search_stats['meeting_point']} via point existant, {search_stats['pruned']} écartée(s) sans OSRM, "
+                    f"{search_stats['routed']} routée(s) dont {search_stats['pending']} en attente")
+        
         return jsonify({
             'offers': offers,
-            'count': len(offers)
+            'count': len(offers),
+            'search_stats': search_stats
         }), 200
         
     except Exception as e:
@@ -3661,55 +3706,40 @@ def create_recurrent_reservation():
                 # Calculer les horaires avec détour (même si détour = 0)
                 if detour_outbound is not None and offer_data.get('recurrent_time'):
                     try:
-                        import requests
                         # Temps pickup → bureau
-                        osrm_url = f"https://router.project-osrm.org/route/v1/driving/{pickup_coords[0]},{pickup_coords[1]};{offer_data['destination_coords'][0]},{offer_data['destination_coords'][1]}?overview=false"
-                        response = requests.get(osrm_url, timeout=5)
-                        if response.status_code == 200:
-                            data = response.json()
-                            if data.get('routes'):
-                                time_pickup_to_office = data['routes'][0]['duration'] / 60
-                                arrival_office = datetime.combine(datetime.today(), offer_data['recurrent_time'])
-                                pickup_datetime = arrival_office - timedelta(minutes=time_pickup_to_office)
-                                pickup_time_outbound = pickup_datetime.time()
-                                logger.info(f"✅ Heure de prise en charge (aller): {pickup_time_outbound}")
-                            else:
-                                logger.error(f"❌ Pas de route retournée par OSRM pour pickup: {osrm_url}")
+                        duration_s = osrm_client.route_duration([pickup_coords, offer_data['destination_coords']])
+                        if duration_s is not None:
+                            time_pickup_to_office = duration_s / 60
+                            arrival_office = datetime.combine(datetime.today(), offer_data['recurrent_time'])
+                            pickup_datetime = arrival_office - timedelta(minutes=time_pickup_to_office)
+                            pickup_time_outbound = pickup_datetime.time()
+                            logger.info(f"✅ Heure de prise en charge (aller): {pickup_time_outbound}")
                         else:
-                            logger.error(f"❌ OSRM status {response.status_code} pour pickup")
+                            logger.error(f"❌ Pas de route retournée par OSRM pour pickup")
                     except Exception as e:
                         logger.error(f"❌ Erreur calcul heure pickup: {e}", exc_info=True)
                 
                 if detour_return is not None and offer_data.get('time_return'):
                     try:
-                        import requests
                         # Temps bureau → dropoff
-                        osrm_url1 = f"https://router.project-osrm.org/route/v1/driving/{offer_data['destination_coords'][0]},{offer_data['destination_coords'][1]};{pickup_coords[0]},{pickup_coords[1]}?overview=false"
+                        duration1_s = osrm_client.route_duration([offer_data['destination_coords'], pickup_coords])
                         # Temps dropoff → home
-                        osrm_url2 = f"https://router.project-osrm.org/route/v1/driving/{pickup_coords[0]},{pickup_coords[1]};{offer_data['departure_coords'][0]},{offer_data['departure_coords'][1]}?overview=false"
+                        duration2_s = osrm_client.route_duration([pickup_coords, offer_data['departure_coords']])
                         
-                        response1 = requests.get(osrm_url1, timeout=5)
-                        response2 = requests.get(osrm_url2, timeout=5)
-                        
-                        if response1.status_code == 200 and response2.status_code == 200:
-                            data1 = response1.json()
-                            data2 = response2.json()
-                            if data1.get('routes') and data2.get('routes'):
-                                time_office_to_dropoff = data1['routes'][0]['duration'] / 60
-                                time_dropoff_to_home = data2['routes'][0]['duration'] / 60
-                                
-                                departure_office = datetime.combine(datetime.today(), offer_data['time_return'])
-                                dropoff_datetime = departure_office + timedelta(minutes=time_office_to_dropoff)
-                                dropoff_time_return = dropoff_datetime.time()
-                                
-                                arrival_datetime = dropoff_datetime + timedelta(minutes=time_dropoff_to_home)
-                                arrival_home_time = arrival_datetime.time()
-                                
-                                logger.info(f"✅ Heure de dépôt (retour): {dropoff_time_return}, Arrivée: {arrival_home_time}")
-                            else:
-                                logger.error(f"❌ Pas de route retournée par OSRM pour dropoff")
+                        if duration1_s is not None and duration2_s is not None:
+                            time_office_to_dropoff = duration1_s / 60
+                            time_dropoff_to_home = duration2_s / 60
+                            
+                            departure_office = datetime.combine(datetime.today(), offer_data['time_return'])
+                            dropoff_datetime = departure_office + timedelta(minutes=time_office_to_dropoff)
+                            dropoff_time_return = dropoff_datetime.time()
+                            
+                            arrival_datetime = dropoff_datetime + timedelta(minutes=time_dropoff_to_home)
+                            arrival_home_time = arrival_datetime.time()
+                            
+                            logger.info(f"✅ Heure de dépôt (retour): {dropoff_time_return}, Arrivée: {arrival_home_time}")
                         else:
-                            logger.error(f"❌ OSRM status {response1.status_code}/{response2.status_code} pour dropoff")
+                            logger.error(f"❌ Pas de route retournée par OSRM pour dropoff")
                     except Exception as e:
                         logger.error(f"❌ Erreur calcul heure dropoff: {e}", exc_info=True)
             
@@ -3766,7 +3796,6 @@ def create_recurrent_reservation():
         try:
             from emails import send_email
             from email_request_by_day import generate_request_email_by_day
-            import requests
             
             # URL de base pour les actions
             base_url = request.host_url.rstrip('/')
@@ -3790,35 +3819,31 @@ def create_recurrent_reservation():
                     departure_coords = offer_data['departure_coords']
                     destination_coords = offer_data['destination_coords']
                     
-                    coord_str = f"{departure_coords[0]},{departure_coords[1]};{destination_coords[0]},{destination_coords[1]}"
-                    osrm_url = f"https://router.project-osrm.org/route/v1/driving/{coord_str}?overview=false"
-                    resp = requests.get(osrm_url, timeout=5)
-                    if resp.status_code == 200:
-                        data = resp.json()
-                        if data.get('routes'):
-                            direct_duration_min = data['routes'][0]['duration'] / 60
-                            
-                            # Nouvelle heure de départ = heure arrivée bureau - trajet direct - détours totaux
-                            arrival_time = offer_data['recurrent_time']
-                            if isinstance(arrival_time, timedelta):
-                                total_sec = int(arrival_time.total_seconds())
-                                arrival_time = datetime.min.time().replace(hour=total_sec//3600, minute=(total_sec%3600)//60)
-                            
-                            arrival_dt = datetime.combine(datetime.today(), arrival_time)
-                            new_departure_dt = arrival_dt - timedelta(minutes=direct_duration_min + total_detour_outbound)
-                            new_departure_time = new_departure_dt.time()
-                            
-                            # Nouvelle heure d'arrivée domicile = heure départ bureau + trajet direct + détours totaux
-                            departure_bureau_time = offer_data['time_return']
-                            if isinstance(departure_bureau_time, timedelta):
-                                total_sec = int(departure_bureau_time.total_seconds())
-                                departure_bureau_time = datetime.min.time().replace(hour=total_sec//3600, minute=(total_sec%3600)//60)
-                            
-                            departure_bureau_dt = datetime.combine(datetime.today(), departure_bureau_time)
-                            new_arrival_home_dt = departure_bureau_dt + timedelta(minutes=direct_duration_min + total_detour_return)
-                            new_arrival_home_time = new_arrival_home_dt.time()
-                            
-                            logger.info(f"🕐 Heures finales calculées: Départ {new_departure_time}, Arrivée domicile {new_arrival_home_time} (détour total aller: {total_detour_outbound:.1f}min, retour: {total_detour_return:.1f}min)")
+                    duration_s = osrm_client.route_duration([departure_coords, destination_coords])
+                    if duration_s is not None:
+                        direct_duration_min = duration_s / 60
+                        
+                        # Nouvelle heure de départ = heure arrivée bureau - trajet direct - détours totaux
+                        arrival_time = offer_data['recurrent_time']
+                        if isinstance(arrival_time, timedelta):
+                            total_sec = int(arrival_time.total_seconds())
+                            arrival_time = datetime.min.time().replace(hour=total_sec//3600, minute=(total_sec%3600)//60)
+                        
+                        arrival_dt = datetime.combine(datetime.today(), arrival_time)
+                        new_departure_dt = arrival_dt - timedelta(minutes=direct_duration_min + total_detour_outbound)
+                        new_departure_time = new_departure_dt.time()
+                        
+                        # Nouvelle heure d'arrivée domicile = heure départ bureau + trajet direct + détours totaux
+                        departure_bureau_time = offer_data['time_return']
+                        if isinstance(departure_bureau_time, timedelta):
+                            total_sec = int(departure_bureau_time.total_seconds())
+                            departure_bureau_time = datetime.min.time().replace(hour=total_sec//3600, minute=(total_sec%3600)//60)
+                        
+                        departure_bureau_dt = datetime.combine(datetime.today(), departure_bureau_time)
+                        new_arrival_home_dt = departure_bureau_dt + timedelta(minutes=direct_duration_min + total_detour_return)
+                        new_arrival_home_time = new_arrival_home_dt.time()
+                        
+                        logger.info(f"🕐 Heures finales calculées: Départ {new_departure_time}, Arrivée domicile {new_arrival_home_time} (détour total aller: {total_detour_outbound:.1f}min, retour: {total_detour_return:.1f}min)")
                 except Exception as e:
                     logger.warning(f"Erreur calcul nouvelles heures: {e}")
             
@@ -4050,16 +4075,16 @@ def accept_recurrent_reservation(reservation_id):
             # RECALCULER L'ITINÉRAIRE COMPLET avec TOUS les passagers confirmés (incluant celui-ci)
             import json
             from datetime import datetime, timedelta
-            import requests
             
             # Récupérer TOUS les passagers confirmés (incluant celui qu'on vient d'accepter)
             # IMPORTANT : Trier par pickup_time_outbound pour ordre chronologique correct
             cur.execute("""
-                SELECT id, meeting_point_coords, meeting_point_address, passenger_name, pickup_time_outbound
+                SELECT id, meeting_point_coords, meeting_point_address, passenger_name, pickup_time_outbound,
+                       detour_time_outbound, detour_time_return
                 FROM carpool_reservations_recurrent
                 WHERE offer_id = %s AND status = 'confirmed'
                 ORDER BY pickup_time_outbound ASC, id ASC
-            """, (reservation[1],))
+            """, (reservation['offer_id'],))
             
             all_confirmed_passengers = cur.fetchall()
             
@@ -4069,17 +4094,17 @@ def accept_recurrent_reservation(reservation_id):
                     UPDATE carpool_reservations_recurrent
                     SET pickup_order = %s
                     WHERE id = %s
-                """, (index + 1, passenger[0]))  # passenger[0] = id
+                """, (index + 1, passenger['id']))
             
             logger.info(f"📋 {len(all_confirmed_passengers)} passager(s) triés par ordre chronologique")
             
             # Coordonnées de départ et destination
-            departure_coords = json.loads(offer[6]) if offer[6] else None
-            destination_coords = json.loads(offer[7]) if offer[7] else None
+            departure_coords = json.loads(offer['departure_coords']) if offer['departure_coords'] else None
+            destination_coords = json.loads(offer['destination_coords']) if offer['destination_coords'] else None
             
             # Horaires de base (SANS détour)
-            base_recurrent_time = offer[8]   # Heure d'arrivée au bureau (recurrent_time)
-            base_time_return = offer[9]      # Heure de départ du bureau (time_return)
+            base_recurrent_time = offer['recurrent_time']   # Heure d'arrivée au bureau (recurrent_time)
+            base_time_return = offer['time_return']      # Heure de départ du bureau (time_return)
             
             # Convertir en time si nécessaire (peut être timedelta, str ou déjà time)
             def ensure_time(value):
@@ -4105,13 +4130,10 @@ def accept_recurrent_reservation(reservation_id):
             
             if departure_coords and destination_coords:
                 try:
-                    osrm_url = f"https://router.project-osrm.org/route/v1/driving/{departure_coords[0]},{departure_coords[1]};{destination_coords[0]},{destination_coords[1]}?overview=false"
-                    response = requests.get(osrm_url, timeout=5)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('routes'):
-                            base_duration_outbound = data['routes'][0]['duration'] / 60  # minutes
-                            base_duration_return = base_duration_outbound  # même durée
+                    duration_s = osrm_client.route_duration([departure_coords, destination_coords])
+                    if duration_s is not None:
+                        base_duration_outbound = duration_s / 60  # minutes
+                        base_duration_return = base_duration_outbound  # même durée
                 except Exception as e:
                     logger.warning(f"Erreur calcul trajet de base: {e}")
             
@@ -4126,9 +4148,9 @@ def accept_recurrent_reservation(reservation_id):
             # Collecter toutes les coordonnées des passagers
             passenger_waypoints = []
             for passenger in all_confirmed_passengers:
-                passenger_coords = json.loads(passenger[1]) if passenger[1] else None
-                passenger_address = passenger[2]
-                passenger_name = passenger[3]
+                passenger_coords = json.loads(passenger['meeting_point_coords']) if passenger['meeting_point_coords'] else None
+                passenger_address = passenger['meeting_point_address']
+                passenger_name = passenger['passenger_name']
                 
                 if passenger_coords:
                     passenger_waypoints.append({
@@ -4143,46 +4165,50 @@ def accept_recurrent_reservation(reservation_id):
             
             if passenger_waypoints and departure_coords and destination_coords:
                 try:
-                    # Construire l'URL OSRM avec tous les waypoints : domicile → pickup1 → pickup2 → ... → bureau
-                    waypoint_coords = ';'.join([f"{wp['coords'][0]},{wp['coords'][1]}" for wp in passenger_waypoints])
-                    osrm_url_aller = f"https://router.project-osrm.org/route/v1/driving/{departure_coords[0]},{departure_coords[1]};{waypoint_coords};{destination_coords[0]},{destination_coords[1]}?overview=full&geometries=geojson"
-                    
-                    response = requests.get(osrm_url_aller, timeout=10)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('routes'):
-                            route_data = data['routes'][0]
-                            duration_with_all = route_data['duration'] / 60
-                            total_detour_outbound = duration_with_all - base_duration_outbound
-                            route_outbound['duration'] = duration_with_all * 60
-                            # Stocker la géométrie complète
-                            route_outbound['geometry'] = route_data.get('geometry', {}).get('coordinates', [])
-                            logger.info(f"📍 Trajet ALLER avec {len(passenger_waypoints)} passager(s): {duration_with_all:.1f}min (détour: +{total_detour_outbound:.1f}min)")
+                    # Itinéraire OSRM avec tous les waypoints : domicile → pickup1 → pickup2 → ... → bureau
+                    waypoint_coords = [wp['coords'] for wp in passenger_waypoints]
+                    data = osrm_client.route(
+                        [departure_coords] + waypoint_coords + [destination_coords],
+                        overview='full', geometries='geojson', timeout=10
+                    )
+                    if data:
+                        route_data = data['routes'][0]
+                        duration_with_all = route_data['duration'] / 60
+                        total_detour_outbound = duration_with_all - base_duration_outbound
+                        route_outbound['duration'] = duration_with_all * 60
+                        # Stocker la géométrie complète
+                        route_outbound['geometry'] = route_data.get('geometry', {}).get('coordinates', [])
+                        logger.info(f"📍 Trajet ALLER avec {len(passenger_waypoints)} passager(s): {duration_with_all:.1f}min (détour: +{total_detour_outbound:.1f}min)")
+                    else:
+                        # Fallback : utiliser la somme des détours individuels
+                        logger.warning("Trajet aller complet indisponible, somme des détours individuels")
+                        total_detour_outbound = sum(p['detour_time_outbound'] or 0 for p in all_confirmed_passengers)
                 except Exception as e:
                     logger.warning(f"Erreur calcul trajet aller complet: {e}")
-                    # Fallback : utiliser la somme des détours individuels
-                    total_detour_outbound = sum([wp.get('detour', 0) for wp in passenger_waypoints])
+                    total_detour_outbound = sum(p['detour_time_outbound'] or 0 for p in all_confirmed_passengers)
                 
                 try:
-                    # Construire l'URL OSRM pour le RETOUR : bureau → dropoff1 → dropoff2 → ... → domicile
-                    waypoint_coords = ';'.join([f"{wp['coords'][0]},{wp['coords'][1]}" for wp in passenger_waypoints])
-                    osrm_url_retour = f"https://router.project-osrm.org/route/v1/driving/{destination_coords[0]},{destination_coords[1]};{waypoint_coords};{departure_coords[0]},{departure_coords[1]}?overview=full&geometries=geojson"
-                    
-                    response = requests.get(osrm_url_retour, timeout=10)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('routes'):
-                            route_data = data['routes'][0]
-                            duration_with_all = route_data['duration'] / 60
-                            total_detour_return = duration_with_all - base_duration_return
-                            route_return['duration'] = duration_with_all * 60
-                            # Stocker la géométrie complète
-                            route_return['geometry'] = route_data.get('geometry', {}).get('coordinates', [])
-                            logger.info(f"📍 Trajet RETOUR avec {len(passenger_waypoints)} passager(s): {duration_with_all:.1f}min (détour: +{total_detour_return:.1f}min)")
+                    # Itinéraire OSRM pour le RETOUR : bureau → dropoff1 → dropoff2 → ... → domicile
+                    waypoint_coords = [wp['coords'] for wp in passenger_waypoints]
+                    data = osrm_client.route(
+                        [destination_coords] + waypoint_coords + [departure_coords],
+                        overview='full', geometries='geojson', timeout=10
+                    )
+                    if data:
+                        route_data = data['routes'][0]
+                        duration_with_all = route_data['duration'] / 60
+                        total_detour_return = duration_with_all - base_duration_return
+                        route_return['duration'] = duration_with_all * 60
+                        # Stocker la géométrie complète
+                        route_return['geometry'] = route_data.get('geometry', {}).get('coordinates', [])
+                        logger.info(f"📍 Trajet RETOUR avec {len(passenger_waypoints)} passager(s): {duration_with_all:.1f}min (détour: +{total_detour_return:.1f}min)")
+                    else:
+                        # Fallback : utiliser la somme des détours individuels
+                        logger.warning("Trajet retour complet indisponible, somme des détours individuels")
+                        total_detour_return = sum(p['detour_time_return'] or 0 for p in all_confirmed_passengers)
                 except Exception as e:
                     logger.warning(f"Erreur calcul trajet retour complet: {e}")
-                    # Fallback : utiliser la somme des détours individuels
-                    total_detour_return = sum([wp.get('detour', 0) for wp in passenger_waypoints])
+                    total_detour_return = sum(p['detour_time_return'] or 0 for p in all_confirmed_passengers)
             
             # Ajouter les waypoints à la route
             for wp in passenger_waypoints:
@@ -4209,10 +4235,10 @@ def accept_recurrent_reservation(reservation_id):
             """, (
                 json.dumps(route_outbound),
                 json.dumps(route_return),
-                reservation[1]  # offer_id
+                reservation['offer_id']
             ))
             
-            logger.info(f"🔄 Offre {reservation[1]} mise à jour avec {len(all_confirmed_passengers)} passager(s) - Détour total aller: {total_detour_outbound:.1f}min, retour: {total_detour_return:.1f}min")
+            logger.info(f"🔄 Offre {reservation['offer_id']} mise à jour avec {len(all_confirmed_passengers)} passager(s) - Détour total aller: {total_detour_outbound:.1f}min, retour: {total_detour_return:.1f}min")
             
             # Envoyer email de confirmation au passager
             try:
@@ -4225,12 +4251,12 @@ def accept_recurrent_reservation(reservation_id):
                     <div style="font-size: 64px; margin-bottom: 20px;">✅</div>
                     <h1 style="color: #22c55e; margin-bottom: 20px;">Demande acceptée !</h1>
                     <p style="font-size: 16px; color: #475569;">
-                        Bonne nouvelle ! Votre demande de covoiturage a été acceptée par {offer[1]}.
+                        Bonne nouvelle ! Votre demande de covoiturage a été acceptée par {offer['driver_name']}.
                     </p>
                 </div>
                 """
                 
-                send_email(reservation[3], subject, html_body, "✅ Votre demande de covoiturage a été acceptée !")
+                send_email(reservation['passenger_email'], subject, html_body, "✅ Votre demande de covoiturage a été acceptée !")
                 
             except Exception as e:
                 logger.error(f"⚠️ Erreur envoi email confirmation passager: {e}")
@@ -4240,7 +4266,6 @@ def accept_recurrent_reservation(reservation_id):
                 from emails import send_email
                 import json
                 from datetime import datetime, timedelta
-                import requests
                 
                 # Récupérer TOUTES les réservations confirmées pour cette offre
                 cur.execute("""
@@ -4251,37 +4276,37 @@ def accept_recurrent_reservation(reservation_id):
                            confirmation_token
                     FROM carpool_reservations_recurrent
                     WHERE offer_id = %s AND status = 'confirmed'
-                """, (reservation[1],))
+                """, (reservation['offer_id'],))
                 
                 confirmed_reservations = cur.fetchall()
                 
                 # Préparer les données de l'offre MISE À JOUR
                 offer_data = {
-                    'driver_name': offer[1],
-                    'driver_email': offer[2],
-                    'departure': offer[4],
-                    'destination': offer[5],
-                    'departure_coords': json.loads(offer[6]) if offer[6] else None,
-                    'destination_coords': json.loads(offer[7]) if offer[7] else None,
+                    'driver_name': offer['driver_name'],
+                    'driver_email': offer['driver_email'],
+                    'departure': offer['departure'],
+                    'destination': offer['destination'],
+                    'departure_coords': json.loads(offer['departure_coords']) if offer['departure_coords'] else None,
+                    'destination_coords': json.loads(offer['destination_coords']) if offer['destination_coords'] else None,
                     'departure_time': new_departure_from_home,  # Départ plus tôt de chez soi
                     'arrival_time': base_recurrent_time,  # Arrivée au bureau (heure cible, reste fixe)
                     'return_departure_time': base_time_return,  # Départ du bureau (heure fixe)
                     'return_arrival_time': new_arrival_at_home,  # Arrivée chez soi (plus tard à cause du détour)
-                    'color_outbound': offer[13] or '#7c3aed',
-                    'color_return': offer[14] or '#f97316',
-                    'monday': offer[15],
-                    'tuesday': offer[16],
-                    'wednesday': offer[17],
-                    'thursday': offer[18],
-                    'friday': offer[19],
-                    'saturday': offer[20],
-                    'sunday': offer[21]
+                    'color_outbound': offer['color_outbound'] or '#7c3aed',
+                    'color_return': offer['color_return'] or '#f97316',
+                    'monday': offer['monday'],
+                    'tuesday': offer['tuesday'],
+                    'wednesday': offer['wednesday'],
+                    'thursday': offer['thursday'],
+                    'friday': offer['friday'],
+                    'saturday': offer['saturday'],
+                    'sunday': offer['sunday']
                 }
                 
                 # Préparer la liste des passagers pour le récap
                 reservations_list = []
                 for res in confirmed_reservations:
-                    passenger_coords = json.loads(res[5]) if res[5] else None
+                    passenger_coords = json.loads(res['meeting_point_coords']) if res['meeting_point_coords'] else None
                     
                     # Calculer heures de pickup/dropoff
                     pickup_time_outbound = None
@@ -4293,25 +4318,19 @@ def accept_recurrent_reservation(reservation_id):
                         try:
                             # ALLER : Calculer EN ARRIÈRE depuis l'arrivée au bureau (comme dans le mail de demande)
                             # Temps pickup → bureau
-                            osrm_url = f"https://router.project-osrm.org/route/v1/driving/{passenger_coords[0]},{passenger_coords[1]};{offer_data['destination_coords'][0]},{offer_data['destination_coords'][1]}?overview=false"
-                            response = requests.get(osrm_url, timeout=5)
-                            if response.status_code == 200:
-                                data = response.json()
-                                if data.get('routes'):
-                                    time_pickup_to_office = data['routes'][0]['duration'] / 60
-                                    arrival_office = datetime.combine(datetime.today(), offer_data['arrival_time'])  # Heure d'arrivée cible
-                                    pickup_datetime = arrival_office - timedelta(minutes=time_pickup_to_office)
-                                    pickup_time_outbound = pickup_datetime.time()
-                                    
-                                    # Calculer domicile → pickup pour obtenir l'heure de départ réelle
-                                    osrm_home_pickup = f"https://router.project-osrm.org/route/v1/driving/{offer_data['departure_coords'][0]},{offer_data['departure_coords'][1]};{passenger_coords[0]},{passenger_coords[1]}?overview=false"
-                                    resp_hp = requests.get(osrm_home_pickup, timeout=5)
-                                    if resp_hp.status_code == 200:
-                                        data_hp = resp_hp.json()
-                                        if data_hp.get('routes'):
-                                            home_to_pickup = data_hp['routes'][0]['duration'] / 60
-                                            computed_departure_dt = pickup_datetime - timedelta(minutes=home_to_pickup)
-                                            computed_departure_time = computed_departure_dt.time()
+                            duration_s = osrm_client.route_duration([passenger_coords, offer_data['destination_coords']])
+                            if duration_s is not None:
+                                time_pickup_to_office = duration_s / 60
+                                arrival_office = datetime.combine(datetime.today(), offer_data['arrival_time'])  # Heure d'arrivée cible
+                                pickup_datetime = arrival_office - timedelta(minutes=time_pickup_to_office)
+                                pickup_time_outbound = pickup_datetime.time()
+                                
+                                # Calculer domicile → pickup pour obtenir l'heure de départ réelle
+                                duration_hp_s = osrm_client.route_duration([offer_data['departure_coords'], passenger_coords])
+                                if duration_hp_s is not None:
+                                    home_to_pickup = duration_hp_s / 60
+                                    computed_departure_dt = pickup_datetime - timedelta(minutes=home_to_pickup)
+                                    computed_departure_time = computed_departure_dt.time()
                         except Exception as e:
                             logger.warning(f"Erreur calcul pickup time: {e}")
                     
@@ -4319,46 +4338,40 @@ def accept_recurrent_reservation(reservation_id):
                         try:
                             # RETOUR : Calculer EN AVANT depuis le départ du bureau (comme dans le mail de demande)
                             # Temps bureau → dropoff
-                            osrm_url1 = f"https://router.project-osrm.org/route/v1/driving/{offer_data['destination_coords'][0]},{offer_data['destination_coords'][1]};{passenger_coords[0]},{passenger_coords[1]}?overview=false"
-                            response = requests.get(osrm_url1, timeout=5)
-                            if response.status_code == 200:
-                                data = response.json()
-                                if data.get('routes'):
-                                    time_office_to_dropoff = data['routes'][0]['duration'] / 60
-                                    departure_office = datetime.combine(datetime.today(), offer_data['return_departure_time'])
-                                    dropoff_datetime = departure_office + timedelta(minutes=time_office_to_dropoff)
-                                    dropoff_time_return = dropoff_datetime.time()
-                                    
-                                    # Calculer dropoff → domicile pour obtenir l'heure d'arrivée réelle
-                                    osrm_drop_home = f"https://router.project-osrm.org/route/v1/driving/{passenger_coords[0]},{passenger_coords[1]};{offer_data['departure_coords'][0]},{offer_data['departure_coords'][1]}?overview=false"
-                                    resp_dh = requests.get(osrm_drop_home, timeout=5)
-                                    if resp_dh.status_code == 200:
-                                        data_dh = resp_dh.json()
-                                        if data_dh.get('routes'):
-                                            drop_to_home = data_dh['routes'][0]['duration'] / 60
-                                            arrival_home_dt = dropoff_datetime + timedelta(minutes=drop_to_home)
-                                            computed_arrival_home_time = arrival_home_dt.time()
+                            duration_s = osrm_client.route_duration([offer_data['destination_coords'], passenger_coords])
+                            if duration_s is not None:
+                                time_office_to_dropoff = duration_s / 60
+                                departure_office = datetime.combine(datetime.today(), offer_data['return_departure_time'])
+                                dropoff_datetime = departure_office + timedelta(minutes=time_office_to_dropoff)
+                                dropoff_time_return = dropoff_datetime.time()
+                                
+                                # Calculer dropoff → domicile pour obtenir l'heure d'arrivée réelle
+                                duration_dh_s = osrm_client.route_duration([passenger_coords, offer_data['departure_coords']])
+                                if duration_dh_s is not None:
+                                    drop_to_home = duration_dh_s / 60
+                                    arrival_home_dt = dropoff_datetime + timedelta(minutes=drop_to_home)
+                                    computed_arrival_home_time = arrival_home_dt.time()
                         except Exception as e:
                             logger.warning(f"Erreur calcul dropoff time: {e}")
                     
                     reservations_list.append({
-                        'id': res[0],
-                        'passenger_name': res[1],
-                        'passenger_email': res[2],
-                        'passenger_phone': res[3],
-                        'meeting_point_address': res[4],
+                        'id': res['id'],
+                        'passenger_name': res['passenger_name'],
+                        'passenger_email': res['passenger_email'],
+                        'passenger_phone': res['passenger_phone'],
+                        'meeting_point_address': res['meeting_point_address'],
                         'pickup_time_outbound': pickup_time_outbound,
                         'dropoff_time_return': dropoff_time_return,
                         'computed_departure_time': computed_departure_time,
                         'computed_arrival_home_time': computed_arrival_home_time,
-                        'confirmation_token': res[15],
-                        'monday': res[8],
-                        'tuesday': res[9],
-                        'wednesday': res[10],
-                        'thursday': res[11],
-                        'friday': res[12],
-                        'saturday': res[13],
-                        'sunday': res[14]
+                        'confirmation_token': res['confirmation_token'],
+                        'monday': res['monday'],
+                        'tuesday': res['tuesday'],
+                        'wednesday': res['wednesday'],
+                        'thursday': res['thursday'],
+                        'friday': res['friday'],
+                        'saturday': res['saturday'],
+                        'sunday': res['sunday']
                     })
                 
                 # Générer l'email récapitulatif
@@ -4532,44 +4545,33 @@ def reject_recurrent_reservation(reservation_id):
                 
                 if pickup_coords and offer_data['destination_coords'] and offer_data['recurrent_time']:
                     try:
-                        import requests
                         # Temps pickup → bureau
-                        osrm_url = f"https://router.project-osrm.org/route/v1/driving/{pickup_coords[0]},{pickup_coords[1]};{offer_data['destination_coords'][0]},{offer_data['destination_coords'][1]}?overview=false"
-                        response = requests.get(osrm_url, timeout=5)
-                        if response.status_code == 200:
-                            data = response.json()
-                            if data.get('routes'):
-                                time_pickup_to_office = data['routes'][0]['duration'] / 60
-                                arrival_office = datetime.combine(datetime.today(), offer_data['recurrent_time'])
-                                pickup_datetime = arrival_office - timedelta(minutes=time_pickup_to_office)
-                                pickup_time_outbound = pickup_datetime.time()
+                        duration_s = osrm_client.route_duration([pickup_coords, offer_data['destination_coords']])
+                        if duration_s is not None:
+                            time_pickup_to_office = duration_s / 60
+                            arrival_office = datetime.combine(datetime.today(), offer_data['recurrent_time'])
+                            pickup_datetime = arrival_office - timedelta(minutes=time_pickup_to_office)
+                            pickup_time_outbound = pickup_datetime.time()
                     except Exception as e:
                         logger.warning(f"Erreur calcul heure pickup: {e}")
                 
                 if pickup_coords and offer_data['departure_coords'] and offer_data['destination_coords'] and offer_data['time_return']:
                     try:
-                        import requests
                         # Temps bureau → dropoff
-                        osrm_url1 = f"https://router.project-osrm.org/route/v1/driving/{offer_data['destination_coords'][0]},{offer_data['destination_coords'][1]};{pickup_coords[0]},{pickup_coords[1]}?overview=false"
+                        duration1_s = osrm_client.route_duration([offer_data['destination_coords'], pickup_coords])
                         # Temps dropoff → home
-                        osrm_url2 = f"https://router.project-osrm.org/route/v1/driving/{pickup_coords[0]},{pickup_coords[1]};{offer_data['departure_coords'][0]},{offer_data['departure_coords'][1]}?overview=false"
+                        duration2_s = osrm_client.route_duration([pickup_coords, offer_data['departure_coords']])
                         
-                        response1 = requests.get(osrm_url1, timeout=5)
-                        response2 = requests.get(osrm_url2, timeout=5)
-                        
-                        if response1.status_code == 200 and response2.status_code == 200:
-                            data1 = response1.json()
-                            data2 = response2.json()
-                            if data1.get('routes') and data2.get('routes'):
-                                time_office_to_dropoff = data1['routes'][0]['duration'] / 60
-                                time_dropoff_to_home = data2['routes'][0]['duration'] / 60
-                                
-                                departure_office = datetime.combine(datetime.today(), offer_data['time_return'])
-                                dropoff_datetime = departure_office + timedelta(minutes=time_office_to_dropoff)
-                                dropoff_time_return = dropoff_datetime.time()
-                                
-                                arrival_datetime = dropoff_datetime + timedelta(minutes=time_dropoff_to_home)
-                                arrival_home_time = arrival_datetime.time()
+                        if duration1_s is not None and duration2_s is not None:
+                            time_office_to_dropoff = duration1_s / 60
+                            time_dropoff_to_home = duration2_s / 60
+                            
+                            departure_office = datetime.combine(datetime.today(), offer_data['time_return'])
+                            dropoff_datetime = departure_office + timedelta(minutes=time_office_to_dropoff)
+                            dropoff_time_return = dropoff_datetime.time()
+                            
+                            arrival_datetime = dropoff_datetime + timedelta(minutes=time_dropoff_to_home)
+                            arrival_home_time = arrival_datetime.time()
                     except Exception as e:
                         logger.warning(f"Erreur calcul heure dropoff: {e}")
                 
@@ -4581,15 +4583,11 @@ def reject_recurrent_reservation(reservation_id):
                         today = datetime.now().date()
                         pickup_datetime = datetime.combine(today, pickup_time_outbound)
                         
-                        coord_str = f"{departure_coords[0]},{departure_coords[1]};{pickup_coords[0]},{pickup_coords[1]}"
-                        osrm_url = f"https://router.project-osrm.org/route/v1/driving/{coord_str}"
-                        resp = requests.get(osrm_url, timeout=5)
-                        if resp.status_code == 200:
-                            data = resp.json()
-                            if data.get('routes'):
-                                home_to_pickup_duration = data['routes'][0]['duration'] / 60
-                                new_departure_datetime = pickup_datetime - timedelta(minutes=home_to_pickup_duration)
-                                new_departure_time = new_departure_datetime.time()
+                        duration_s = osrm_client.route_duration([departure_coords, pickup_coords])
+                        if duration_s is not None:
+                            home_to_pickup_duration = duration_s / 60
+                            new_departure_datetime = pickup_datetime - timedelta(minutes=home_to_pickup_duration)
+                            new_departure_time = new_departure_datetime.time()
                     except Exception as e:
                         logger.warning(f"Erreur calcul nouveau départ: {e}")
                 
@@ -4658,15 +4656,15 @@ def remove_recurrent_passenger(reservation_id):
             if not reservation:
                 return "Réservation non trouvée", 404
             
-            if reservation[5] != token:
+            if reservation['confirmation_token'] != token:
                 return "Token invalide", 403
             
-            if reservation[4] != 'confirmed':
-                return f"Cette réservation n'est pas confirmée (statut: {reservation[4]})", 400
+            if reservation['status'] != 'confirmed':
+                return f"Cette réservation n'est pas confirmée (statut: {reservation['status']})", 400
             
-            offer_id = reservation[1]
-            passenger_name = reservation[2]
-            passenger_email = reservation[3]
+            offer_id = reservation['offer_id']
+            passenger_name = reservation['passenger_name']
+            passenger_email = reservation['passenger_email']
             
             # Marquer comme cancelled
             cur.execute("""
@@ -4680,11 +4678,11 @@ def remove_recurrent_passenger(reservation_id):
             # RECALCULER L'ITINÉRAIRE avec les passagers restants (exactement comme dans accept)
             import json
             from datetime import datetime, timedelta
-            import requests
             
             # Récupérer les passagers RESTANTS confirmés
             cur.execute("""
-                SELECT id, meeting_point_coords, meeting_point_address, passenger_name, pickup_time_outbound
+                SELECT id, meeting_point_coords, meeting_point_address, passenger_name, pickup_time_outbound,
+                       detour_time_outbound, detour_time_return
                 FROM carpool_reservations_recurrent
                 WHERE offer_id = %s AND status = 'confirmed'
                 ORDER BY pickup_time_outbound ASC, id ASC
@@ -4698,7 +4696,7 @@ def remove_recurrent_passenger(reservation_id):
                     UPDATE carpool_reservations_recurrent
                     SET pickup_order = %s
                     WHERE id = %s
-                """, (index + 1, passenger[0]))
+                """, (index + 1, passenger['id']))
             
             logger.info(f"📋 {len(remaining_passengers)} passager(s) restant(s) après retrait")
             
@@ -4720,11 +4718,11 @@ def remove_recurrent_passenger(reservation_id):
                 return "Offre non trouvée", 404
             
             # Recalculer les routes (même logique qu'accept_recurrent_reservation)
-            departure_coords = json.loads(offer[6]) if offer[6] else None
-            destination_coords = json.loads(offer[7]) if offer[7] else None
+            departure_coords = json.loads(offer['departure_coords']) if offer['departure_coords'] else None
+            destination_coords = json.loads(offer['destination_coords']) if offer['destination_coords'] else None
             
-            base_recurrent_time = offer[8]
-            base_time_return = offer[9]
+            base_recurrent_time = offer['recurrent_time']
+            base_time_return = offer['time_return']
             
             def ensure_time(value):
                 if isinstance(value, timedelta):
@@ -4748,13 +4746,10 @@ def remove_recurrent_passenger(reservation_id):
             
             if departure_coords and destination_coords:
                 try:
-                    osrm_url = f"https://router.project-osrm.org/route/v1/driving/{departure_coords[0]},{departure_coords[1]};{destination_coords[0]},{destination_coords[1]}?overview=false"
-                    response = requests.get(osrm_url, timeout=5)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('routes'):
-                            base_duration_outbound = data['routes'][0]['duration'] / 60
-                            base_duration_return = base_duration_outbound
+                    duration_s = osrm_client.route_duration([departure_coords, destination_coords])
+                    if duration_s is not None:
+                        base_duration_outbound = duration_s / 60
+                        base_duration_return = base_duration_outbound
                 except Exception as e:
                     logger.warning(f"Erreur calcul trajet de base: {e}")
             
@@ -4766,12 +4761,12 @@ def remove_recurrent_passenger(reservation_id):
             # Collecter waypoints des passagers restants
             passenger_waypoints = []
             for passenger in remaining_passengers:
-                passenger_coords = json.loads(passenger[1]) if passenger[1] else None
+                passenger_coords = json.loads(passenger['meeting_point_coords']) if passenger['meeting_point_coords'] else None
                 if passenger_coords:
                     passenger_waypoints.append({
                         'coords': passenger_coords,
-                        'address': passenger[2],
-                        'passenger_name': passenger[3]
+                        'address': passenger['meeting_point_address'],
+                        'passenger_name': passenger['passenger_name']
                     })
             
             total_detour_outbound = 0
@@ -4779,38 +4774,46 @@ def remove_recurrent_passenger(reservation_id):
             
             if passenger_waypoints and departure_coords and destination_coords:
                 try:
-                    waypoint_coords = ';'.join([f"{wp['coords'][0]},{wp['coords'][1]}" for wp in passenger_waypoints])
-                    osrm_url_aller = f"https://router.project-osrm.org/route/v1/driving/{departure_coords[0]},{departure_coords[1]};{waypoint_coords};{destination_coords[0]},{destination_coords[1]}?overview=full&geometries=geojson"
-                    
-                    response = requests.get(osrm_url_aller, timeout=10)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('routes'):
-                            route_data = data['routes'][0]
-                            duration_with_all = route_data['duration'] / 60
-                            total_detour_outbound = duration_with_all - base_duration_outbound
-                            route_outbound['duration'] = duration_with_all * 60
-                            route_outbound['geometry'] = route_data.get('geometry', {}).get('coordinates', [])
-                            logger.info(f"📍 Trajet ALLER avec {len(passenger_waypoints)} passager(s): {duration_with_all:.1f}min (détour: +{total_detour_outbound:.1f}min)")
+                    waypoint_coords = [wp['coords'] for wp in passenger_waypoints]
+                    data = osrm_client.route(
+                        [departure_coords] + waypoint_coords + [destination_coords],
+                        overview='full', geometries='geojson', timeout=10
+                    )
+                    if data:
+                        route_data = data['routes'][0]
+                        duration_with_all = route_data['duration'] / 60
+                        total_detour_outbound = duration_with_all - base_duration_outbound
+                        route_outbound['duration'] = duration_with_all * 60
+                        route_outbound['geometry'] = route_data.get('geometry', {}).get('coordinates', [])
+                        logger.info(f"📍 Trajet ALLER avec {len(passenger_waypoints)} passager(s): {duration_with_all:.1f}min (détour: +{total_detour_outbound:.1f}min)")
+                    else:
+                        # Fallback : utiliser la somme des détours individuels
+                        logger.warning("Trajet aller indisponible, somme des détours individuels")
+                        total_detour_outbound = sum(p['detour_time_outbound'] or 0 for p in remaining_passengers)
                 except Exception as e:
                     logger.warning(f"Erreur calcul trajet aller: {e}")
+                    total_detour_outbound = sum(p['detour_time_outbound'] or 0 for p in remaining_passengers)
                 
                 try:
-                    waypoint_coords = ';'.join([f"{wp['coords'][0]},{wp['coords'][1]}" for wp in passenger_waypoints])
-                    osrm_url_retour = f"https://router.project-osrm.org/route/v1/driving/{destination_coords[0]},{destination_coords[1]};{waypoint_coords};{departure_coords[0]},{departure_coords[1]}?overview=full&geometries=geojson"
-                    
-                    response = requests.get(osrm_url_retour, timeout=10)
-                    if response.status_code == 200:
-                        data = response.json()
-                        if data.get('routes'):
-                            route_data = data['routes'][0]
-                            duration_with_all = route_data['duration'] / 60
-                            total_detour_return = duration_with_all - base_duration_return
-                            route_return['duration'] = duration_with_all * 60
-                            route_return['geometry'] = route_data.get('geometry', {}).get('coordinates', [])
-                            logger.info(f"📍 Trajet RETOUR avec {len(passenger_waypoints)} passager(s): {duration_with_all:.1f}min (détour: +{total_detour_return:.1f}min)")
+                    waypoint_coords = [wp['coords'] for wp in passenger_waypoints]
+                    data = osrm_client.route(
+                        [destination_coords] + waypoint_coords + [departure_coords],
+                        overview='full', geometries='geojson', timeout=10
+                    )
+                    if data:
+                        route_data = data['routes'][0]
+                        duration_with_all = route_data['duration'] / 60
+                        total_detour_return = duration_with_all - base_duration_return
+                        route_return['duration'] = duration_with_all * 60
+                        route_return['geometry'] = route_data.get('geometry', {}).get('coordinates', [])
+                        logger.info(f"📍 Trajet RETOUR avec {len(passenger_waypoints)} passager(s): {duration_with_all:.1f}min (détour: +{total_detour_return:.1f}min)")
+                    else:
+                        # Fallback : utiliser la somme des détours individuels
+                        logger.warning("Trajet retour indisponible, somme des détours individuels")
+                        total_detour_return = sum(p['detour_time_return'] or 0 for p in remaining_passengers)
                 except Exception as e:
                     logger.warning(f"Erreur calcul trajet retour: {e}")
+                    total_detour_return = sum(p['detour_time_return'] or 0 for p in remaining_passengers)
             
             for wp in passenger_waypoints:
                 route_outbound['waypoints'].append(wp)
@@ -4847,10 +4850,10 @@ def remove_recurrent_passenger(reservation_id):
                     <div style="font-size: 64px; margin-bottom: 20px;">👋</div>
                     <h1 style="color: #f59e0b; margin-bottom: 20px;">Retrait du covoiturage</h1>
                     <p style="font-size: 16px; color: #475569;">
-                        Le conducteur {offer[1]} vous a retiré de son covoiturage.
+                        Le conducteur {offer['driver_name']} vous a retiré de son covoiturage.
                     </p>
                     <p style="font-size: 14px; color: #94a3b8;">
-                        Trajet : {offer[4]} → {offer[5]}
+                        Trajet : {offer['departure']} → {offer['destination']}
                     </p>
                 </div>
                 """
@@ -4882,33 +4885,33 @@ def remove_recurrent_passenger(reservation_id):
                 
                 # Préparer les données de l'offre
                 offer_data = {
-                    'driver_name': offer[1],
-                    'driver_email': offer[2],
-                    'departure': offer[4],
-                    'destination': offer[5],
+                    'driver_name': offer['driver_name'],
+                    'driver_email': offer['driver_email'],
+                    'departure': offer['departure'],
+                    'destination': offer['destination'],
                     'departure_coords': departure_coords,
                     'destination_coords': destination_coords,
                     'departure_time': new_departure_from_home,
                     'arrival_time': base_recurrent_time,
                     'return_departure_time': base_time_return,
                     'return_arrival_time': new_arrival_at_home,
-                    'color_outbound': offer[13] or '#7c3aed',
-                    'color_return': offer[14] or '#f97316',
-                    'monday': offer[15],
-                    'tuesday': offer[16],
-                    'wednesday': offer[17],
-                    'thursday': offer[18],
-                    'friday': offer[19],
-                    'saturday': offer[20],
-                    'sunday': offer[21]
+                    'color_outbound': offer['color_outbound'] or '#7c3aed',
+                    'color_return': offer['color_return'] or '#f97316',
+                    'monday': offer['monday'],
+                    'tuesday': offer['tuesday'],
+                    'wednesday': offer['wednesday'],
+                    'thursday': offer['thursday'],
+                    'friday': offer['friday'],
+                    'saturday': offer['saturday'],
+                    'sunday': offer['sunday']
                 }
                 
                 # Convertir les réservations en dict
                 reservations_list = []
                 for r in confirmed_reservations:
                     # Convertir pickup_time et dropoff_time de timedelta à time si nécessaire
-                    pickup_time = r[15]
-                    dropoff_time = r[16]
+                    pickup_time = r['pickup_time_outbound']
+                    dropoff_time = r['dropoff_time_return']
                     
                     if pickup_time and isinstance(pickup_time, timedelta):
                         total_seconds = int(pickup_time.total_seconds())
@@ -4923,26 +4926,26 @@ def remove_recurrent_passenger(reservation_id):
                         dropoff_time = datetime.min.time().replace(hour=hours, minute=minutes)
                     
                     reservations_list.append({
-                        'id': r[0],
-                        'passenger_name': r[1],
-                        'passenger_email': r[2],
-                        'passenger_phone': r[3],
-                        'meeting_point_address': r[4],
-                        'meeting_point_coords': r[5],
-                        'detour_time_outbound': r[6],
-                        'detour_time_return': r[7],
-                        'monday': r[8],
-                        'tuesday': r[9],
-                        'wednesday': r[10],
-                        'thursday': r[11],
-                        'friday': r[12],
-                        'saturday': r[13],
-                        'sunday': r[14],
+                        'id': r['id'],
+                        'passenger_name': r['passenger_name'],
+                        'passenger_email': r['passenger_email'],
+                        'passenger_phone': r['passenger_phone'],
+                        'meeting_point_address': r['meeting_point_address'],
+                        'meeting_point_coords': r['meeting_point_coords'],
+                        'detour_time_outbound': r['detour_time_outbound'],
+                        'detour_time_return': r['detour_time_return'],
+                        'monday': r['monday'],
+                        'tuesday': r['tuesday'],
+                        'wednesday': r['wednesday'],
+                        'thursday': r['thursday'],
+                        'friday': r['friday'],
+                        'saturday': r['saturday'],
+                        'sunday': r['sunday'],
                         'pickup_time_outbound': pickup_time,
                         'dropoff_time_return': dropoff_time,
-                        'computed_departure_time': r[17],
-                        'computed_arrival_home_time': r[18],
-                        'confirmation_token': r[19]
+                        'computed_departure_time': r['computed_departure_time'],
+                        'computed_arrival_home_time': r['computed_arrival_home_time'],
+                        'confirmation_token': r['confirmation_token']
                     })
                 
                 BASE_URL = os.getenv('CARETTE_BASE_URL', 'http://localhost:9000')
@@ -5663,6 +5666,9 @@ def send_weekly_recap():
             sent_count = 0
             carpool_count = 0
             
+            # Matching calculé une seule fois par entreprise pour tout l'envoi
+            match_cache = {}
+            
             for user in users:
                 user_id = user['id']
                 user_name = user['name']
@@ -5784,7 +5790,9 @@ def send_weekly_recap():
                 carpool_suggestion = None
                 try:
                     if company_id:
-                        suggestions = get_carpool_suggestions_for_user(user_id, company_id, cur, max_detour_minutes=20)
+                        suggestions = get_carpool_suggestions_for_user(
+                            user_id, company_id, cur, max_detour_minutes=20, match_cache=match_cache
+                        )
                         if suggestions:
                             carpool_suggestion = suggestions[0]  # Prendre la meilleure
                             logger.info(f"🚗 Suggestion covoiturage pour {user_email}: {carpool_suggestion.get('match_name')}")
@@ -6253,6 +6261,9 @@ def update_weekly_data(token):
                         habits_update.get('friday')
                     ))
                     logger.info(f"✨ Habitudes créées pour user_id={user_id}")
+                
+                from carpool_matching import invalidate_user_suggestions
+                invalidate_user_suggestions(user_id, cur)
             
             logger.info(f"✅ Données hebdo mises à jour: {total_co2:.1f} kg CO2 (habitudes sauvegardées: {save_as_habits})")
             
@@ -7038,9 +7049,12 @@ def import_employees_csv(company_id):
     Import d'employés via CSV.
     Format attendu: nom,email,adresse (avec header optionnel)
     Authentification via access_key en header ou query param
+    
+    Au-delà de CARETTE_IMPORT_ASYNC_ROWS lignes (ou avec ?async=1), l'import
+    tourne en tâche de fond : réponse 202 avec job_id, avancement via
+    GET /api/v2/companies/<id>/import-employees/<job_id>
     """
-    import csv
-    import io
+    import employee_import
     
     try:
         # Vérifier l'authentification
@@ -7062,96 +7076,48 @@ def import_employees_csv(company_id):
             
             company_code = company['company_code']
             
-            # Récupérer le fichier CSV
-            if 'file' not in request.files:
-                # Essayer le body raw comme CSV
-                csv_data = request.get_data(as_text=True)
-                if not csv_data:
-                    return jsonify({'error': 'Aucun fichier CSV fourni'}), 400
-            else:
-                file = request.files['file']
-                csv_data = file.read().decode('utf-8-sig')  # utf-8-sig pour gérer le BOM Excel
-            
-            # Parser le CSV
-            reader = csv.reader(io.StringIO(csv_data), delimiter=';')
-            rows = list(reader)
-            
-            # Détecter si première ligne est un header
-            if rows and rows[0][0].lower() in ['nom', 'name', 'prenom', 'prénom']:
-                rows = rows[1:]
-            
-            # Si le délimiteur ; ne marche pas, essayer ,
-            if rows and len(rows[0]) == 1:
-                reader = csv.reader(io.StringIO(csv_data), delimiter=',')
-                rows = list(reader)
-                if rows and rows[0][0].lower() in ['nom', 'name', 'prenom', 'prénom']:
-                    rows = rows[1:]
-            
-            imported = []
-            errors = []
-            
-            for i, row in enumerate(rows, 1):
-                if len(row) < 2:
-                    errors.append(f"Ligne {i}: format invalide (min: nom, email)")
-                    continue
-                
-                # Parser les colonnes (flexible : 2 ou 3 colonnes)
-                name = row[0].strip()
-                email = row[1].strip().lower()
-                address = row[2].strip() if len(row) > 2 else ''
-                
-                if not name or not email:
-                    errors.append(f"Ligne {i}: nom ou email manquant")
-                    continue
-                
-                if '@' not in email:
-                    errors.append(f"Ligne {i}: email invalide '{email}'")
-                    continue
-                
-                # Vérifier si l'employé existe déjà
-                cur.execute("""
-                    SELECT id FROM rse_users WHERE email = %s AND company_id = %s
-                """, (email, company_id))
-                
-                existing = cur.fetchone()
-                if existing:
-                    errors.append(f"Ligne {i}: {email} déjà inscrit")
-                    continue
-                
-                # Géocoder l'adresse si fournie
-                address_coords = None
-                if address:
-                    try:
-                        geo_result = geocode_address(address)
-                        if geo_result:
-                            address_coords = json.dumps(geo_result)
-                    except:
-                        pass  # Ignorer les erreurs de géocodage
-                
-                # Créer l'employé
-                cur.execute("""
-                    INSERT INTO rse_users (company_id, name, email, address, address_coords, active)
-                    VALUES (%s, %s, %s, %s, %s, 1)
-                """, (company_id, name, email, address, address_coords))
-                
-                imported.append({
-                    'name': name,
-                    'email': email,
-                    'address': address or None,
-                    'geocoded': address_coords is not None
-                })
+            # Récupérer le fichier CSV (ou le body raw comme CSV), copié en fichier temporaire
+            stream = request.files['file'].stream if 'file' in request.files else request.stream
+            upload, total_rows = employee_import.spool_upload(stream)
+            if total_rows == 0:
+                upload.close()
+                return jsonify({'error': 'Aucun fichier CSV fourni'}), 400
+            
+            run_async = request.args.get('async', '').lower() in ('1', 'true')
+            if run_async or total_rows > employee_import.IMPORT_ASYNC_ROWS:
+                job_id = employee_import.start_job(company_id, upload, total_rows)
+                logger.info(f"📥 Import CSV {job_id} lancé en tâche de fond: ~{total_rows} lignes pour {company['name']}")
+                return jsonify({
+                    'success': True,
+                    'company_id': company_id,
+                    'company_code': company_code,
+                    'job_id': job_id,
+                    'status': 'queued',
+                    'total_rows': total_rows,
+                    'status_url': f"/api/v2/companies/{company_id}/import-employees/{job_id}",
+                    'message': f"Import de ~{total_rows} ligne(s) en cours"
+                }), 202
+            
+            try:
+                # Réponse synchrone : pas de longue série d'appels Nominatim à 1 req/s
+                result = employee_import.import_employees(
+                    company_id, upload, cur,
+                    geocode_fallback_max=employee_import.IMPORT_SYNC_GEOCODE_FALLBACK_MAX
+                )
+            finally:
+                upload.close()
             
-            logger.info(f"📥 Import CSV: {len(imported)} employés importés pour {company['name']}")
+            logger.info(f"📥 Import CSV: {result['imported_count']} employés importés pour {company['name']}")
             
             return jsonify({
                 'success': True,
                 'company_id': company_id,
                 'company_code': company_code,
-                'imported_count': len(imported),
-                'errors_count': len(errors),
-                'imported': imported,
-                'errors': errors[:20],  # Limiter les erreurs affichées
-                'message': f"{len(imported)} employé(s) importé(s) avec succès"
+                'imported_count': result['imported_count'],
+                'errors_count': result['errors_count'],
+                'imported': result['imported'],
+                'errors': result['errors'],  # 20 premières erreurs
+                'message': f"{result['imported_count']} employé(s) importé(s) avec succès"
             }), 200
             
     except Exception as e:
@@ -7159,6 +7125,55 @@ def import_employees_csv(company_id):
         return jsonify({'error': 'Erreur serveur lors de l\'import'}), 500
 
 
+@app.route('/api/v2/companies/<int:company_id>/import-employees/<job_id>', methods=['GET'])
+@limiter.limit("60 per minute")
+def import_employees_status(company_id, job_id):
+    """
+    Avancement d'un import CSV en tâche de fond.
+    Authentification via access_key en header ou query param
+    """
+    import employee_import
+    
+    try:
+        access_key = request.headers.get('X-Access-Key') or request.args.get('access_key')
+        
+        if not access_key:
+            return jsonify({'error': 'Clé d\'accès manquante'}), 401
+        
+        with sql.db_cursor() as cur:
+            cur.execute("""
+                SELECT id FROM companies 
+                WHERE id = %s AND access_key = %s AND active = 1
+            """, (company_id, access_key))
+            
+            if not cur.fetchone():
+                return jsonify({'error': 'Entreprise non trouvée ou accès refusé'}), 404
+            
+            job = employee_import.get_job(company_id, job_id, cur)
+            if not job:
+                return jsonify({'error': 'Import introuvable'}), 404
+        
+        return jsonify({
+            'success': True,
+            'job_id': job['id'],
+            'status': job['status'],
+            'progress': job['progress'],
+            'total_rows': job['total_rows'],
+            'processed_rows': job['processed_rows'],
+            'imported_count': job['imported_count'],
+            'geocoded_count': job['geocoded_count'],
+            'errors_count': job['errors_count'],
+            'errors': job['errors'],
+            'error_message': job['error_message'],
+            'created_at': job['created_at'].strftime('%Y-%m-%d %H:%M:%S') if job['created_at'] else None,
+            'updated_at': job['updated_at'].strftime('%Y-%m-%d %H:%M:%S') if job['updated_at'] else None
+        }), 200
+    
+    except Exception as e:
+        logger.error(f"Error in import_employees_status: {str(e)}", exc_info=True)
+        return jsonify({'error': 'Erreur serveur'}), 500
+
+
 @app.route('/api/v2/companies/<int:company_id>/report-pdf', methods=['GET'])
 @limiter.limit("10 per hour")
 def generate_monthly_report_pdf(company_id):
@@ -8144,6 +8159,9 @@ def update_user_address():
                 WHERE id = %s
             """, (new_address, user['id']))
             
+            from carpool_matching import invalidate_user_suggestions
+            invalidate_user_suggestions(user['id'], cur)
+            
             logger.info(f"🏠 Adresse mise à jour pour {user['email']}: {old_address} → {new_address}")
             
             return jsonify({
@@ -8193,6 +8211,9 @@ def update_user_transport():
                 WHERE id = %s
             """, (json.dumps(transports), user['id']))
             
+            from carpool_matching import invalidate_user_suggestions
+            invalidate_user_suggestions(user['id'], cur)
+            
             logger.info(f"🚗 Transports par défaut mis à jour pour {user['email']}")
             
             return jsonify({
@@ -8323,6 +8344,9 @@ def add_company_site(company_id):
             
             site_id = cur.lastrowid
             
+            from carpool_matching import invalidate_company_suggestions
+            invalidate_company_suggestions(company_id, cur)
+            
             logger.info(f"📍 Site ajouté: {site_name} pour entreprise {company_id}")
             
             return jsonify({
@@ -8375,6 +8399,10 @@ def update_company_site(company_id, site_id):
                 WHERE id = %s AND company_id = %s
             """, (site_name, site_address, json.dumps(coords), site_id, company_id))
             
+            # Destination modifiée : toutes les suggestions de l'entreprise sont à recalculer
+            from carpool_matching import invalidate_company_suggestions
+            invalidate_company_suggestions(company_id, cur)
+            
             logger.info(f"📍 Site modifié: {site_name} (ID: {site_id})")
             
             return jsonify({
@@ -8415,6 +8443,9 @@ def delete_company_site(company_id, site_id):
                 WHERE id = %s AND company_id = %s
             """, (site_id, company_id))
             
+            from carpool_matching import invalidate_company_suggestions
+            invalidate_company_suggestions(company_id, cur)
+            
             logger.info(f"🔴 Site désactivé: {site['site_name']} (ID: {site_id})")
             
             return jsonify({
@@ -8452,6 +8483,9 @@ def reactivate_company_site(company_id, site_id):
                 WHERE id = %s AND company_id = %s
             """, (site_id, company_id))
             
+            from carpool_matching import invalidate_company_suggestions
+            invalidate_company_suggestions(company_id, cur)
+            
             logger.info(f"🟢 Site réactivé: {site['site_name']} (ID: {site_id})")
             
             return jsonify({
@@ -0,0 +1 @@
+"""Benchmarks des chemins critiques (voir run_benchmarks.py)"""
@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Benchmarks des chemins critiques (matching, recherche, buffers, récaps,
+import CSV d'employés).
+
+Les chemins sont exécutés en processus, sur des données synthétiques, avec :
+- une base SQLite en mémoire à la place de MySQL (standin_db)
+- un moteur de routage local (routing_backends, défaut: estimate), ou le
+  serveur de rejeu de cassette (--replay-url, voir routing_cassette.py)
+- les emails désactivés, le rate limiting Flask désactivé
+
+Usage :
+    python benchmarks/run_benchmarks.py --sizes 10,100,1000
+    python benchmarks/run_benchmarks.py --baseline benchmarks/results/baseline.json
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/results/baseline.json
+
+Les résultats (JSON) contiennent, par benchmark et par taille d'entreprise,
+les durées de chaque mesure (min, médiane, moyenne) et le nombre de requêtes
+SQL. Avec --baseline, les médianes sont comparées et une régression est
+signalée au-delà de --threshold (défaut: +25 %).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+BENCHMARKS = ['matching', 'search', 'temporal_buffer', 'weekly_recap', 'monthly_recap', 'employee_import']
+# Benchmarks indépendants de la taille de l'entreprise (une seule série)
+SIZE_INDEPENDENT = {'temporal_buffer'}
+SEARCHES_PER_RUN = 10
+MONTH_START = '2026-09-07'
+MONTH_END = '2026-10-02'
+
+
+def configure_environment(args):
+    """Variables d'environnement lues à l'import des modules de l'application"""
+    defaults = {
+        'CARETTE_DEBUG': 'true',
+        'CARETTE_SECRET_KEY': 'benchmark',
+        'CARETTE_DB_PASSWORD': 'benchmark',
+        'CARETTE_DB_ROOT_PASSWORD': 'benchmark',
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+    os.environ['CARETTE_ROUTE_CACHE_DB'] = 'false'
+    os.environ['CARETTE_ROUTE_CACHE'] = 'true' if args.route_cache else 'false'
+    if args.replay_url:
+        os.environ['CARETTE_ROUTING_BACKEND'] = 'osrm'
+        os.environ['CARETTE_HTTP_REPLAY_URL'] = args.replay_url
+    else:
+        os.environ['CARETTE_ROUTING_BACKEND'] = args.routing
+    if args.graph:
+        os.environ['CARETTE_ROUTING_GRAPH_FILE'] = args.graph
+
+
+class Context:
+    """Application et données d'une taille d'entreprise"""
+
+    def __init__(self, size: int, seed: int):
+        import synthetic
+        from standin_db import StandinDB
+
+        self.size = size
+        self.company_id = 1
+        self.site_id = 1
+        self.db = StandinDB()
+        self.data = synthetic.generate_company(size, seed=seed, company_id=self.company_id)
+        for table, rows in self.data.items():
+            self.db.insert_rows(table, rows)
+        self.db.install()
+        self.db.snapshot()
+        self.queries = synthetic.passenger_queries(SEARCHES_PER_RUN, seed=seed + 1)
+        self.route = synthetic.long_route()
+
+        self.api = load_app()
+        self.client = self.api.app.test_client()
+
+
+_app = None
+
+
+def load_app():
+    """Importe api une seule fois (après installation de la base de remplacement)"""
+    global _app
+    if _app is None:
+        import logging
+        import email_sender
+        import api
+
+        email_sender.send_email = lambda *args, **kwargs: True
+        api.send_email = email_sender.send_email
+        api.limiter.enabled = False
+        logging.disable(logging.INFO)
+        _app = api
+    return _app
+
+
+def check(response, name):
+    if response.status_code != 200:
+        raise RuntimeError(f"{name}: HTTP {response.status_code} {response.get_data(as_text=True)[:200]}")
+    return response.get_json()
+
+
+def bench_matching(ctx):
+    from carpool_matching import find_carpool_matches_for_company
+    with ctx.db.db_cursor() as cur:
+        matches = find_carpool_matches_for_company(ctx.company_id, cur, 20)
+    return {'matches': len(matches)}
+
+
+def bench_search(ctx):
+    found = 0
+    for coords in ctx.queries:
+        data = check(ctx.client.post('/api/v2/offers/recurrent/search',
+                                     json={'site_id': ctx.site_id, 'departure_coords': coords}), 'search')
+        found += len(data.get('offers', []))
+    return {'searches': len(ctx.queries), 'offers_found': found}
+
+
+def bench_temporal_buffer(ctx):
+    from temporal_buffer import create_temporal_buffer
+    zone = create_temporal_buffer(ctx.route, max_detour_time_minutes=25)
+    return {'zone': zone is not None}
+
+
+def bench_weekly_recap(ctx):
+    data = check(ctx.client.post('/api/v2/rse/send-weekly-recap',
+                                 json={'week_end_date': '2026-10-09'}), 'weekly_recap')
+    return {'sent': data.get('sent_count'), 'with_carpool': data.get('carpool_suggestions_count')}
+
+
+def bench_monthly_recap(ctx):
+    data = check(ctx.client.get(f'/api/v2/rse/monthly-recap/company/{ctx.company_id}'
+                                f'?start_date={MONTH_START}&end_date={MONTH_END}'), 'monthly_recap')
+    return {'weeks': data.get('summary', {}).get('total_weeks')}
+
+
+def bench_employee_import(ctx):
+    # Employés existants réimportés sous un autre email : adresses déjà en cache de géocodage
+    import io
+    from employee_import import import_employees
+    lines = ['nom;email;adresse'] + [f"{user['name']};import{user['id']}@bench.fr;{user['departure_address']}"
+                                     for user in ctx.data['rse_users']]
+    with ctx.db.db_cursor() as cur:
+        result = import_employees(ctx.company_id, io.BytesIO('\n'.join(lines).encode('utf-8')), cur,
+                                  keep_imported=False)
+    return {'imported': result['imported_count'], 'geocoded': result['geocoded_count']}
+
+
+# Benchmarks qui modifient la base : état initial restauré avant chaque mesure
+STATEFUL = {'weekly_recap', 'employee_import'}
+
+
+def run_benchmark(name, ctx, repeat, warmup):
+    """Mesures d'un benchmark : durées (s), requêtes SQL par mesure, infos du dernier passage"""
+    func = globals()[f'bench_{name}']
+    timings, queries, info = [], [], {}
+    for i in range(warmup + repeat):
+        if name in STATEFUL:
+            ctx.db.restore()
+        queries_before = ctx.db.queries
+        started = time.perf_counter()
+        info = func(ctx)
+        elapsed = time.perf_counter() - started
+        if i >= warmup:
+            timings.append(elapsed)
+            queries.append(ctx.db.queries - queries_before)
+    return {
+        'runs': [round(t, 6) for t in timings],
+        'min': round(min(timings), 6),
+        'median': round(statistics.median(timings), 6),
+        'mean': round(statistics.fmean(timings), 6),
+        'db_queries': queries[-1] if queries else 0,
+        'info': info,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, threshold, min_delta):
+    """
+    Affiche la comparaison des médianes ; retourne la liste des régressions.
+    Un écart inférieur à min_delta (s) n'est jamais une régression (bruit de mesure).
+    """
+    regressions = []
+    print(f"\n📊 Comparaison avec la référence (seuil +{threshold * 100:.0f} %)")
+    for key, result in results['results'].items():
+        reference = baseline.get('results', {}).get(key)
+        if not reference or 'median' not in result or 'median' not in reference:
+            print(f"  {key:<28} (pas de référence)")
+            continue
+        ratio = result['median'] / reference['median'] if reference['median'] else float('inf')
+        slower = ratio > 1 + threshold and result['median'] - reference['median'] > min_delta
+        faster = ratio < 1 - threshold and reference['median'] - result['median'] > min_delta
+        flag = '🔴' if slower else ('🟢' if faster else '⚪')
+        print(f"  {flag} {key:<28} {reference['median'] * 1000:10.1f} ms → {result['median'] * 1000:10.1f} ms "
+              f"(×{ratio:.2f})")
+        if slower:
+            regressions.append(key)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks Carette (matching, recherche, récaps, import)')
+    parser.add_argument('--sizes', default='10,100,1000',
+                        help="Tailles d'entreprise (employés), ex: 10,100,1000,10000")
+    parser.add_argument('--only', help=f"Benchmarks à lancer parmi {','.join(BENCHMARKS)}")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--routing', default='estimate', choices=['estimate', 'graph'],
+                        help='Moteur de routage local')
+    parser.add_argument('--graph', help='Graphe .npz pour --routing graph')
+    parser.add_argument('--replay-url', help='Serveur de rejeu (routing_cassette.py serve) au lieu du moteur local')
+    parser.add_argument('--route-cache', action='store_true', help='Activer le cache mémoire des routes')
+    parser.add_argument('--output', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         'results', 'latest.json'))
+    parser.add_argument('--baseline', help='Résultats de référence à comparer')
+    parser.add_argument('--save-baseline', help='Enregistrer aussi les résultats comme référence')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Régression au-delà de +x (défaut 0.25)')
+    parser.add_argument('--min-delta', type=float, default=0.005,
+                        help='Écart absolu minimal (s) pour signaler une régression (défaut 0.005)')
+    args = parser.parse_args()
+
+    configure_environment(args)
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    selected = args.only.split(',') if args.only else BENCHMARKS
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"benchmark(s) inconnu(s): {', '.join(sorted(unknown))}")
+
+    results = {
+        'meta': {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'routing': 'replay' if args.replay_url else args.routing,
+            'replay_url': args.replay_url,
+            'route_cache': args.route_cache,
+            'repeat': args.repeat,
+            'warmup': args.warmup,
+            'seed': args.seed,
+        },
+        'results': {},
+    }
+
+    for size in sizes:
+        print(f"\n🏢 Entreprise de {size} employés")
+        started = time.perf_counter()
+        ctx = Context(size, args.seed)
+        print(f"  ⚙️  Données générées en {time.perf_counter() - started:.1f}s "
+              f"({len(ctx.data['carpool_offers_recurrent'])} offres)")
+
+        for name in selected:
+            if name in SIZE_INDEPENDENT and size != sizes[0]:
+                continue
+            key = name if name in SIZE_INDEPENDENT else f"{name}@{size}"
+            try:
+                result = run_benchmark(name, ctx, args.repeat, args.warmup)
+                print(f"  ⏱️  {key:<28} médiane {result['median'] * 1000:10.1f} ms "
+                      f"({result['db_queries']} requêtes SQL) {result['info']}")
+            except Exception as e:
+                result = {'error': str(e)}
+                print(f"  ❌ {key:<28} {e}")
+            result.update({'benchmark': name, 'size': None if name in SIZE_INDEPENDENT else size})
+            results['results'][key] = result
+
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        print(f"\n💾 Résultats enregistrés: {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_delta)
+        if regressions:
+            print(f"\n🔴 {len(regressions)} régression(s): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ Aucune régression")
+
+
+if __name__ == '__main__':
+    main()
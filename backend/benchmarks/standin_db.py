@@ -0,0 +1,317 @@
+"""
+Base de données de remplacement (SQLite en mémoire) pour les benchmarks.
+
+Remplace sql.db_cursor par un curseur SQLite qui se comporte comme le
+DictCursor PyMySQL sur les requêtes des chemins mesurés :
+- placeholders %s, NOW() (+ INTERVAL n SECOND), DAYOFWEEK(), UNIX_TIMESTAMP(),
+  ON DUPLICATE KEY UPDATE ... VALUES(col)
+- lignes en dict, dates/heures converties comme PyMySQL (date, datetime, timedelta)
+
+Le schéma ne reprend que les tables et colonnes utilisées par ces chemins.
+snapshot() / restore() remettent la base dans l'état initial entre deux
+mesures d'un chemin qui écrit (récap hebdo).
+"""
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+SCHEMA = """
+CREATE TABLE companies (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    email TEXT,
+    company_code TEXT UNIQUE,
+    access_key TEXT UNIQUE,
+    email_domain TEXT,
+    contact_email TEXT,
+    contact_name TEXT,
+    active INTEGER DEFAULT 1
+);
+CREATE TABLE company_sites (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company_id INTEGER NOT NULL,
+    site_name TEXT NOT NULL,
+    site_address TEXT,
+    site_coords TEXT,
+    active INTEGER DEFAULT 1
+);
+CREATE TABLE rse_users (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company_id INTEGER,
+    name TEXT NOT NULL,
+    email TEXT NOT NULL UNIQUE,
+    phone TEXT,
+    departure_address TEXT,
+    destination_address TEXT,
+    distance_km REAL DEFAULT 0,
+    active INTEGER DEFAULT 1
+);
+CREATE INDEX idx_users_company ON rse_users (company_id, active);
+CREATE TABLE rse_user_habits (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE,
+    monday TEXT DEFAULT 'voiture_solo',
+    tuesday TEXT DEFAULT 'voiture_solo',
+    wednesday TEXT DEFAULT 'voiture_solo',
+    thursday TEXT DEFAULT 'voiture_solo',
+    friday TEXT DEFAULT 'voiture_solo'
+);
+CREATE TABLE rse_weekly_data (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    week_start DATE NOT NULL,
+    week_end DATE NOT NULL,
+    magic_token TEXT NOT NULL UNIQUE,
+    total_co2 REAL DEFAULT 0,
+    total_distance REAL DEFAULT 0,
+    confirmed INTEGER DEFAULT 0,
+    confirmed_at TIMESTAMP,
+    email_sent INTEGER DEFAULT 0,
+    email_sent_at TIMESTAMP,
+    UNIQUE (user_id, week_start)
+);
+CREATE TABLE rse_daily_transports (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    weekly_data_id INTEGER NOT NULL,
+    date DATE NOT NULL,
+    day_name TEXT NOT NULL,
+    transport_mode TEXT DEFAULT 'voiture_solo',
+    co2_total REAL DEFAULT 0,
+    distance_total REAL DEFAULT 0,
+    UNIQUE (weekly_data_id, date)
+);
+CREATE INDEX idx_daily_date ON rse_daily_transports (date);
+CREATE TABLE geocoding_cache (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    address TEXT NOT NULL UNIQUE,
+    address_key TEXT,
+    latitude REAL,
+    longitude REAL,
+    source TEXT,
+    retry_after TIMESTAMP,
+    geocoded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_geocoding_key ON geocoding_cache (address_key);
+CREATE TABLE carpool_offers_recurrent (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    company_id INTEGER NOT NULL,
+    site_id INTEGER NOT NULL,
+    departure TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    departure_coords TEXT,
+    destination_coords TEXT,
+    recurrent_time TIME NOT NULL,
+    time_return TIME,
+    monday INTEGER DEFAULT 0,
+    tuesday INTEGER DEFAULT 0,
+    wednesday INTEGER DEFAULT 0,
+    thursday INTEGER DEFAULT 0,
+    friday INTEGER DEFAULT 0,
+    saturday INTEGER DEFAULT 0,
+    sunday INTEGER DEFAULT 0,
+    seats INTEGER NOT NULL DEFAULT 1,
+    route_outbound TEXT,
+    route_return TEXT,
+    max_detour_time INTEGER DEFAULT 25,
+    driver_email TEXT,
+    driver_name TEXT,
+    driver_phone TEXT,
+    direct_duration_outbound REAL,
+    direct_distance_outbound REAL,
+    direct_duration_return REAL,
+    direct_distance_return REAL,
+    status TEXT DEFAULT 'active',
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX idx_offers_site ON carpool_offers_recurrent (site_id, status);
+CREATE TABLE carpool_reservations_recurrent (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    offer_id INTEGER NOT NULL,
+    passenger_email TEXT,
+    passenger_name TEXT,
+    passengers INTEGER NOT NULL DEFAULT 1,
+    monday INTEGER DEFAULT 0,
+    tuesday INTEGER DEFAULT 0,
+    wednesday INTEGER DEFAULT 0,
+    thursday INTEGER DEFAULT 0,
+    friday INTEGER DEFAULT 0,
+    saturday INTEGER DEFAULT 0,
+    sunday INTEGER DEFAULT 0,
+    trip_type TEXT NOT NULL DEFAULT 'outbound',
+    meeting_point_coords TEXT,
+    meeting_point_address TEXT,
+    detour_time_outbound INTEGER,
+    detour_time_return INTEGER,
+    status TEXT NOT NULL DEFAULT 'pending'
+);
+CREATE INDEX idx_reservations_offer ON carpool_reservations_recurrent (offer_id);
+CREATE TABLE rse_carpool_suggestions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company_id INTEGER NOT NULL,
+    driver_id INTEGER NOT NULL,
+    passenger_id INTEGER NOT NULL,
+    detour_minutes REAL NOT NULL,
+    common_days TEXT NOT NULL,
+    co2_saved_per_day REAL NOT NULL,
+    co2_saved_week REAL NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE (driver_id, passenger_id)
+);
+CREATE INDEX idx_suggestions_company ON rse_carpool_suggestions (company_id, detour_minutes);
+CREATE TABLE rse_carpool_suggestion_state (
+    company_id INTEGER PRIMARY KEY,
+    max_detour_minutes INTEGER NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+CREATE TABLE rse_carpool_suggestion_invalidations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    company_id INTEGER NOT NULL,
+    user_id INTEGER
+);
+"""
+
+_DUPLICATE_KEY = re.compile(r'ON\s+DUPLICATE\s+KEY\s+UPDATE', re.IGNORECASE)
+_VALUES_REF = re.compile(r'VALUES\((\w+)\)', re.IGNORECASE)
+_NOW = re.compile(r'NOW\(\)', re.IGNORECASE)
+_NOW_PLUS_SECONDS = re.compile(r'NOW\(\)\s*\+\s*INTERVAL\s+%s\s+SECOND', re.IGNORECASE)
+
+
+def translate(query: str) -> str:
+    """Requête MySQL (PyMySQL) → SQLite"""
+    match = _DUPLICATE_KEY.search(query)
+    if match:
+        update = _VALUES_REF.sub(r'excluded.\1', query[match.end():])
+        query = query[:match.start()] + 'ON CONFLICT DO UPDATE SET' + update
+    query = _NOW_PLUS_SECONDS.sub("datetime('now', '+' || %s || ' seconds')", query)
+    query = _NOW.sub('CURRENT_TIMESTAMP', query)
+    return query.replace('%s', '?').replace('%%', '%')
+
+
+def _dayofweek(value):
+    """DAYOFWEEK MySQL (1 = dimanche ... 7 = samedi)"""
+    if value is None:
+        return None
+    return date.fromisoformat(str(value)[:10]).isoweekday() % 7 + 1
+
+
+def _unix_timestamp(value):
+    """UNIX_TIMESTAMP MySQL (les dates SQLite CURRENT_TIMESTAMP sont en UTC)"""
+    if value is None:
+        return None
+    return datetime.fromisoformat(str(value)).replace(tzinfo=timezone.utc).timestamp()
+
+
+def _parse_time(value: bytes) -> timedelta:
+    hours, minutes, seconds = (value.decode().split(':') + ['0', '0'])[:3]
+    return timedelta(hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+
+
+sqlite3.register_converter('DATE', lambda v: date.fromisoformat(v.decode()[:10]))
+sqlite3.register_converter('TIMESTAMP', lambda v: datetime.fromisoformat(v.decode()))
+sqlite3.register_converter('TIME', _parse_time)
+sqlite3.register_adapter(date, lambda d: d.isoformat())
+sqlite3.register_adapter(datetime, lambda d: d.isoformat(sep=' '))
+sqlite3.register_adapter(timedelta, lambda d: f"{int(d.total_seconds()) // 3600:02d}:"
+                                              f"{int(d.total_seconds()) % 3600 // 60:02d}:00")
+
+
+class StandinCursor:
+    """Sous-ensemble du DictCursor PyMySQL utilisé par l'application"""
+
+    def __init__(self, db: "StandinDB"):
+        self._db = db
+        self._cursor = db.conn.cursor()
+        self.lastrowid = None
+        self.rowcount = -1
+
+    def execute(self, query, args=None):
+        sql_query = translate(query)
+        with self._db.lock:
+            self._db.queries += 1
+            self._cursor.execute(sql_query, tuple(args) if args else ())
+            self.lastrowid = self._cursor.lastrowid
+            self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    def executemany(self, query, seq_args):
+        with self._db.lock:
+            self._db.queries += 1
+            self._cursor.executemany(translate(query), [tuple(a) for a in seq_args])
+            self.rowcount = self._cursor.rowcount
+        return self.rowcount
+
+    def _as_dict(self, row):
+        if row is None:
+            return None
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        with self._db.lock:
+            return self._as_dict(self._cursor.fetchone())
+
+    def fetchall(self):
+        with self._db.lock:
+            return [self._as_dict(row) for row in self._cursor.fetchall()]
+
+    def close(self):
+        self._cursor.close()
+
+
+class StandinDB:
+    """Base SQLite en mémoire partagée par tous les db_cursor() du processus"""
+
+    def __init__(self):
+        self.conn = self._connect()
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        self.queries = 0
+        self._snapshot = None
+
+    @staticmethod
+    def _connect():
+        conn = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False, isolation_level=None)
+        conn.create_function('DAYOFWEEK', 1, _dayofweek, deterministic=True)
+        conn.create_function('UNIX_TIMESTAMP', 1, _unix_timestamp, deterministic=True)
+        return conn
+
+    def insert_rows(self, table: str, rows):
+        """Insertion en masse de dicts (mêmes clés pour toutes les lignes)"""
+        if not rows:
+            return
+        columns = list(rows[0].keys())
+        self.conn.executemany(
+            f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [tuple(row[c] for c in columns) for row in rows]
+        )
+
+    def snapshot(self):
+        """Mémorise l'état courant de la base"""
+        self._snapshot = self._connect()
+        self.conn.backup(self._snapshot)
+
+    def restore(self):
+        """Revient à l'état mémorisé par snapshot()"""
+        if self._snapshot is not None:
+            with self.lock:
+                self._snapshot.backup(self.conn)
+
+    @contextmanager
+    def db_cursor(self, root=False, autocommit=True):
+        """Remplaçant de sql.db_cursor"""
+        cursor = StandinCursor(self)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def install(self):
+        """Branche la base sur sql.db_cursor (et neutralise la création de schéma MySQL)"""
+        import sql
+        import init_carpool_tables
+        sql.db_cursor = self.db_cursor
+        init_carpool_tables.init_carpool_tables = lambda: None
+        init_carpool_tables.init_rse_weekly_tables = lambda: None
@@ -0,0 +1,165 @@
+"""
+Générateurs de données synthétiques pour les benchmarks.
+
+generate_company(n) produit une entreprise de n employés autour d'un site
+(domiciles géocodés, habitudes de transport, offres récurrentes,
+réservations, historique hebdomadaire sur un mois) sous forme de lignes
+prêtes à insérer dans StandinDB. Tout est déterministe pour une graine donnée.
+"""
+import json
+import math
+from datetime import date, timedelta
+from typing import Dict, List
+
+import numpy as np
+
+from geocoding import normalize_address
+
+SITE_COORDS = (4.8357, 45.7640)  # Lyon
+HOME_RADIUS_KM = 25.0
+TRANSPORT_MODES = ['voiture_solo', 'transports_commun', 'covoiturage', 'velo', 'teletravail']
+TRANSPORT_WEIGHTS = [0.55, 0.2, 0.05, 0.1, 0.1]
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday']
+DAY_NAMES = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi']
+CO2_FACTORS = {'voiture_solo': 0.220, 'transports_commun': 0.060, 'covoiturage': 0.110,
+               'velo': 0.0, 'teletravail': 0.0}
+
+
+def offset_point(origin, east_km: float, north_km: float) -> List[float]:
+    """Point décalé de (east_km, north_km) par rapport à origin (lon, lat)"""
+    lat = origin[1] + north_km / 110.574
+    lon = origin[0] + east_km / (111.320 * math.cos(math.radians(origin[1])))
+    return [round(lon, 6), round(lat, 6)]
+
+
+def wiggly_route(start, end, n_points: int, rng: np.random.Generator) -> List[List[float]]:
+    """Polyligne start → end avec un léger bruit latéral (géométrie de route plausible)"""
+    t = np.linspace(0.0, 1.0, n_points)
+    start, end = np.asarray(start, dtype=float), np.asarray(end, dtype=float)
+    points = start[None, :] + t[:, None] * (end - start)[None, :]
+    normal = np.array([-(end - start)[1], (end - start)[0]])
+    noise = np.sin(t * math.pi) * rng.normal(0, 0.03, n_points).cumsum() / max(n_points ** 0.5, 1)
+    points += noise[:, None] * normal[None, :]
+    points[0], points[-1] = start, end
+    return np.round(points, 6).tolist()
+
+
+def home_points(n: int, rng: np.random.Generator) -> np.ndarray:
+    """n domiciles autour du site (rayon gaussien, tronqué à HOME_RADIUS_KM)"""
+    radius = np.minimum(np.abs(rng.normal(0, HOME_RADIUS_KM / 2, n)), HOME_RADIUS_KM)
+    angle = rng.uniform(0, 2 * math.pi, n)
+    return np.column_stack((radius * np.cos(angle), radius * np.sin(angle)))
+
+
+def generate_company(n_employees: int, seed: int = 42, company_id: int = 1,
+                     offer_ratio: float = 0.2, weeks: int = 4,
+                     month_start: date = date(2026, 9, 7)) -> Dict[str, List[Dict]]:
+    """
+    Entreprise synthétique : lignes par table.
+
+    Args:
+        n_employees: Nombre d'employés
+        offer_ratio: Part des automobilistes qui publient une offre récurrente
+        weeks: Semaines d'historique (à partir de month_start, un lundi)
+    """
+    rng = np.random.default_rng(seed)
+    site_id = company_id
+    tables: Dict[str, List[Dict]] = {name: [] for name in (
+        'companies', 'company_sites', 'rse_users', 'rse_user_habits', 'geocoding_cache',
+        'carpool_offers_recurrent', 'carpool_reservations_recurrent',
+        'rse_weekly_data', 'rse_daily_transports')}
+
+    tables['companies'].append({
+        'id': company_id, 'name': f'Entreprise {n_employees}', 'email': f'rse{company_id}@bench.fr',
+        'company_code': f'BENCH{company_id}', 'access_key': f'key-{company_id}',
+        'email_domain': 'bench.fr', 'contact_email': f'rse{company_id}@bench.fr',
+        'contact_name': 'Contact RSE', 'active': 1,
+    })
+    tables['company_sites'].append({
+        'id': site_id, 'company_id': company_id, 'site_name': 'Siège',
+        'site_address': '1 place du Siège, 69000 Lyon',
+        'site_coords': json.dumps({'lat': SITE_COORDS[1], 'lon': SITE_COORDS[0]}), 'active': 1,
+    })
+
+    offsets = home_points(n_employees, rng)
+    modes = rng.choice(len(TRANSPORT_MODES), size=(n_employees, 5), p=TRANSPORT_WEIGHTS)
+    weekly_id = 0
+    for i in range(n_employees):
+        user_id = company_id * 1_000_000 + i + 1
+        home = offset_point(SITE_COORDS, *offsets[i])
+        address = f"{i + 1} rue Synthétique, {69000 + i % 100} Ville"
+        distance_km = round(float(np.hypot(*offsets[i])) * 1.3 + 1, 1)
+        habits = {day: TRANSPORT_MODES[modes[i, d]] for d, day in enumerate(DAYS)}
+
+        tables['rse_users'].append({
+            'id': user_id, 'company_id': company_id, 'name': f'Employé {i + 1}',
+            'email': f'employe{i + 1}@bench.fr', 'departure_address': address,
+            'destination_address': tables['company_sites'][0]['site_address'],
+            'distance_km': distance_km, 'active': 1,
+        })
+        tables['rse_user_habits'].append({'user_id': user_id, **habits})
+        tables['geocoding_cache'].append({'address': address, 'address_key': normalize_address(address),
+                                          'latitude': home[1], 'longitude': home[0]})
+
+        # Historique hebdomadaire (récap mensuel)
+        for week in range(weeks):
+            weekly_id += 1
+            week_start = month_start + timedelta(weeks=week)
+            co2 = [distance_km * 2 * CO2_FACTORS[habits[day]] for day in DAYS]
+            tables['rse_weekly_data'].append({
+                'id': weekly_id, 'user_id': user_id, 'week_start': week_start,
+                'week_end': week_start + timedelta(days=4), 'magic_token': f'token-{user_id}-{week}',
+                'total_co2': round(sum(co2), 2), 'total_distance': distance_km * 10,
+                'confirmed': int(rng.random() < 0.6), 'email_sent': 1,
+            })
+            for d, day in enumerate(DAYS):
+                tables['rse_daily_transports'].append({
+                    'weekly_data_id': weekly_id, 'date': week_start + timedelta(days=d),
+                    'day_name': DAY_NAMES[d], 'transport_mode': habits[day],
+                    'co2_total': round(co2[d], 3), 'distance_total': distance_km * 2,
+                })
+
+        # Offre récurrente pour une partie des automobilistes
+        car_days = [day for day in DAYS if habits[day] == 'voiture_solo']
+        if car_days and rng.random() < offer_ratio:
+            offer_id = len(tables['carpool_offers_recurrent']) + 1
+            route = wiggly_route(home, SITE_COORDS, 60, rng)
+            direct_s = distance_km * 1000 / 13.9
+            tables['carpool_offers_recurrent'].append({
+                'id': offer_id, 'company_id': company_id, 'site_id': site_id,
+                'departure': address, 'destination': 'Siège',
+                'departure_coords': json.dumps(home), 'destination_coords': json.dumps(list(SITE_COORDS)),
+                'recurrent_time': '08:30:00', 'time_return': '17:30:00',
+                **{day: int(day in car_days) for day in DAYS}, 'saturday': 0, 'sunday': 0,
+                'seats': 3, 'route_outbound': json.dumps(route), 'route_return': json.dumps(route[::-1]),
+                'max_detour_time': 25, 'driver_email': f'employe{i + 1}@bench.fr',
+                'driver_name': f'Employé {i + 1}', 'driver_phone': '0600000000',
+                'direct_duration_outbound': direct_s, 'direct_distance_outbound': distance_km * 1000,
+                'direct_duration_return': direct_s, 'direct_distance_return': distance_km * 1000,
+                'status': 'active',
+            })
+            # Une réservation confirmée sur la moitié des offres
+            if rng.random() < 0.5:
+                pickup = route[len(route) // 3]
+                tables['carpool_reservations_recurrent'].append({
+                    'offer_id': offer_id, 'passenger_email': f'passager{offer_id}@bench.fr',
+                    'passenger_name': f'Passager {offer_id}', 'passengers': 1,
+                    **{day: int(day in car_days) for day in DAYS}, 'saturday': 0, 'sunday': 0,
+                    'trip_type': 'both', 'meeting_point_coords': json.dumps(pickup),
+                    'meeting_point_address': 'Point de rencontre',
+                    'detour_time_outbound': 4, 'detour_time_return': 4, 'status': 'confirmed',
+                })
+
+    return tables
+
+
+def passenger_queries(n: int, seed: int = 7) -> List[List[float]]:
+    """Points de départ de passagers pour la recherche d'offres"""
+    rng = np.random.default_rng(seed)
+    return [offset_point(SITE_COORDS, *offset) for offset in home_points(n, rng)]
+
+
+def long_route(n_points: int = 400, seed: int = 3) -> List[List[float]]:
+    """Route d'environ 40 km vers le site (entrée de create_temporal_buffer)"""
+    rng = np.random.default_rng(seed)
+    return wiggly_route(offset_point(SITE_COORDS, -30.0, 25.0), SITE_COORDS, n_points, rng)
@@ -0,0 +1,188 @@
+"""
+Affectation conducteurs/passagers pour les suggestions de covoiturage RSE.
+
+À partir de toutes les paires faisables (détour calculé par le matcher), on
+construit un plan global pour l'entreprise :
+- chaque passager est affecté à au plus un conducteur
+- un conducteur ne prend pas plus de passagers que de places
+- la somme des détours d'un conducteur reste dans son budget
+- un utilisateur est soit conducteur, soit passager dans le plan
+
+Jusqu'à CARETTE_CARPOOL_ASSIGNMENT_MAX_USERS utilisateurs, les paires sont
+choisies par affectation optimale (algorithme hongrois, une colonne par
+place de conducteur) puis rendues faisables par une passe gloutonne, et
+le meilleur des deux plans (optimal réparé / glouton) est gardé ; au-delà,
+seule la passe gloutonne (meilleur gain d'abord) est utilisée.
+"""
+
+import logging
+import os
+from typing import Dict, List, Tuple
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DRIVER_SEATS = int(os.getenv('CARETTE_CARPOOL_DEFAULT_SEATS', '3'))
+# Même budget par défaut que les offres récurrentes (max_detour_time)
+DEFAULT_DETOUR_BUDGET = float(os.getenv('CARETTE_CARPOOL_DEFAULT_DETOUR_BUDGET', '25'))
+ASSIGNMENT_MAX_USERS = int(os.getenv('CARETTE_CARPOOL_ASSIGNMENT_MAX_USERS', '1000'))
+
+# Pénalité (kg CO2 équivalent par minute de détour) pour départager les paires
+DETOUR_PENALTY = 0.01
+
+
+def pair_gain(match: Dict) -> float:
+    """Gain d'une paire : CO2 économisé par semaine, moins une pénalité de détour"""
+    return max(match['co2_saved_week'] - DETOUR_PENALTY * match['detour_minutes'], 1e-6)
+
+
+def driver_limits(driver_id: int, constraints: Dict[int, Dict]) -> Tuple[int, float]:
+    """(places, budget de détour en minutes) d'un conducteur"""
+    limits = constraints.get(driver_id, {})
+    return (int(limits.get('seats') or DEFAULT_DRIVER_SEATS),
+            float(limits.get('detour_budget') or DEFAULT_DETOUR_BUDGET))
+
+
+def greedy_assign(edges: List[Dict], constraints: Dict[int, Dict]) -> List[Dict]:
+    """
+    Affecte les paires dans l'ordre donné, en sautant celles qui violent une
+    contrainte (places, budget, passager déjà placé, rôle déjà pris).
+    """
+    plan = []
+    seats_used = {}
+    detour_used = {}
+    passengers = set()
+    drivers = set()
+
+    for match in edges:
+        driver_id, passenger_id = match['driver_id'], match['passenger_id']
+        if passenger_id in passengers or passenger_id in drivers or driver_id in passengers:
+            continue
+
+        seats, budget = driver_limits(driver_id, constraints)
+        if seats_used.get(driver_id, 0) >= seats:
+            continue
+        if detour_used.get(driver_id, 0.0) + match['detour_minutes'] > budget:
+            continue
+
+        plan.append(match)
+        seats_used[driver_id] = seats_used.get(driver_id, 0) + 1
+        detour_used[driver_id] = detour_used.get(driver_id, 0.0) + match['detour_minutes']
+        passengers.add(passenger_id)
+        drivers.add(driver_id)
+
+    return plan
+
+
+def optimal_pairs(edges: List[Dict], constraints: Dict[int, Dict]) -> List[Dict]:
+    """
+    Paires retenues par l'affectation optimale passagers × places conducteurs
+    (maximise le gain total). Le budget de détour et l'exclusivité des rôles
+    sont ensuite garantis par greedy_assign.
+    """
+    passenger_ids = sorted({m['passenger_id'] for m in edges})
+    passenger_row = {pid: i for i, pid in enumerate(passenger_ids)}
+
+    # Une colonne par place utile de chaque conducteur
+    edges_by_driver = {}
+    for match in edges:
+        edges_by_driver.setdefault(match['driver_id'], []).append(match)
+    slot_driver = []
+    for driver_id, driver_edges in edges_by_driver.items():
+        seats, _ = driver_limits(driver_id, constraints)
+        slot_driver.extend([driver_id] * min(seats, len(driver_edges)))
+
+    driver_slots = {}
+    for col, driver_id in enumerate(slot_driver):
+        driver_slots.setdefault(driver_id, []).append(col)
+
+    weights = np.zeros((len(passenger_ids), len(slot_driver)))
+    for driver_id, driver_edges in edges_by_driver.items():
+        cols = driver_slots[driver_id]
+        for match in driver_edges:
+            weights[passenger_row[match['passenger_id']], cols] = pair_gain(match)
+
+    rows, cols = linear_sum_assignment(weights, maximize=True)
+
+    selected = set()
+    for row, col in zip(rows, cols):
+        if weights[row, col] > 0:
+            selected.add((slot_driver[col], passenger_ids[row]))
+    return [m for m in edges if (m['driver_id'], m['passenger_id']) in selected]
+
+
+def assign_carpools(matches: List[Dict], constraints: Dict[int, Dict]) -> List[Dict]:
+    """
+    Plan de covoiturage global d'une entreprise.
+
+    Args:
+        matches: Paires faisables (format find_carpool_matches_for_company)
+        constraints: driver_id → {'seats': int, 'detour_budget': minutes}
+                     (défauts : DEFAULT_DRIVER_SEATS / DEFAULT_DETOUR_BUDGET)
+
+    Returns:
+        Sous-ensemble des matches formant le plan, trié par détour croissant
+    """
+    edges = []
+    for match in matches:
+        _, budget = driver_limits(match['driver_id'], constraints)
+        if match['driver_id'] != match['passenger_id'] and match['detour_minutes'] <= budget:
+            edges.append(match)
+    if not edges:
+        return []
+
+    by_gain = sorted(edges, key=pair_gain, reverse=True)
+    plan = greedy_assign(by_gain, constraints)
+    users = {m['driver_id'] for m in edges} | {m['passenger_id'] for m in edges}
+
+    if len(users) <= ASSIGNMENT_MAX_USERS:
+        try:
+            chosen = optimal_pairs(edges, constraints)
+            chosen_keys = {(m['driver_id'], m['passenger_id']) for m in chosen}
+            # Paires optimales d'abord, puis les autres pour combler les places restantes
+            ordered = sorted(chosen, key=pair_gain, reverse=True) + [
+                m for m in by_gain if (m['driver_id'], m['passenger_id']) not in chosen_keys
+            ]
+            optimal_plan = greedy_assign(ordered, constraints)
+            # La réparation des rôles peut coûter plus que l'optimum n'apporte
+            if sum(map(pair_gain, optimal_plan)) > sum(map(pair_gain, plan)):
+                plan = optimal_plan
+        except Exception as e:
+            logger.warning(f"⚠️ Affectation optimale échouée, repli glouton: {e}")
+
+    plan.sort(key=lambda m: (m['detour_minutes'], m['driver_id'], m['passenger_id']))
+    return plan
+
+
+def build_plan_index(matches: List[Dict], plan: List[Dict], constraints: Dict[int, Dict]) -> Dict[int, List[Dict]]:
+    """
+    Index user_id → matches à suggérer : d'abord ses paires du plan, puis en
+    repli les paires vers un conducteur qui a encore de la place (pour les
+    passagers non placés), triées par détour croissant.
+    """
+    index = {}
+    for match in plan:
+        index.setdefault(match['driver_id'], []).append(match)
+        index.setdefault(match['passenger_id'], []).append(match)
+
+    planned = {(m['driver_id'], m['passenger_id']) for m in plan}
+    placed_passengers = {m['passenger_id'] for m in plan}
+    seats_used = {}
+    for match in plan:
+        seats_used[match['driver_id']] = seats_used.get(match['driver_id'], 0) + 1
+
+    for match in matches:
+        driver_id, passenger_id = match['driver_id'], match['passenger_id']
+        if (driver_id, passenger_id) in planned or passenger_id in placed_passengers:
+            continue
+        if driver_id in placed_passengers:
+            continue
+        seats, _ = driver_limits(driver_id, constraints)
+        if seats_used.get(driver_id, 0) >= seats:
+            continue
+        index.setdefault(driver_id, []).append(match)
+        index.setdefault(passenger_id, []).append(match)
+
+    return index
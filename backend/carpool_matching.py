@@ -9,81 +9,21 @@ import json
 import logging
 from typing import List, Dict, Optional, Tuple
 from datetime import datetime
-import requests
+import numpy as np
+
+import geocoding
+import osrm_client
+import rate_scheduler
+from carpool_assignment import assign_carpools, build_plan_index
 
 logger = logging.getLogger(__name__)
 
 # Facteur CO2 voiture solo (kg/km)
 CO2_VOITURE_SOLO = 0.220
 
-
-def get_coords_from_cache(address: str, cur) -> Optional[Tuple[float, float]]:
-    """
-    Récupère les coordonnées d'une adresse depuis le cache de géocodage.
-    
-    Returns:
-        Tuple (lon, lat) ou None si non trouvé
-    """
-    if not address:
-        return None
-    
-    cur.execute("""
-        SELECT latitude, longitude 
-        FROM geocoding_cache 
-        WHERE address = %s
-    """, (address,))
-    
-    result = cur.fetchone()
-    if result and result['latitude'] and result['longitude']:
-        return (float(result['longitude']), float(result['latitude']))
-    
-    return None
-
-
-def geocode_and_cache(address: str, cur) -> Optional[Tuple[float, float]]:
-    """
-    Géocode une adresse via Nominatim et la met en cache.
-    
-    Returns:
-        Tuple (lon, lat) ou None si échec
-    """
-    if not address:
-        return None
-    
-    # Vérifier le cache d'abord
-    cached = get_coords_from_cache(address, cur)
-    if cached:
-        return cached
-    
-    try:
-        # Appel Nominatim
-        url = f"https://nominatim.openstreetmap.org/search"
-        params = {
-            'q': address,
-            'format': 'json',
-            'limit': 1,
-            'countrycodes': 'fr'
-        }
-        headers = {'User-Agent': 'Carette-RSE/1.0'}
-        
-        response = requests.get(url, params=params, headers=headers, timeout=5)
-        if response.ok and response.json():
-            result = response.json()[0]
-            lat = float(result['lat'])
-            lon = float(result['lon'])
-            
-            # Mettre en cache
-            cur.execute("""
-                INSERT INTO geocoding_cache (address, latitude, longitude)
-                VALUES (%s, %s, %s)
-                ON DUPLICATE KEY UPDATE latitude = %s, longitude = %s
-            """, (address, lat, lon, lat, lon))
-            
-            return (lon, lat)
-    except Exception as e:
-        logger.warning(f"Geocoding failed for {address}: {e}")
-    
-    return None
+# Détour maximum des suggestions stockées dans rse_carpool_suggestions
+# (les lectures avec un détour plus court filtrent simplement)
+SUGGESTIONS_MAX_DETOUR = 20
 
 
 def get_route_duration_osrm(start: Tuple[float, float], end: Tuple[float, float]) -> Optional[float]:
@@ -93,18 +33,10 @@ def get_route_duration_osrm(start: Tuple[float, float], end: Tuple[float, float]
     Returns:
         Durée en minutes ou None si erreur
     """
-    try:
-        url = f"https://router.project-osrm.org/route/v1/driving/{start[0]},{start[1]};{end[0]},{end[1]}?overview=false"
-        response = requests.get(url, timeout=5)
-        
-        if response.ok:
-            data = response.json()
-            if data.get('code') == 'Ok' and data.get('routes'):
-                return data['routes'][0]['duration'] / 60  # en minutes
-    except Exception as e:
-        logger.warning(f"OSRM error: {e}")
-    
-    return None
+    duration = osrm_client.route_duration([start, end])
+    if duration is None:
+        return None
+    return duration / 60  # en minutes
 
 
 def calculate_detour_duration(
@@ -121,52 +53,45 @@ def calculate_detour_duration(
     Returns:
         Dict avec {detour_minutes, total_duration, direct_duration} ou None
     """
-    try:
-        # Trajet direct
-        direct_url = f"https://router.project-osrm.org/route/v1/driving/{driver_home[0]},{driver_home[1]};{destination[0]},{destination[1]}?overview=false"
-        direct_resp = requests.get(direct_url, timeout=5)
-        
-        if not direct_resp.ok:
-            return None
-        
-        direct_data = direct_resp.json()
-        if direct_data.get('code') != 'Ok' or not direct_data.get('routes'):
-            return None
-        
-        direct_duration = direct_data['routes'][0]['duration'] / 60
-        
-        # Trajet avec détour
-        detour_url = f"https://router.project-osrm.org/route/v1/driving/{driver_home[0]},{driver_home[1]};{passenger_home[0]},{passenger_home[1]};{destination[0]},{destination[1]}?overview=false"
-        detour_resp = requests.get(detour_url, timeout=5)
-        
-        if not detour_resp.ok:
-            return None
-        
-        detour_data = detour_resp.json()
-        if detour_data.get('code') != 'Ok' or not detour_data.get('routes'):
-            return None
-        
-        total_duration = detour_data['routes'][0]['duration'] / 60
-        detour_minutes = total_duration - direct_duration
-        
-        return {
-            'detour_minutes': detour_minutes,
-            'total_duration': total_duration,
-            'direct_duration': direct_duration
-        }
-        
-    except Exception as e:
-        logger.warning(f"Error calculating detour: {e}")
+    # Trajet direct
+    direct_duration = get_route_duration_osrm(driver_home, destination)
+    if direct_duration is None:
+        return None
+    
+    # Trajet avec détour
+    total_duration = osrm_client.route_duration([driver_home, passenger_home, destination])
+    if total_duration is None:
         return None
+    
+    total_duration = total_duration / 60
+    detour_minutes = total_duration - direct_duration
+    
+    return {
+        'detour_minutes': detour_minutes,
+        'total_duration': total_duration,
+        'direct_duration': direct_duration
+    }
 
 
-def find_carpool_matches_for_company(company_id: int, cur, max_detour_minutes: int = 20) -> List[Dict]:
+@rate_scheduler.batch()
+def find_carpool_matches_for_company(company_id: int, cur, max_detour_minutes: int = 20,
+                                     focus_user_ids: Optional[List[int]] = None) -> List[Dict]:
     """
     Trouve les suggestions de covoiturage pour une entreprise.
     
     Pour chaque utilisateur qui utilise la voiture au moins 1 jour/semaine,
     cherche les collègues qui pourraient être récupérés avec un détour < max_detour.
     
+    Les durées sont obtenues en une matrice OSRM /table (domiciles + site)
+    puis tous les détours sont calculés d'un coup avec NumPy, au lieu de
+    deux appels /route par paire conducteur × passager.
+    
+    Avec focus_user_ids, seules les paires impliquant ces utilisateurs (comme
+    conducteur ou passager) sont calculées : les lignes/colonnes de la matrice
+    correspondantes suffisent (recalcul incrémental).
+    
+    Les appels OSRM/BAN/Nominatim passent en priorité BATCH (rate_scheduler).
+    
     Returns:
         Liste de matches: {driver, passenger, detour_minutes, co2_saved, common_days}
     """
@@ -184,7 +109,11 @@ def find_carpool_matches_for_company(company_id: int, cur, max_detour_minutes: i
         WHERE u.company_id = %s AND u.active = 1
     """, (company_id,))
     
-    users = cur.fetchall()
+    # Un utilisateur apparaît une fois par site actif : garder la première ligne
+    unique_users = {}
+    for user in cur.fetchall():
+        unique_users.setdefault(user['id'], user)
+    users = list(unique_users.values())
     
     if len(users) < 2:
         return []  # Pas assez d'utilisateurs pour matcher
@@ -217,71 +146,73 @@ def find_carpool_matches_for_company(company_id: int, cur, max_detour_minutes: i
     # Géocoder les adresses de départ
     user_coords = {}
     for user in users:
-        coords = geocode_and_cache(user['departure_address'], cur)
+        coords = geocoding.geocode(user['departure_address'], cur)
         if coords:
             user_coords[user['id']] = coords
     
-    # Pour chaque conducteur potentiel (au moins 1 jour en voiture)
-    for driver in users:
-        driver_id = driver['id']
-        driver_car_days = car_days.get(driver_id, [])
-        
-        if not driver_car_days or driver_id not in user_coords:
-            continue
+    # Seuls les utilisateurs géocodés et au moins 1 jour en voiture peuvent matcher
+    candidates = [u for u in users if car_days.get(u['id']) and u['id'] in user_coords]
+    if len(candidates) < 2:
+        return []
+    
+    # Matrice domicile↔domicile et domicile↔site (site = dernier indice)
+    points = [user_coords[u['id']] for u in candidates] + [destination_coords]
+    n = len(candidates)
+    site = n
+    if focus_user_ids is None:
+        durations = osrm_client.duration_matrix(points) / 60  # en minutes
+        focus = np.ones(n, dtype=bool)
+    else:
+        focus_ids = set(focus_user_ids)
+        focus = np.array([u['id'] in focus_ids for u in candidates])
+        if not focus.any():
+            return []
+        # Lignes focus → tous et colonnes tous → (focus + site) uniquement
+        focus_idx = list(np.flatnonzero(focus))
+        durations = np.full((n + 1, n + 1), np.nan)
+        durations[np.ix_(focus_idx, range(n))] = osrm_client.duration_matrix(points, focus_idx, range(n)) / 60
+        to_cols = focus_idx + [site]
+        durations[np.ix_(range(n), to_cols)] = osrm_client.duration_matrix(points, range(n), to_cols) / 60
+    
+    # détour[D, P] = d(D, P) + d(P, S) - d(D, S)
+    to_site = durations[:n, site]
+    detours = durations[:n, :n] + to_site[np.newaxis, :] - to_site[:, np.newaxis]
+    
+    # Jours en commun où le conducteur et le passager sont en voiture
+    day_names = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi']
+    days_matrix = np.array([[d in car_days[u['id']] for d in day_names] for u in candidates])
+    common = days_matrix[:, np.newaxis, :] & days_matrix[np.newaxis, :, :]
+    
+    with np.errstate(invalid='ignore'):
+        valid = (detours >= 0) & (detours <= max_detour_minutes) & common.any(axis=2)
+    valid &= focus[:, np.newaxis] | focus[np.newaxis, :]
+    np.fill_diagonal(valid, False)
+    
+    for d_idx, p_idx in np.argwhere(valid):
+        driver = candidates[d_idx]
+        passenger = candidates[p_idx]
+        common_days = [day_names[k] for k in np.flatnonzero(common[d_idx, p_idx])]
+        detour_minutes = float(detours[d_idx, p_idx])
         
-        driver_coords = user_coords[driver_id]
+        # Calculer le CO2 économisé si covoiturage
+        # Le passager n'utilise plus sa voiture solo → économie de son trajet
+        passenger_distance = float(passenger['distance_km'] or 30)
+        co2_saved_per_day = passenger_distance * 2 * CO2_VOITURE_SOLO  # Aller-retour
+        co2_saved_week = co2_saved_per_day * len(common_days)
         
-        # Chercher des passagers potentiels
-        for passenger in users:
-            if passenger['id'] == driver_id:
-                continue
-            
-            if passenger['id'] not in user_coords:
-                continue
-            
-            passenger_coords = user_coords[passenger['id']]
-            passenger_car_days = car_days.get(passenger['id'], [])
-            
-            # Trouver les jours en commun où le conducteur est en voiture
-            # et le passager est en voiture (pourrait passer passager)
-            common_days = [d for d in driver_car_days if d in passenger_car_days]
-            
-            if not common_days:
-                continue
-            
-            # Calculer le détour
-            detour_info = calculate_detour_duration(
-                driver_coords,
-                passenger_coords,
-                destination_coords
-            )
-            
-            if not detour_info:
-                continue
-            
-            detour_minutes = detour_info['detour_minutes']
-            
-            # Vérifier si le détour est acceptable
-            if detour_minutes <= max_detour_minutes and detour_minutes >= 0:
-                # Calculer le CO2 économisé si covoiturage
-                # Le passager n'utilise plus sa voiture solo → économie de son trajet
-                passenger_distance = float(passenger['distance_km'] or 30)
-                co2_saved_per_day = passenger_distance * 2 * CO2_VOITURE_SOLO  # Aller-retour
-                co2_saved_week = co2_saved_per_day * len(common_days)
-                
-                matches.append({
-                    'driver_id': driver_id,
-                    'driver_name': driver['name'],
-                    'driver_email': driver['email'],
-                    'passenger_id': passenger['id'],
-                    'passenger_name': passenger['name'],
-                    'passenger_email': passenger['email'],
-                    'passenger_address': passenger['departure_address'],
-                    'detour_minutes': round(detour_minutes, 1),
-                    'common_days': common_days,
-                    'co2_saved_per_day': round(co2_saved_per_day, 2),
-                    'co2_saved_week': round(co2_saved_week, 2)
-                })
+        matches.append({
+            'driver_id': driver['id'],
+            'driver_name': driver['name'],
+            'driver_email': driver['email'],
+            'passenger_id': passenger['id'],
+            'passenger_name': passenger['name'],
+            'passenger_email': passenger['email'],
+            'passenger_address': passenger['departure_address'],
+            'detour_minutes': round(detour_minutes, 1),
+            'common_days': common_days,
+            'co2_saved_per_day': round(co2_saved_per_day, 2),
+            'co2_saved_week': round(co2_saved_week, 2)
+        })
     
     # Trier par détour le plus court
     matches.sort(key=lambda x: x['detour_minutes'])
@@ -289,7 +220,218 @@ def find_carpool_matches_for_company(company_id: int, cur, max_detour_minutes: i
     return matches
 
 
-def get_carpool_suggestions_for_user(user_id: int, company_id: int, cur, max_detour_minutes: int = 20) -> List[Dict]:
+def save_company_suggestions(company_id: int, matches: List[Dict], cur,
+                             user_ids: Optional[List[int]] = None):
+    """
+    Enregistre les matches dans rse_carpool_suggestions.
+    
+    Sans user_ids, toutes les suggestions de l'entreprise sont remplacées ;
+    sinon seules celles impliquant ces utilisateurs.
+    """
+    if user_ids is None:
+        cur.execute("DELETE FROM rse_carpool_suggestions WHERE company_id = %s", (company_id,))
+    elif user_ids:
+        placeholders = ','.join(['%s'] * len(user_ids))
+        cur.execute(f"""
+            DELETE FROM rse_carpool_suggestions
+            WHERE company_id = %s AND (driver_id IN ({placeholders}) OR passenger_id IN ({placeholders}))
+        """, (company_id, *user_ids, *user_ids))
+    
+    if not matches:
+        return
+    
+    cur.executemany("""
+        INSERT INTO rse_carpool_suggestions
+        (company_id, driver_id, passenger_id, detour_minutes, common_days, co2_saved_per_day, co2_saved_week)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE
+            company_id = VALUES(company_id),
+            detour_minutes = VALUES(detour_minutes),
+            common_days = VALUES(common_days),
+            co2_saved_per_day = VALUES(co2_saved_per_day),
+            co2_saved_week = VALUES(co2_saved_week),
+            computed_at = NOW()
+    """, [
+        (company_id, m['driver_id'], m['passenger_id'], m['detour_minutes'],
+         json.dumps(m['common_days']), m['co2_saved_per_day'], m['co2_saved_week'])
+        for m in matches
+    ])
+
+
+def load_company_matches(company_id: int, cur, max_detour_minutes: int = 20) -> List[Dict]:
+    """
+    Lit les suggestions stockées d'une entreprise (même format que
+    find_carpool_matches_for_company), triées par détour croissant.
+    """
+    cur.execute("""
+        SELECT s.driver_id, d.name AS driver_name, d.email AS driver_email,
+               s.passenger_id, p.name AS passenger_name, p.email AS passenger_email,
+               p.departure_address AS passenger_address,
+               s.detour_minutes, s.common_days, s.co2_saved_per_day, s.co2_saved_week
+        FROM rse_carpool_suggestions s
+        JOIN rse_users d ON d.id = s.driver_id AND d.active = 1
+        JOIN rse_users p ON p.id = s.passenger_id AND p.active = 1
+        WHERE s.company_id = %s AND s.detour_minutes <= %s
+        ORDER BY s.detour_minutes, s.driver_id, s.passenger_id
+    """, (company_id, max_detour_minutes))
+    
+    matches = []
+    for row in cur.fetchall():
+        match = dict(row)
+        if isinstance(match['common_days'], str):
+            match['common_days'] = json.loads(match['common_days'])
+        matches.append(match)
+    return matches
+
+
+def invalidate_user_suggestions(user_id: int, cur):
+    """
+    Invalide les suggestions d'un utilisateur (adresse, habitudes ou transports modifiés).
+    Elles seront recalculées pour lui seul au prochain refresh de son entreprise.
+    """
+    try:
+        cur.execute("SELECT company_id FROM rse_users WHERE id = %s", (user_id,))
+        user = cur.fetchone()
+        if not user or not user['company_id']:
+            return
+        
+        cur.execute("""
+            DELETE FROM rse_carpool_suggestions
+            WHERE driver_id = %s OR passenger_id = %s
+        """, (user_id, user_id))
+        cur.execute("""
+            INSERT INTO rse_carpool_suggestion_invalidations (company_id, user_id)
+            VALUES (%s, %s)
+        """, (user['company_id'], user_id))
+    except Exception as e:
+        logger.warning(f"⚠️ Invalidation suggestions covoiturage user {user_id} échouée: {e}")
+
+
+def invalidate_company_suggestions(company_id: int, cur):
+    """
+    Invalide toutes les suggestions d'une entreprise (site modifié).
+    Elles seront recalculées entièrement au prochain refresh.
+    """
+    try:
+        cur.execute("DELETE FROM rse_carpool_suggestions WHERE company_id = %s", (company_id,))
+        cur.execute("""
+            INSERT INTO rse_carpool_suggestion_invalidations (company_id, user_id)
+            VALUES (%s, NULL)
+        """, (company_id,))
+    except Exception as e:
+        logger.warning(f"⚠️ Invalidation suggestions covoiturage entreprise {company_id} échouée: {e}")
+
+
+def refresh_company_suggestions(company_id: int, cur, max_detour_minutes: int = SUGGESTIONS_MAX_DETOUR,
+                                force: bool = False) -> bool:
+    """
+    Met à jour rse_carpool_suggestions pour une entreprise si nécessaire.
+    
+    - Jamais calculée, site modifié, détour demandé plus grand ou force → recalcul complet
+    - Utilisateurs invalidés uniquement → recalcul de leurs paires seulement
+    - Rien d'invalidé → aucun calcul
+    
+    Returns:
+        True si un calcul a eu lieu
+    """
+    cur.execute("""
+        SELECT max_detour_minutes FROM rse_carpool_suggestion_state WHERE company_id = %s
+    """, (company_id,))
+    state = cur.fetchone()
+    
+    cur.execute("""
+        SELECT id, user_id FROM rse_carpool_suggestion_invalidations
+        WHERE company_id = %s ORDER BY id
+    """, (company_id,))
+    invalidations = cur.fetchall()
+    
+    if state and not invalidations and not force and state['max_detour_minutes'] >= max_detour_minutes:
+        return False
+    
+    max_detour_minutes = max(max_detour_minutes, state['max_detour_minutes'] if state else 0)
+    full = (force or not state or state['max_detour_minutes'] < max_detour_minutes
+            or any(inv['user_id'] is None for inv in invalidations))
+    
+    if full:
+        matches = find_carpool_matches_for_company(company_id, cur, max_detour_minutes)
+        save_company_suggestions(company_id, matches, cur)
+        logger.info(f"🔄 Suggestions covoiturage entreprise {company_id}: {len(matches)} match(es) (recalcul complet)")
+    else:
+        user_ids = sorted({inv['user_id'] for inv in invalidations})
+        matches = find_carpool_matches_for_company(company_id, cur, max_detour_minutes, focus_user_ids=user_ids)
+        save_company_suggestions(company_id, matches, cur, user_ids=user_ids)
+        logger.info(f"🔄 Suggestions covoiturage entreprise {company_id}: {len(matches)} match(es) "
+                    f"pour {len(user_ids)} utilisateur(s) modifié(s)")
+    
+    # Ne supprimer que les invalidations traitées (d'autres ont pu arriver entre-temps)
+    if invalidations:
+        cur.execute("""
+            DELETE FROM rse_carpool_suggestion_invalidations
+            WHERE company_id = %s AND id <= %s
+        """, (company_id, invalidations[-1]['id']))
+    
+    cur.execute("""
+        INSERT INTO rse_carpool_suggestion_state (company_id, max_detour_minutes, computed_at)
+        VALUES (%s, %s, NOW())
+        ON DUPLICATE KEY UPDATE max_detour_minutes = VALUES(max_detour_minutes), computed_at = NOW()
+    """, (company_id, max_detour_minutes))
+    return True
+
+
+def get_driver_constraints(company_id: int, cur) -> Dict[int, Dict]:
+    """
+    Places et budget de détour des conducteurs d'une entreprise, repris de
+    leur offre récurrente active (les autres gardent les valeurs par défaut).
+    
+    Returns:
+        Dict user_id → {'seats': int, 'detour_budget': minutes}
+    """
+    cur.execute("""
+        SELECT u.id AS user_id, MAX(o.seats) AS seats, MAX(o.max_detour_time) AS detour_budget
+        FROM rse_users u
+        JOIN carpool_offers_recurrent o ON o.driver_email = u.email
+            AND o.company_id = u.company_id AND o.status = 'active'
+        WHERE u.company_id = %s AND u.active = 1
+        GROUP BY u.id
+    """, (company_id,))
+    return {
+        row['user_id']: {'seats': row['seats'], 'detour_budget': row['detour_budget']}
+        for row in cur.fetchall()
+    }
+
+
+def get_company_match_index(company_id: int, cur, max_detour_minutes: int = 20,
+                            match_cache: Optional[Dict] = None) -> Dict[int, List[Dict]]:
+    """
+    Index des suggestions d'une entreprise, lu depuis rse_carpool_suggestions
+    (recalculé uniquement pour ce qui a été invalidé).
+    
+    Les paires sont ensuite réparties par un plan global (places, budget de
+    détour, un rôle par personne) : un conducteur populaire n'est plus
+    proposé à tout le monde.
+    
+    Args:
+        match_cache: Dict partagé par l'appelant le temps d'un traitement (ex: un
+                     envoi du récap hebdo) pour ne lire chaque entreprise qu'une fois.
+    """
+    cache_key = (company_id, max_detour_minutes)
+    if match_cache is not None and cache_key in match_cache:
+        return match_cache[cache_key]
+    
+    refresh_company_suggestions(company_id, cur, max(max_detour_minutes, SUGGESTIONS_MAX_DETOUR))
+    matches = load_company_matches(company_id, cur, max_detour_minutes)
+    constraints = get_driver_constraints(company_id, cur)
+    plan = assign_carpools(matches, constraints)
+    logger.info(f"🧩 Plan covoiturage entreprise {company_id}: {len(plan)} paire(s) sur {len(matches)} possible(s)")
+    
+    index = build_plan_index(matches, plan, constraints)
+    if match_cache is not None:
+        match_cache[cache_key] = index
+    return index
+
+
+def get_carpool_suggestions_for_user(user_id: int, company_id: int, cur, max_detour_minutes: int = 20,
+                                     match_cache: Optional[Dict] = None) -> List[Dict]:
     """
     Trouve les suggestions de covoiturage pour un utilisateur spécifique.
     
@@ -297,15 +439,18 @@ def get_carpool_suggestions_for_user(user_id: int, company_id: int, cur, max_det
     - Les personnes que cet utilisateur pourrait transporter (s'il est en voiture)
     - Les personnes qui pourraient le transporter (s'il est passager)
     
+    Les matches viennent de rse_carpool_suggestions ; avec match_cache, ils ne
+    sont lus qu'une fois par entreprise.
+    
     Returns:
         Liste de suggestions triées par pertinence
     """
-    all_matches = find_carpool_matches_for_company(company_id, cur, max_detour_minutes)
+    match_index = get_company_match_index(company_id, cur, max_detour_minutes, match_cache)
     
     # Filtrer pour cet utilisateur
     user_matches = []
     
-    for match in all_matches:
+    for match in match_index.get(user_id, []):
         if match['driver_id'] == user_id:
             # Cet utilisateur est conducteur
             user_matches.append({
@@ -277,11 +277,76 @@ def auto_confirm_rse_weeks():
         logger.error(f"❌ Erreur job auto-confirmation RSE: {e}", exc_info=True)
 
 
+def purge_route_cache():
+    """
+    Supprime les entrées expirées du cache de routes OSRM
+    
+    À lancer une fois par jour:
+    30 3 * * * cd /home/ubuntu/projects/carette/backend && python3 cron_jobs.py purge-route-cache
+    """
+    logger.info("🧹 Démarrage job: Purge du cache de routes OSRM")
+    
+    try:
+        import route_cache
+        deleted = route_cache.purge_expired()
+        logger.info(f"✅ {deleted} route(s) expirée(s) supprimée(s)")
+    except Exception as e:
+        logger.error(f"❌ Erreur job purge cache routes: {e}", exc_info=True)
+
+
+def purge_reverse_geocode_cache():
+    """
+    Supprime les entrées expirées du cache de géocodage inversé.
+    
+    À lancer chaque nuit à 3h45:
+    45 3 * * * cd /home/ubuntu/projects/carette/backend && python3 cron_jobs.py purge-reverse-geocode-cache
+    """
+    logger.info("🧹 Démarrage job: Purge du cache de géocodage inversé")
+    
+    try:
+        import reverse_geocoding
+        deleted = reverse_geocoding.purge_expired()
+        logger.info(f"✅ {deleted} case(s) expirée(s) supprimée(s)")
+    except Exception as e:
+        logger.error(f"❌ Erreur job purge cache géocodage inversé: {e}", exc_info=True)
+
+
+def refresh_carpool_suggestions():
+    """
+    Met à jour les suggestions de covoiturage (rse_carpool_suggestions) de
+    chaque entreprise active : seules les paires invalidées sont recalculées.
+    L'envoi du récap hebdo n'a ensuite plus qu'une lecture à faire.
+    
+    À lancer tous les vendredis à 15h (avant l'envoi de 16h):
+    0 15 * * 5 cd /home/ubuntu/projects/carette/backend && python3 cron_jobs.py refresh-carpool-suggestions
+    """
+    logger.info("🔄 Démarrage job: Mise à jour des suggestions de covoiturage")
+    
+    try:
+        from carpool_matching import refresh_company_suggestions
+        
+        with sql.db_cursor() as cur:
+            cur.execute("SELECT id, name FROM companies WHERE active = 1")
+            companies = cur.fetchall()
+            
+            refreshed = 0
+            for company in companies:
+                try:
+                    if refresh_company_suggestions(company['id'], cur):
+                        refreshed += 1
+                except Exception as e:
+                    logger.warning(f"   ⚠️ Entreprise {company['name']}: {e}")
+        
+        logger.info(f"✅ {refreshed}/{len(companies)} entreprise(s) recalculée(s)")
+    except Exception as e:
+        logger.error(f"❌ Erreur job suggestions covoiturage: {e}", exc_info=True)
+
+
 if __name__ == '__main__':
     import argparse
     
     parser = argparse.ArgumentParser(description='Cron jobs covoiturage et RSE')
-    parser.add_argument('job', choices=['expire', 'reminders', 'send-weekly-rse', 'auto-confirm-rse', 'all'], 
+    parser.add_argument('job', choices=['expire', 'reminders', 'send-weekly-rse', 'auto-confirm-rse', 'purge-route-cache', 'purge-reverse-geocode-cache', 'refresh-carpool-suggestions', 'all'], 
                        help='Job à exécuter')
     
     args = parser.parse_args()
@@ -294,6 +359,12 @@ if __name__ == '__main__':
         send_weekly_rse_recaps()
     elif args.job == 'auto-confirm-rse':
         auto_confirm_rse_weeks()
+    elif args.job == 'purge-route-cache':
+        purge_route_cache()
+    elif args.job == 'purge-reverse-geocode-cache':
+        purge_reverse_geocode_cache()
+    elif args.job == 'refresh-carpool-suggestions':
+        refresh_carpool_suggestions()
     elif args.job == 'all':
         expire_pending_reservations()
         send_24h_reminders()
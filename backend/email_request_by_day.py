@@ -51,7 +51,7 @@ def sort_pickups_geographically(start_coords: tuple, pickups: list, end_coords:
         return pickups
     
     # Pour chaque pickup, calculer le temps de trajet depuis le départ via OSRM
-    import requests
+    import osrm_client
     pickups_with_time = []
     
     for pickup in pickups:
@@ -61,27 +61,14 @@ def sort_pickups_geographically(start_coords: tuple, pickups: list, end_coords:
             pickups_with_time.append((pickup, float('inf')))
             continue
         
-        try:
-            # Calculer le temps départ → pickup via OSRM
-            url = f"https://router.project-osrm.org/route/v1/driving/{start_coords[0]},{start_coords[1]};{coords[0]},{coords[1]}?overview=false"
-            response = requests.get(url, timeout=3)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('code') == 'Ok' and data.get('routes'):
-                    duration_seconds = data['routes'][0]['duration']
-                    pickups_with_time.append((pickup, duration_seconds))
-                else:
-                    # Si OSRM échoue, utiliser haversine comme fallback
-                    dist = haversine_distance(start_coords, coords)
-                    pickups_with_time.append((pickup, dist * 1000))  # Multiplier pour que ce soit après les temps réels
-            else:
-                dist = haversine_distance(start_coords, coords)
-                pickups_with_time.append((pickup, dist * 1000))
-        except Exception:
-            # En cas d'erreur, utiliser haversine
+        # Calculer le temps départ → pickup via OSRM
+        duration_seconds = osrm_client.route_duration([start_coords, coords], timeout=3)
+        if duration_seconds is not None:
+            pickups_with_time.append((pickup, duration_seconds))
+        else:
+            # Si OSRM échoue, utiliser haversine comme fallback
             dist = haversine_distance(start_coords, coords)
-            pickups_with_time.append((pickup, dist * 1000))
+            pickups_with_time.append((pickup, dist * 1000))  # Multiplier pour que ce soit après les temps réels
     
     # Trier par temps croissant
     sorted_pickups = sorted(pickups_with_time, key=lambda x: x[1])
@@ -265,55 +252,47 @@ def generate_request_email_by_day(
     try:
         # Calculer le trajet direct sans passagers pour avoir les heures "originales"
         # On ne peut PAS utiliser route_outbound/route_return car ils contiennent les passagers existants
-        import requests
+        import osrm_client
         
         departure_coords = offer_data.get('departure_coords')
         destination_coords = offer_data.get('destination_coords')
         
         if departure_coords and destination_coords:
             # Trajet ALLER direct : home → bureau
-            coord_str_outbound = f"{departure_coords[0]},{departure_coords[1]};{destination_coords[0]},{destination_coords[1]}"
-            osrm_url_outbound = f"https://router.project-osrm.org/route/v1/driving/{coord_str_outbound}?overview=false"
-            resp_out = requests.get(osrm_url_outbound, timeout=5)
-            
-            if resp_out.status_code == 200:
-                data_out = resp_out.json()
-                if data_out.get('routes'):
-                    duration_direct_outbound_min = int(data_out['routes'][0]['duration'] / 60)
-                    # Convertir recurrent_time en datetime si c'est un timedelta
-                    if isinstance(offer_data['recurrent_time'], timedelta):
-                        total_sec = int(offer_data['recurrent_time'].total_seconds())
-                        hours = total_sec // 3600
-                        minutes = (total_sec % 3600) // 60
-                        recurrent_time = datetime.min.time().replace(hour=hours, minute=minutes)
-                    else:
-                        recurrent_time = offer_data['recurrent_time']
-                    
-                    arrival_outbound = datetime.combine(datetime.today(), recurrent_time)
-                    departure_outbound = arrival_outbound - timedelta(minutes=duration_direct_outbound_min)
-                    original_departure_time = departure_outbound.time()
+            duration_out = osrm_client.route_duration([departure_coords, destination_coords])
+            
+            if duration_out is not None:
+                duration_direct_outbound_min = int(duration_out / 60)
+                # Convertir recurrent_time en datetime si c'est un timedelta
+                if isinstance(offer_data['recurrent_time'], timedelta):
+                    total_sec = int(offer_data['recurrent_time'].total_seconds())
+                    hours = total_sec // 3600
+                    minutes = (total_sec % 3600) // 60
+                    recurrent_time = datetime.min.time().replace(hour=hours, minute=minutes)
+                else:
+                    recurrent_time = offer_data['recurrent_time']
+                
+                arrival_outbound = datetime.combine(datetime.today(), recurrent_time)
+                departure_outbound = arrival_outbound - timedelta(minutes=duration_direct_outbound_min)
+                original_departure_time = departure_outbound.time()
             
             # Trajet RETOUR direct : bureau → home
-            coord_str_return = f"{destination_coords[0]},{destination_coords[1]};{departure_coords[0]},{departure_coords[1]}"
-            osrm_url_return = f"https://router.project-osrm.org/route/v1/driving/{coord_str_return}?overview=false"
-            resp_ret = requests.get(osrm_url_return, timeout=5)
-            
-            if resp_ret.status_code == 200:
-                data_ret = resp_ret.json()
-                if data_ret.get('routes'):
-                    duration_direct_return_min = int(data_ret['routes'][0]['duration'] / 60)
-                    # Convertir time_return en datetime si c'est un timedelta
-                    if isinstance(offer_data['time_return'], timedelta):
-                        total_sec = int(offer_data['time_return'].total_seconds())
-                        hours = total_sec // 3600
-                        minutes = (total_sec % 3600) // 60
-                        time_return = datetime.min.time().replace(hour=hours, minute=minutes)
-                    else:
-                        time_return = offer_data['time_return']
-                    
-                    departure_return_dt = datetime.combine(datetime.today(), time_return)
-                    arrival_home_dt = departure_return_dt + timedelta(minutes=duration_direct_return_min)
-                    original_arrival_home_time = arrival_home_dt.time()
+            duration_ret = osrm_client.route_duration([destination_coords, departure_coords])
+            
+            if duration_ret is not None:
+                duration_direct_return_min = int(duration_ret / 60)
+                # Convertir time_return en datetime si c'est un timedelta
+                if isinstance(offer_data['time_return'], timedelta):
+                    total_sec = int(offer_data['time_return'].total_seconds())
+                    hours = total_sec // 3600
+                    minutes = (total_sec % 3600) // 60
+                    time_return = datetime.min.time().replace(hour=hours, minute=minutes)
+                else:
+                    time_return = offer_data['time_return']
+                
+                departure_return_dt = datetime.combine(datetime.today(), time_return)
+                arrival_home_dt = departure_return_dt + timedelta(minutes=duration_direct_return_min)
+                original_arrival_home_time = arrival_home_dt.time()
     except Exception as e:
         pass
     
@@ -11,6 +11,8 @@ import logging
 import os
 from pathlib import Path
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
 # Configuration SMTP (à déplacer dans .env en production)
@@ -22,6 +24,7 @@ FROM_EMAIL = os.getenv('FROM_EMAIL', 'Carette Covoiturage <noreply@carette.com>'
 FROM_NAME = os.getenv('FROM_NAME', 'Carette Covoiturage')
 
 
+@metrics.timed_smtp
 def send_email(
     to_email: str,
     subject: str,
@@ -2653,20 +2653,16 @@ def generate_recurrent_reservation_email(
         
         # Nouvelle heure de départ avec détour
         if pickup_time_outbound and detour_outbound:
-            import requests
+            import osrm_client
             departure_coords = offer_data['departure_coords']
             today = datetime.now().date()
             pickup_datetime = datetime.combine(today, pickup_time_outbound)
             
-            coord_str = f"{departure_coords[0]},{departure_coords[1]};{pickup_coords[0]},{pickup_coords[1]}"
-            osrm_url = f"https://router.project-osrm.org/route/v1/driving/{coord_str}"
-            resp = requests.get(osrm_url, timeout=5)
-            if resp.status_code == 200:
-                data = resp.json()
-                if data.get('routes'):
-                    home_to_pickup_duration = data['routes'][0]['duration'] / 60
-                    new_departure_datetime = pickup_datetime - timedelta(minutes=home_to_pickup_duration)
-                    new_departure_time = new_departure_datetime.time()
+            duration_s = osrm_client.route_duration([departure_coords, pickup_coords])
+            if duration_s is not None:
+                home_to_pickup_duration = duration_s / 60
+                new_departure_datetime = pickup_datetime - timedelta(minutes=home_to_pickup_duration)
+                new_departure_time = new_departure_datetime.time()
     except Exception as e:
         pass
     
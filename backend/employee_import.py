@@ -0,0 +1,288 @@
+"""
+Import d'employés par CSV (nom, email, adresse ; séparateur ; ou ,).
+
+- Le fichier téléversé est copié dans un fichier temporaire (en mémoire
+  jusqu'à 1 Mo) puis lu ligne à ligne, sans charger tout le CSV
+- Les emails déjà inscrits dans l'entreprise sont chargés en une requête
+- Les lignes valides sont traitées par lots de CARETTE_IMPORT_BATCH_SIZE :
+  emails pris par une autre entreprise écartés (une requête), géocodage
+  groupé (geocoding.geocode_batch, priorité BATCH) puis un seul INSERT
+  multi-lignes
+- Au-delà de CARETTE_IMPORT_ASYNC_ROWS lignes, l'import tourne en tâche de
+  fond : son avancement est suivi dans la table employee_import_jobs
+  (partagée entre workers gunicorn)
+- Un import synchrone ne réessaie une par une (Nominatim, 1 req/s) qu'au plus
+  CARETTE_IMPORT_SYNC_GEOCODE_FALLBACK_MAX adresses non trouvées par la BAN :
+  les autres restent sans coordonnées, géocodées plus tard à l'unité
+"""
+import codecs
+import csv
+import itertools
+import json
+import logging
+import os
+import secrets
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, IO, Iterator, List, Optional, Tuple
+
+import geocoding
+import rate_scheduler
+import sql
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = max(1, int(os.getenv('CARETTE_IMPORT_BATCH_SIZE', '500')))
+IMPORT_ASYNC_ROWS = int(os.getenv('CARETTE_IMPORT_ASYNC_ROWS', '200'))
+IMPORT_WORKERS = max(1, int(os.getenv('CARETTE_IMPORT_WORKERS', '2')))
+IMPORT_JOB_TIMEOUT = int(os.getenv('CARETTE_IMPORT_JOB_TIMEOUT', '1800'))  # s sans avancement → interrompu
+IMPORT_SYNC_GEOCODE_FALLBACK_MAX = int(os.getenv('CARETTE_IMPORT_SYNC_GEOCODE_FALLBACK_MAX', '3'))
+
+HEADER_NAMES = ('nom', 'name', 'prenom', 'prénom')
+SPOOL_MAX_SIZE = 1024 * 1024
+MAX_ERRORS_KEPT = 20
+
+_executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix='employee-import')
+
+
+# ============================================================================
+# Lecture du CSV
+# ============================================================================
+
+def spool_upload(stream: IO[bytes]) -> Tuple[IO[bytes], int]:
+    """Copie le fichier téléversé dans un fichier temporaire ; retourne (fichier, nombre de lignes)"""
+    spooled = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    shutil.copyfileobj(stream, spooled, 64 * 1024)
+    spooled.seek(0)
+    lines = 0
+    last = b'\n'
+    for chunk in iter(lambda: spooled.read(64 * 1024), b''):
+        lines += chunk.count(b'\n')
+        last = chunk[-1:]
+    if last != b'\n':
+        lines += 1
+    spooled.seek(0)
+    return spooled, lines
+
+
+def iter_rows(fileobj: IO[bytes]) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Lignes du CSV (numéro, colonnes), lues à la demande.
+    Séparateur ; (ou , si la première ligne n'en contient pas), en-tête ignoré.
+    Les numéros de ligne commencent à 1 après l'en-tête.
+    """
+    text = codecs.getreader('utf-8-sig')(fileobj)  # utf-8-sig pour gérer le BOM Excel
+    first_line = text.readline()
+    if not first_line:
+        return
+    first_row = next(csv.reader([first_line], delimiter=';'), [])
+    delimiter = ';' if len(first_row) > 1 else ','
+
+    reader = csv.reader(itertools.chain([first_line], text), delimiter=delimiter)
+    first = next(reader, None)
+    if first is None:
+        return
+    rows = reader if first and first[0].strip().lower() in HEADER_NAMES else itertools.chain([first], reader)
+    for i, row in enumerate(rows, 1):
+        if row:
+            yield i, row
+
+
+def parse_row(i: int, row: List[str]):
+    """(nom, email, adresse) d'une ligne, ou message d'erreur"""
+    if len(row) < 2:
+        return f"Ligne {i}: format invalide (min: nom, email)"
+
+    # Colonnes flexibles : 2 ou 3 colonnes
+    name = row[0].strip()
+    email = row[1].strip().lower()
+    address = row[2].strip() if len(row) > 2 else ''
+
+    if not name or not email:
+        return f"Ligne {i}: nom ou email manquant"
+    if '@' not in email:
+        return f"Ligne {i}: email invalide '{email}'"
+    return name, email, address
+
+
+# ============================================================================
+# Import
+# ============================================================================
+
+def _insert_batch(cur, company_id: int, batch: List[Tuple[int, str, str, str]], result: Dict,
+                  keep_imported: bool, geocode_fallback_max: Optional[int]):
+    """Géocode et insère un lot de lignes valides (numéro, nom, email, adresse)"""
+    # Email unique sur toute la table : écarter ceux d'autres entreprises (une requête par lot)
+    placeholders = ', '.join(['%s'] * len(batch))
+    cur.execute(f"SELECT email FROM rse_users WHERE email IN ({placeholders})",
+                [email for _, _, email, _ in batch])
+    taken = {row['email'].lower() for row in cur.fetchall()}
+    if taken:
+        for i, _, email, _ in batch:
+            if email in taken:
+                _add_error(result, f"Ligne {i}: {email} déjà inscrit")
+        batch = [row for row in batch if row[2] not in taken]
+        if not batch:
+            return
+
+    addresses = [address for _, _, _, address in batch if address]
+    geocoded = {}
+    if addresses:
+        try:
+            with rate_scheduler.batch():
+                geocoded = geocoding.geocode_batch(addresses, cur, fallback_max=geocode_fallback_max)
+        except Exception as e:
+            logger.warning(f"⚠️ Géocodage import échoué ({len(addresses)} adresses): {e}")
+
+    # Coordonnées dans geocoding_cache (jointure sur departure_address)
+    cur.executemany("""
+        INSERT INTO rse_users (company_id, name, email, departure_address, active)
+        VALUES (%s, %s, %s, %s, 1)
+    """, [(company_id, name, email, address or None) for _, name, email, address in batch])
+
+    result['imported_count'] += len(batch)
+    result['geocoded_count'] += sum(1 for *_, address in batch if geocoded.get(address) is not None)
+    if keep_imported:
+        result['imported'] += [{
+            'name': name,
+            'email': email,
+            'address': address or None,
+            'geocoded': geocoded.get(address) is not None,
+        } for _, name, email, address in batch]
+
+
+def _add_error(result: Dict, message: str):
+    result['errors_count'] += 1
+    if len(result['errors']) < MAX_ERRORS_KEPT:
+        result['errors'].append(message)
+
+
+def import_employees(company_id: int, fileobj: IO[bytes], cur,
+                     progress: Optional[Callable[[Dict], None]] = None, keep_imported: bool = True,
+                     geocode_fallback_max: Optional[int] = None) -> Dict:
+    """
+    Importe les employés d'un CSV dans rse_users.
+
+    Args:
+        progress: appelé avec le résultat partiel après chaque lot inséré
+        keep_imported: conserver le détail des employés importés (réponse synchrone)
+        geocode_fallback_max: adresses non trouvées par la BAN réessayées une
+            par une, par lot (défaut: geocoding.GEOCODE_BATCH_FALLBACK_MAX)
+
+    Returns:
+        {'processed_rows', 'imported_count', 'geocoded_count', 'errors_count',
+         'errors' (20 premières), 'imported'}
+    """
+    result = {'processed_rows': 0, 'imported_count': 0, 'geocoded_count': 0,
+              'errors_count': 0, 'errors': [], 'imported': []}
+
+    cur.execute("SELECT email FROM rse_users WHERE company_id = %s", (company_id,))
+    known_emails = {row['email'].lower() for row in cur.fetchall() if row['email']}
+
+    batch = []
+    for i, row in iter_rows(fileobj):
+        result['processed_rows'] += 1
+        parsed = parse_row(i, row)
+        if isinstance(parsed, str):
+            _add_error(result, parsed)
+            continue
+        name, email, address = parsed
+        if email in known_emails:
+            _add_error(result, f"Ligne {i}: {email} déjà inscrit")
+            continue
+        known_emails.add(email)
+        batch.append((i, name, email, address))
+
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            _insert_batch(cur, company_id, batch, result, keep_imported, geocode_fallback_max)
+            batch = []
+            if progress:
+                progress(result)
+
+    if batch:
+        _insert_batch(cur, company_id, batch, result, keep_imported, geocode_fallback_max)
+    if progress:
+        progress(result)
+    return result
+
+
+# ============================================================================
+# Tâches de fond
+# ============================================================================
+
+def _update_job(job_id: str, **fields):
+    assignments = ', '.join(f"{name} = %s" for name in fields)
+    with sql.db_cursor() as cur:
+        cur.execute(f"UPDATE employee_import_jobs SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = %s",
+                    (*fields.values(), job_id))
+
+
+def _report_progress(job_id: str, result: Dict):
+    _update_job(job_id, processed_rows=result['processed_rows'], imported_count=result['imported_count'],
+                errors_count=result['errors_count'])
+
+
+def _run_job(job_id: str, company_id: int, fileobj: IO[bytes]):
+    started = time.perf_counter()
+    try:
+        _update_job(job_id, status='running')
+        with sql.db_cursor() as cur:
+            result = import_employees(company_id, fileobj, cur,
+                                      progress=lambda partial: _report_progress(job_id, partial),
+                                      keep_imported=False)
+        _update_job(job_id, status='done', total_rows=result['processed_rows'],
+                    processed_rows=result['processed_rows'], imported_count=result['imported_count'],
+                    geocoded_count=result['geocoded_count'], errors_count=result['errors_count'],
+                    errors=json.dumps(result['errors'], ensure_ascii=False))
+        logger.info(f"📥 Import CSV {job_id}: {result['imported_count']} employés importés "
+                    f"(entreprise {company_id}, {time.perf_counter() - started:.1f}s)")
+    except Exception as e:
+        logger.error(f"❌ Import CSV {job_id} échoué: {e}", exc_info=True)
+        try:
+            _update_job(job_id, status='failed', error_message=str(e)[:500])
+        except Exception:
+            pass
+    finally:
+        fileobj.close()
+
+
+def start_job(company_id: int, fileobj: IO[bytes], total_rows: int) -> str:
+    """Lance l'import en tâche de fond ; retourne l'identifiant de la tâche"""
+    job_id = secrets.token_hex(16)
+    with sql.db_cursor() as cur:
+        cur.execute("""
+            INSERT INTO employee_import_jobs (id, company_id, status, total_rows)
+            VALUES (%s, %s, 'queued', %s)
+        """, (job_id, company_id, total_rows))
+    _executor.submit(_run_job, job_id, company_id, fileobj)
+    return job_id
+
+
+def get_job(company_id: int, job_id: str, cur) -> Optional[Dict]:
+    """État d'une tâche d'import de l'entreprise (None si inconnue)"""
+    cur.execute("""
+        SELECT id, status, total_rows, processed_rows, imported_count, geocoded_count,
+               errors_count, errors, error_message, created_at, updated_at,
+               UNIX_TIMESTAMP(updated_at) AS updated_ts
+        FROM employee_import_jobs
+        WHERE id = %s AND company_id = %s
+    """, (job_id, company_id))
+    job = cur.fetchone()
+    if not job:
+        return None
+
+    job = dict(job)
+    updated_ts = job.pop('updated_ts')
+    if job['status'] in ('queued', 'running') and updated_ts and time.time() - float(updated_ts) > IMPORT_JOB_TIMEOUT:
+        # Worker redémarré pendant l'import : la tâche ne progressera plus
+        job['status'] = 'failed'
+        job['error_message'] = 'Import interrompu'
+    if isinstance(job['errors'], str):
+        job['errors'] = json.loads(job['errors'])
+    job['errors'] = job['errors'] or []
+    total = job['total_rows'] or 0
+    job['progress'] = 1.0 if job['status'] == 'done' else (
+        round(min(job['processed_rows'] / total, 1.0), 3) if total else 0.0)
+    return job
@@ -0,0 +1,563 @@
+"""
+Service de géocodage unique (adresse → coordonnées).
+
+- Normalisation des adresses (casse, espaces, accents, ponctuation, type
+  de voie abrégé après le numéro, "st"/"ste", codes postaux "69 000" →
+  "69000") : deux graphies d'une même adresse partagent une seule entrée
+  de cache (après un changement de normalisation : migrate_address_keys.py)
+- Niveau 1 : LRU en mémoire du processus (CARETTE_GEOCODE_CACHE_SIZE)
+- Niveau 2 : table MySQL geocoding_cache (colonne address_key = adresse
+  normalisée ; chaque graphie brute a aussi sa ligne pour les jointures
+  sur rse_users.departure_address)
+- Cache négatif : une adresse introuvable n'est redemandée qu'après
+  CARETTE_GEOCODE_RETRY_AFTER secondes (les erreurs réseau ne sont pas cachées)
+- Fournisseurs : BAN (api-adresse.data.gouv.fr) puis Nominatim en secours
+  (CARETTE_GEOCODE_PROVIDERS)
+- Imports : geocode_batch() envoie les adresses absentes du cache au
+  géocodeur CSV de la BAN (/search/csv/), par lots de CARETTE_GEOCODE_BATCH_SIZE
+
+Les géocodages simultanés d'une même adresse normalisée partagent un seul
+appel (single_flight).
+"""
+import csv
+import io
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import rate_scheduler
+import single_flight
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_CACHE_SIZE = int(os.getenv('CARETTE_GEOCODE_CACHE_SIZE', '10000'))
+GEOCODE_RETRY_AFTER = int(os.getenv('CARETTE_GEOCODE_RETRY_AFTER', str(7 * 86400)))
+GEOCODE_PROVIDERS = [p.strip() for p in os.getenv('CARETTE_GEOCODE_PROVIDERS', 'ban,nominatim').split(',')
+                     if p.strip()]
+# Score BAN minimum (0-1) pour accepter un résultat sans passer à Nominatim
+GEOCODE_BAN_MIN_SCORE = float(os.getenv('CARETTE_GEOCODE_BAN_MIN_SCORE', '0.5'))
+# Géocodage en masse : lignes par fichier CSV envoyé à la BAN, adresses non
+# trouvées par la BAN redemandées une à une aux fournisseurs suivants (au plus)
+GEOCODE_BATCH_SIZE = int(os.getenv('CARETTE_GEOCODE_BATCH_SIZE', '1000'))
+GEOCODE_BATCH_FALLBACK_MAX = int(os.getenv('CARETTE_GEOCODE_BATCH_FALLBACK_MAX', '50'))
+
+BAN_URL = 'https://api-adresse.data.gouv.fr/search/'
+BAN_CSV_URL = 'https://api-adresse.data.gouv.fr/search/csv/'
+NOMINATIM_URL = 'https://nominatim.openstreetmap.org/search'
+USER_AGENT = 'Carette/1.0'
+
+# Nombre maximum de graphies brutes mémorisées par entrée (lignes déjà présentes en base)
+MAX_SPELLINGS = 8
+
+# Types de voie : développés seulement juste après le numéro (ou en tête d'adresse),
+# ailleurs ce sont des mots ordinaires ("route du lot", "chemin de ch")
+STREET_TYPES = {
+    'av': 'avenue', 'ave': 'avenue', 'bd': 'boulevard', 'bld': 'boulevard', 'blvd': 'boulevard',
+    'bvd': 'boulevard', 'ch': 'chemin', 'chem': 'chemin', 'crs': 'cours', 'fg': 'faubourg',
+    'fbg': 'faubourg', 'imp': 'impasse', 'pl': 'place', 'pte': 'porte', 'qu': 'quai',
+    'rte': 'route', 'r': 'rue', 'sq': 'square', 'all': 'allee', 'res': 'residence',
+    'lot': 'lotissement', 'zi': 'zone industrielle', 'za': 'zone artisanale',
+}
+# Abréviations développées partout ("12 rue st jean", "ste foy les lyon")
+ABBREVIATIONS = {'st': 'saint', 'ste': 'sainte'}
+# Indices de répétition après le numéro ("12 bis rue ...")
+NUMBER_SUFFIXES = {'bis', 'ter', 'quater'}
+
+_PUNCTUATION = re.compile(r"[^\w]+")
+_HOUSE_NUMBER = re.compile(r'^\d+[a-z]?$')
+_SPLIT_POSTCODE = re.compile(r'\b(\d{2}) (\d{3})\b')
+
+_NEGATIVE = None  # valeur mémorisée pour une adresse introuvable
+
+# clé normalisée → (coords (lon, lat) ou _NEGATIVE, expiration, graphies connues en base)
+_memory: "OrderedDict[str, Tuple[Optional[Tuple[float, float]], float, set]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {
+    'memory_hits': 0,
+    'negative_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+    'not_found': 0,
+    'errors': 0,
+    'aliases': 0,
+    'ban': 0,
+    'nominatim': 0,
+    'ban_csv_rows': 0,
+    'ban_csv_errors': 0,
+}
+_flights = single_flight.get_group('geocode')
+
+
+def normalize_address(address: str, partial: bool = False) -> str:
+    """
+    Forme canonique d'une adresse (clé de cache).
+    partial : dernier mot en cours de saisie, laissé tel quel (autocomplétion)
+    """
+    text = unicodedata.normalize('NFKD', address or '')
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    text = _PUNCTUATION.sub(' ', text).strip()
+    text = _SPLIT_POSTCODE.sub(r'\1\2', text)
+    words = text.split()
+    last = words.pop() if partial and words else None
+
+    # Position du type de voie : après le numéro et son indice éventuel
+    street = 0
+    if words and _HOUSE_NUMBER.match(words[0]):
+        street = 1
+        if street < len(words) and words[street] in NUMBER_SUFFIXES:
+            street += 1
+
+    words = [STREET_TYPES.get(word, ABBREVIATIONS.get(word, word)) if i == street
+             else ABBREVIATIONS.get(word, word)
+             for i, word in enumerate(words)]
+    return ' '.join(words + ([last] if last else []))
+
+
+def _incr(counter: str):
+    with _lock:
+        _stats[counter] += 1
+
+
+def _memory_get(key: str):
+    """(trouvé, coords ou _NEGATIVE, graphies connues)"""
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return False, None, None
+        coords, expires_at, spellings = entry
+        if expires_at < time.time():
+            del _memory[key]
+            return False, None, None
+        _memory.move_to_end(key)
+        return True, coords, spellings
+
+
+def _memory_set(key: str, coords, expires_at: float, spellings=()):
+    with _lock:
+        entry = _memory.get(key)
+        known = set(entry[2]) if entry is not None and entry[0] == coords else set()
+        for spelling in spellings:
+            if len(known) >= MAX_SPELLINGS:
+                break
+            known.add(spelling)
+        _memory[key] = (coords, expires_at, known)
+        _memory.move_to_end(key)
+        while len(_memory) > GEOCODE_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+# ============================================================================
+# Fournisseurs
+# ============================================================================
+
+def _geocode_ban(address: str) -> Optional[Tuple[float, float]]:
+    response = rate_scheduler.request(BAN_URL, params={'q': address, 'limit': 1},
+                                      headers={'User-Agent': USER_AGENT}, timeout=5)
+    response.raise_for_status()
+    features = response.json().get('features') or []
+    if not features or features[0].get('properties', {}).get('score', 0) < GEOCODE_BAN_MIN_SCORE:
+        return None
+    lon, lat = features[0]['geometry']['coordinates'][:2]
+    return float(lon), float(lat)
+
+
+def _geocode_nominatim(address: str) -> Optional[Tuple[float, float]]:
+    response = rate_scheduler.request(NOMINATIM_URL,
+                                      params={'q': address, 'format': 'json', 'limit': 1, 'countrycodes': 'fr'},
+                                      headers={'User-Agent': USER_AGENT}, timeout=5)
+    response.raise_for_status()
+    results = response.json()
+    if not results:
+        return None
+    return float(results[0]['lon']), float(results[0]['lat'])
+
+
+PROVIDERS = {'ban': _geocode_ban, 'nominatim': _geocode_nominatim}
+
+
+def geocode_upstream(address: str, providers: Optional[List[str]] = None):
+    """
+    Interroge les fournisseurs dans l'ordre (défaut: CARETTE_GEOCODE_PROVIDERS).
+
+    Returns:
+        ((lon, lat) ou None, source ou None, definitive) — definitive est False si
+        un fournisseur était injoignable (résultat négatif à ne pas mettre en cache)
+    """
+    definitive = True
+    for name in GEOCODE_PROVIDERS if providers is None else providers:
+        provider = PROVIDERS.get(name)
+        if provider is None:
+            continue
+        try:
+            coords = provider(address)
+        except Exception as e:
+            logger.warning(f"⚠️ Géocodage {name} indisponible pour '{address}': {e}")
+            definitive = False
+            continue
+        if coords is not None:
+            _incr(name)
+            return coords, name, True
+    return None, None, definitive
+
+
+def geocode_ban_csv(addresses: List[str]) -> List[Optional[Tuple[float, float]]]:
+    """
+    Géocode une liste d'adresses en une requête (géocodeur CSV de la BAN).
+
+    Returns:
+        Coordonnées (lon, lat) ou None, dans l'ordre des adresses
+
+    Raises:
+        requests.RequestException: BAN injoignable ou en erreur
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(['id', 'adresse'])
+    for i, address in enumerate(addresses):
+        writer.writerow([i, address])
+
+    response = rate_scheduler.request(
+        BAN_CSV_URL, method='POST',
+        files={'data': ('adresses.csv', buffer.getvalue().encode('utf-8'), 'text/csv')},
+        data={'columns': 'adresse'},
+        headers={'User-Agent': USER_AGENT},
+        timeout=max(30, len(addresses) / 20)
+    )
+    response.raise_for_status()
+
+    results: List[Optional[Tuple[float, float]]] = [None] * len(addresses)
+    text = response.content.decode('utf-8-sig')
+    delimiter = ';' if ';' in text.split('\n', 1)[0] else ','
+    for row in csv.DictReader(io.StringIO(text), delimiter=delimiter):
+        try:
+            index = int(row['id'])
+            score = float(row.get('result_score') or 0)
+            if score >= GEOCODE_BAN_MIN_SCORE and row.get('latitude') and row.get('longitude'):
+                results[index] = (float(row['longitude']), float(row['latitude']))
+        except (KeyError, ValueError, IndexError):
+            continue
+    return results
+
+
+# ============================================================================
+# Cache MySQL
+# ============================================================================
+
+def _db_get(cur, raw: str, key: str):
+    """(coords ou None, fin du cache négatif (timestamp) ou None, graphies présentes en base)"""
+    cur.execute("""
+        SELECT address, latitude, longitude, UNIX_TIMESTAMP(retry_after) AS retry_ts
+        FROM geocoding_cache
+        WHERE address_key = %s OR address = %s
+    """, (key, raw))
+    rows = cur.fetchall()
+    spellings = {row['address'] for row in rows}
+    for row in rows:
+        if row['latitude'] is not None and row['longitude'] is not None:
+            return (float(row['longitude']), float(row['latitude'])), None, spellings
+    negative = [float(row['retry_ts']) for row in rows if row['retry_ts'] is not None]
+    return None, (max(negative) if negative else None), spellings
+
+
+def _db_store(cur, raw: str, key: str, coords: Optional[Tuple[float, float]], source: Optional[str]):
+    if coords is not None:
+        cur.execute("""
+            INSERT INTO geocoding_cache (address, address_key, latitude, longitude, source, retry_after)
+            VALUES (%s, %s, %s, %s, %s, NULL)
+            ON DUPLICATE KEY UPDATE
+                address_key = VALUES(address_key),
+                latitude = VALUES(latitude),
+                longitude = VALUES(longitude),
+                source = VALUES(source),
+                retry_after = NULL,
+                geocoded_at = CURRENT_TIMESTAMP
+        """, (raw, key, coords[1], coords[0], source))
+    else:
+        cur.execute("""
+            INSERT INTO geocoding_cache (address, address_key, latitude, longitude, source, retry_after)
+            VALUES (%s, %s, NULL, NULL, NULL, NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE
+                address_key = VALUES(address_key),
+                retry_after = VALUES(retry_after),
+                geocoded_at = CURRENT_TIMESTAMP
+        """, (raw, key, GEOCODE_RETRY_AFTER))
+
+
+def _add_alias(cur, raw: str, key: str, coords: Tuple[float, float]):
+    """Ligne pour une nouvelle graphie d'une adresse déjà géocodée (sans appel externe)"""
+    try:
+        _db_store(cur, raw, key, coords, 'alias')
+        _incr('aliases')
+    except Exception as e:
+        logger.warning(f"⚠️ Cache géocodage: graphie '{raw}' non enregistrée: {e}")
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+def geocode(address: str, cur=None) -> Optional[Tuple[float, float]]:
+    """
+    Géocode une adresse (caches mémoire et MySQL, puis BAN / Nominatim).
+
+    Args:
+        address: Adresse libre
+        cur: Curseur DB (sql.db_cursor() ouvert si None)
+
+    Returns:
+        Tuple (lon, lat) ou None si introuvable
+    """
+    raw = (address or '').strip()
+    key = normalize_address(raw)
+    if not key:
+        return None
+
+    found, coords, spellings = _memory_get(key)
+    if found and (coords is _NEGATIVE or raw in spellings or cur is None):
+        _incr('negative_hits' if coords is _NEGATIVE else 'memory_hits')
+        return coords
+
+    if cur is None:
+        import sql
+        with sql.db_cursor() as new_cur:
+            return _flights.do(key, _lookup, raw, key, new_cur)
+    return _flights.do(key, _lookup, raw, key, cur)
+
+
+def _lookup(raw: str, key: str, cur) -> Optional[Tuple[float, float]]:
+    """Cache MySQL puis fournisseurs (voir geocode)"""
+    found, coords, spellings = _memory_get(key)
+    if found and coords is not _NEGATIVE:
+        # Entrée connue, seule la graphie brute manque en base
+        _incr('memory_hits')
+        _add_alias(cur, raw, key, coords)
+        _memory_set(key, coords, time.time() + GEOCODE_RETRY_AFTER, [raw])
+        return coords
+
+    try:
+        coords, retry_ts, spellings = _db_get(cur, raw, key)
+    except Exception as e:
+        logger.warning(f"⚠️ Cache géocodage illisible: {e}")
+        coords, retry_ts, spellings = None, None, set()
+
+    if coords is not None:
+        _incr('db_hits')
+        if raw not in spellings:
+            _add_alias(cur, raw, key, coords)
+            spellings.add(raw)
+        # Les coordonnées ne périment pas : l'expiration ne sert qu'au LRU
+        _memory_set(key, coords, time.time() + GEOCODE_RETRY_AFTER, spellings)
+        return coords
+    if retry_ts is not None and retry_ts > time.time():
+        _incr('negative_hits')
+        _memory_set(key, _NEGATIVE, retry_ts)
+        return None
+
+    _incr('misses')
+    coords, source, definitive = geocode_upstream(raw)
+    if coords is None and not definitive:
+        _incr('errors')
+        return None
+    if coords is None:
+        _incr('not_found')
+        logger.info(f"📍 Adresse introuvable: {raw} (nouvel essai dans {GEOCODE_RETRY_AFTER // 3600} h)")
+    else:
+        logger.info(f"📍 Géocodé ({source}): {raw} → {coords[1]}, {coords[0]}")
+
+    try:
+        _db_store(cur, raw, key, coords, source)
+    except Exception as e:
+        logger.warning(f"⚠️ Cache géocodage non enregistré pour '{raw}': {e}")
+    if coords is None:
+        _memory_set(key, _NEGATIVE, time.time() + GEOCODE_RETRY_AFTER)
+    else:
+        _memory_set(key, coords, time.time() + GEOCODE_RETRY_AFTER, [raw])
+    return coords
+
+
+def _db_get_many(cur, keys: List[str]) -> Dict[str, Dict]:
+    """Entrées MySQL par clé normalisée : {'coords', 'retry_ts', 'spellings'}"""
+    entries: Dict[str, Dict] = {}
+    for start in range(0, len(keys), 500):
+        chunk = keys[start:start + 500]
+        placeholders = ','.join(['%s'] * len(chunk))
+        cur.execute(f"""
+            SELECT address, address_key, latitude, longitude, UNIX_TIMESTAMP(retry_after) AS retry_ts
+            FROM geocoding_cache
+            WHERE address_key IN ({placeholders})
+        """, chunk)
+        for row in cur.fetchall():
+            entry = entries.setdefault(row['address_key'], {'coords': None, 'retry_ts': None, 'spellings': set()})
+            entry['spellings'].add(row['address'])
+            if row['latitude'] is not None and row['longitude'] is not None:
+                entry['coords'] = (float(row['longitude']), float(row['latitude']))
+            elif row['retry_ts'] is not None:
+                entry['retry_ts'] = max(entry['retry_ts'] or 0.0, float(row['retry_ts']))
+    return entries
+
+
+def _db_store_many(cur, rows: List[Tuple[str, str, Optional[Tuple[float, float]], Optional[str]]]):
+    """Enregistre des résultats (graphie, clé, coords ou None, source) en deux requêtes"""
+    found = [(raw, key, coords[1], coords[0], source) for raw, key, coords, source in rows if coords is not None]
+    missing = [(raw, key, GEOCODE_RETRY_AFTER) for raw, key, coords, _ in rows if coords is None]
+    if found:
+        cur.executemany("""
+            INSERT INTO geocoding_cache (address, address_key, latitude, longitude, source, retry_after)
+            VALUES (%s, %s, %s, %s, %s, NULL)
+            ON DUPLICATE KEY UPDATE
+                address_key = VALUES(address_key),
+                latitude = VALUES(latitude),
+                longitude = VALUES(longitude),
+                source = VALUES(source),
+                retry_after = NULL,
+                geocoded_at = CURRENT_TIMESTAMP
+        """, found)
+    if missing:
+        cur.executemany("""
+            INSERT INTO geocoding_cache (address, address_key, latitude, longitude, source, retry_after)
+            VALUES (%s, %s, NULL, NULL, NULL, NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE
+                address_key = VALUES(address_key),
+                retry_after = VALUES(retry_after),
+                geocoded_at = CURRENT_TIMESTAMP
+        """, missing)
+
+
+def geocode_batch(addresses: Iterable[str], cur,
+                  fallback_max: Optional[int] = None) -> Dict[str, Optional[Tuple[float, float]]]:
+    """
+    Géocode un lot d'adresses (import d'employés).
+
+    Les adresses en cache (mémoire puis MySQL, une requête par 500 clés) sont
+    résolues localement ; les autres sont envoyées au géocodeur CSV de la BAN
+    par lots de GEOCODE_BATCH_SIZE, puis au plus fallback_max (défaut:
+    GEOCODE_BATCH_FALLBACK_MAX) adresses non trouvées passent par les
+    fournisseurs suivants (Nominatim, une adresse par seconde).
+    Tous les résultats sont enregistrés dans geocoding_cache.
+
+    Returns:
+        {adresse telle que fournie: (lon, lat) ou None}
+    """
+    input_keys: Dict[str, str] = {}
+    by_key: Dict[str, List[str]] = {}  # clé normalisée → graphies brutes du lot
+    for address in addresses:
+        raw = (address or '').strip()
+        key = normalize_address(raw)
+        input_keys[address] = key
+        if key and raw not in by_key.setdefault(key, []):
+            by_key[key].append(raw)
+    resolved: Dict[str, Tuple[float, float]] = {}
+
+    # 1. Cache mémoire (graphies déjà connues en base seulement)
+    pending = []
+    for key, spellings in by_key.items():
+        found, coords, known = _memory_get(key)
+        if found and (coords is _NEGATIVE or all(raw in known for raw in spellings)):
+            _incr('negative_hits' if coords is _NEGATIVE else 'memory_hits')
+            if coords is not _NEGATIVE:
+                resolved[key] = coords
+        else:
+            pending.append(key)
+
+    # 2. Cache MySQL (+ lignes pour les nouvelles graphies)
+    try:
+        entries = _db_get_many(cur, pending)
+    except Exception as e:
+        logger.warning(f"⚠️ Cache géocodage illisible: {e}")
+        entries = {}
+    aliases, upstream = [], []
+    now = time.time()
+    for key in pending:
+        entry = entries.get(key)
+        if entry and entry['coords'] is not None:
+            _incr('db_hits')
+            aliases += [(raw, key, entry['coords'], 'alias') for raw in by_key[key] if raw not in entry['spellings']]
+            _memory_set(key, entry['coords'], now + GEOCODE_RETRY_AFTER, entry['spellings'] | set(by_key[key]))
+            resolved[key] = entry['coords']
+        elif entry and entry['retry_ts'] and entry['retry_ts'] > now:
+            _incr('negative_hits')
+            _memory_set(key, _NEGATIVE, entry['retry_ts'])
+        else:
+            _incr('misses')
+            upstream.append(key)
+
+    # 3. Géocodeur CSV de la BAN, puis fournisseurs suivants pour les adresses non trouvées
+    stored = []
+    not_found = []
+    unresolved = 0
+    if upstream and 'ban' in GEOCODE_PROVIDERS:
+        for start in range(0, len(upstream), GEOCODE_BATCH_SIZE):
+            chunk = upstream[start:start + GEOCODE_BATCH_SIZE]
+            try:
+                coords_list = geocode_ban_csv([by_key[key][0] for key in chunk])
+            except Exception as e:
+                logger.warning(f"⚠️ Géocodage CSV BAN indisponible ({len(chunk)} adresses): {e}")
+                _incr('ban_csv_errors')
+                unresolved += len(chunk)
+                continue
+            with _lock:
+                _stats['ban_csv_rows'] += len(chunk)
+            for key, coords in zip(chunk, coords_list):
+                if coords is None:
+                    not_found.append(key)
+                else:
+                    _incr('ban')
+                    stored.append((key, coords, 'ban'))
+    else:
+        not_found = upstream
+
+    fallback = [p for p in GEOCODE_PROVIDERS if p != 'ban'] if 'ban' in GEOCODE_PROVIDERS else None
+    fallback_max = GEOCODE_BATCH_FALLBACK_MAX if fallback_max is None else fallback_max
+    for i, key in enumerate(not_found):
+        if i >= fallback_max:
+            # Non mises en cache négatif : un prochain géocodage unitaire réessaiera
+            unresolved += len(not_found) - i
+            break
+        coords, source, definitive = geocode_upstream(by_key[key][0], fallback)
+        if coords is None and not definitive:
+            _incr('errors')
+            unresolved += 1
+            continue
+        if coords is None:
+            _incr('not_found')
+        stored.append((key, coords, source))
+
+    for key, coords, source in stored:
+        aliases += [(raw, key, coords, source) for raw in by_key[key]]
+        if coords is None:
+            _memory_set(key, _NEGATIVE, now + GEOCODE_RETRY_AFTER)
+        else:
+            _memory_set(key, coords, now + GEOCODE_RETRY_AFTER, by_key[key])
+            resolved[key] = coords
+    if aliases:
+        try:
+            _db_store_many(cur, aliases)
+        except Exception as e:
+            logger.warning(f"⚠️ Cache géocodage non enregistré ({len(aliases)} adresses): {e}")
+
+    logger.info(f"📍 Géocodage en masse: {len(by_key)} adresse(s), {len(by_key) - len(upstream)} en cache, "
+                f"{sum(1 for _, c, _ in stored if c is not None)} géocodée(s), "
+                f"{sum(1 for _, c, _ in stored if c is None)} introuvable(s), {unresolved} non traitée(s)")
+    return {address: resolved.get(key) for address, key in input_keys.items()}
+
+
+def clear_memory():
+    """Vide le niveau mémoire (les compteurs sont conservés)"""
+    with _lock:
+        _memory.clear()
+
+
+def get_stats() -> Dict:
+    """Compteurs hits/misses, appels par fournisseur et taux de succès du cache"""
+    with _lock:
+        stats = dict(_stats)
+        stats['memory_size'] = len(_memory)
+    lookups = stats['memory_hits'] + stats['negative_hits'] + stats['db_hits'] + stats['misses']
+    hits = stats['memory_hits'] + stats['negative_hits'] + stats['db_hits']
+    stats['hit_ratio'] = round(hits / lookups, 4) if lookups else 0.0
+    return stats
@@ -286,6 +286,10 @@ def init_carpool_tables():
                 driver_email VARCHAR(255),
                 driver_name VARCHAR(255),
                 driver_phone VARCHAR(50),
+                direct_duration_outbound DOUBLE DEFAULT NULL COMMENT 'secondes, domicile → site',
+                direct_distance_outbound DOUBLE DEFAULT NULL COMMENT 'mètres, domicile → site',
+                direct_duration_return DOUBLE DEFAULT NULL COMMENT 'secondes, site → domicile',
+                direct_distance_return DOUBLE DEFAULT NULL COMMENT 'mètres, site → domicile',
                 status ENUM('active', 'cancelled') DEFAULT 'active',
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                 FOREIGN KEY (company_id) REFERENCES companies(id) ON DELETE CASCADE,
@@ -298,6 +302,19 @@ def init_carpool_tables():
         """)
         print("  ✅ Table carpool_offers_recurrent créée/vérifiée")
         
+        # Trajets directs précalculés (si table existait déjà)
+        cur.execute("SHOW COLUMNS FROM carpool_offers_recurrent")
+        existing_cols = {row['Field'] for row in cur.fetchall()}
+        for col_name in ('direct_duration_outbound', 'direct_distance_outbound',
+                         'direct_duration_return', 'direct_distance_return'):
+            if col_name not in existing_cols:
+                try:
+                    cur.execute(f"ALTER TABLE carpool_offers_recurrent ADD COLUMN {col_name} DOUBLE DEFAULT NULL")
+                    print(f"    ➕ Colonne {col_name} ajoutée à carpool_offers_recurrent")
+                except Exception as e:
+                    if 'Duplicate column' not in str(e):
+                        raise
+        
         # Créer carpool_reservations_recurrent (mode récurrent)
         cur.execute("""
             CREATE TABLE IF NOT EXISTS carpool_reservations_recurrent (
@@ -670,13 +687,130 @@ def init_rse_weekly_tables():
         CREATE TABLE IF NOT EXISTS geocoding_cache (
             id INT AUTO_INCREMENT PRIMARY KEY,
             address VARCHAR(500) NOT NULL UNIQUE,
+            address_key VARCHAR(500) DEFAULT NULL,
             latitude DECIMAL(10, 8),
             longitude DECIMAL(11, 8),
+            source VARCHAR(20) DEFAULT NULL,
+            retry_after TIMESTAMP NULL DEFAULT NULL,
             geocoded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            INDEX idx_address (address)
+            INDEX idx_address (address),
+            INDEX idx_address_key (address_key)
         ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
         """)
+        
+        # Colonnes du service geocoding (adresse normalisée, source, cache négatif)
+        for col_name, col_def in [
+            ('address_key', "VARCHAR(500) DEFAULT NULL AFTER address, ADD INDEX idx_address_key (address_key)"),
+            ('source', "VARCHAR(20) DEFAULT NULL AFTER longitude"),
+            ('retry_after', "TIMESTAMP NULL DEFAULT NULL AFTER source"),
+        ]:
+            cur.execute(f"SHOW COLUMNS FROM geocoding_cache LIKE '{col_name}'")
+            if not cur.fetchone():
+                cur.execute(f"ALTER TABLE geocoding_cache ADD COLUMN {col_name} {col_def}")
+                print(f"  ➕ Colonne {col_name} ajoutée à geocoding_cache")
+        
+        # Adresses déjà en cache : calcul de la clé normalisée
+        cur.execute("SELECT id, address FROM geocoding_cache WHERE address_key IS NULL")
+        missing_keys = cur.fetchall()
+        if missing_keys:
+            from geocoding import normalize_address
+            cur.executemany(
+                "UPDATE geocoding_cache SET address_key = %s WHERE id = %s",
+                [(normalize_address(row['address']), row['id']) for row in missing_keys]
+            )
+            print(f"  🔑 {len(missing_keys)} adresse(s) du cache normalisée(s)")
         print("  ✅ Table geocoding_cache créée/vérifiée")
+        
+        # Table de cache des durées/distances OSRM (clé = coordonnées arrondies ~10 m)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS osrm_route_cache (
+            route_key CHAR(40) PRIMARY KEY COMMENT 'sha1 des coordonnées arrondies',
+            coords VARCHAR(1000) NOT NULL,
+            duration DOUBLE NOT NULL COMMENT 'secondes',
+            distance DOUBLE NOT NULL COMMENT 'mètres',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at DATETIME NOT NULL,
+            INDEX idx_expires_at (expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        print("  ✅ Table osrm_route_cache créée/vérifiée")
+        
+        # Cache du géocodage inversé (clé = case de la grille ~25 m)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS reverse_geocoding_cache (
+            cell_key VARCHAR(40) PRIMARY KEY COMMENT 'pas de grille:rangée:colonne',
+            longitude DOUBLE NOT NULL COMMENT 'centre de la case',
+            latitude DOUBLE NOT NULL,
+            response MEDIUMTEXT NOT NULL COMMENT 'réponse JSON Nominatim /reverse',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at DATETIME NOT NULL,
+            INDEX idx_expires_at (expires_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        print("  ✅ Table reverse_geocoding_cache créée/vérifiée")
+        
+        # Suggestions de covoiturage calculées par le matcher (lues par le récap hebdo)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rse_carpool_suggestions (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            company_id INT NOT NULL,
+            driver_id INT NOT NULL,
+            passenger_id INT NOT NULL,
+            detour_minutes DOUBLE NOT NULL,
+            common_days JSON NOT NULL COMMENT '["Lundi", ...]',
+            co2_saved_per_day DOUBLE NOT NULL,
+            co2_saved_week DOUBLE NOT NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY unique_pair (driver_id, passenger_id),
+            INDEX idx_company_detour (company_id, detour_minutes),
+            INDEX idx_passenger (passenger_id),
+            FOREIGN KEY (driver_id) REFERENCES rse_users(id) ON DELETE CASCADE,
+            FOREIGN KEY (passenger_id) REFERENCES rse_users(id) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        print("  ✅ Table rse_carpool_suggestions créée/vérifiée")
+        
+        # Dernier calcul des suggestions par entreprise
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rse_carpool_suggestion_state (
+            company_id INT PRIMARY KEY,
+            max_detour_minutes INT NOT NULL,
+            computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        print("  ✅ Table rse_carpool_suggestion_state créée/vérifiée")
+        
+        # Invalidations en attente (user_id NULL = toute l'entreprise, ex: site modifié)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rse_carpool_suggestion_invalidations (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            company_id INT NOT NULL,
+            user_id INT DEFAULT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_company (company_id)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        print("  ✅ Table rse_carpool_suggestion_invalidations créée/vérifiée")
+        
+        # Imports CSV d'employés en tâche de fond (avancement lu par tous les workers)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS employee_import_jobs (
+            id CHAR(32) PRIMARY KEY,
+            company_id INT NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'queued' COMMENT 'queued, running, done, failed',
+            total_rows INT DEFAULT NULL COMMENT 'Lignes du fichier (estimation avant la fin)',
+            processed_rows INT NOT NULL DEFAULT 0,
+            imported_count INT NOT NULL DEFAULT 0,
+            geocoded_count INT NOT NULL DEFAULT 0,
+            errors_count INT NOT NULL DEFAULT 0,
+            errors JSON DEFAULT NULL COMMENT '20 premières erreurs',
+            error_message VARCHAR(500) DEFAULT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_company_created (company_id, created_at)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci
+        """)
+        print("  ✅ Table employee_import_jobs créée/vérifiée")
     
     print("✅ Initialisation des tables RSE terminée")
 
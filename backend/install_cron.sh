@@ -25,12 +25,21 @@ cat >> $CRON_FILE << EOF
 
 # ========== Carette RSE - Cron Jobs ==========
 
+# Mettre à jour les suggestions de covoiturage avant le récap (tous les vendredis à 15h)
+0 15 * * 5 cd $BACKEND_DIR && $PYTHON_BIN cron_jobs.py refresh-carpool-suggestions >> /var/log/carette_cron.log 2>&1
+
 # Envoyer récap RSE hebdomadaire (tous les vendredis à 16h)
 0 16 * * 5 cd $BACKEND_DIR && $PYTHON_BIN cron_jobs.py send-weekly-rse >> /var/log/carette_cron.log 2>&1
 
 # Auto-confirmer les semaines RSE non confirmées >7 jours (tous les jours à 2h)
 0 2 * * * cd $BACKEND_DIR && $PYTHON_BIN cron_jobs.py auto-confirm-rse >> /var/log/carette_cron.log 2>&1
 
+# Purger le cache de routes OSRM expiré (tous les jours à 3h30)
+30 3 * * * cd $BACKEND_DIR && $PYTHON_BIN cron_jobs.py purge-route-cache >> /var/log/carette_cron.log 2>&1
+
+# Purger le cache de géocodage inversé expiré (tous les jours à 3h45)
+45 3 * * * cd $BACKEND_DIR && $PYTHON_BIN cron_jobs.py purge-reverse-geocode-cache >> /var/log/carette_cron.log 2>&1
+
 # ======================================================
 
 EOF
@@ -41,7 +50,7 @@ rm $CRON_FILE
 
 echo "✅ Cron jobs installés:"
 echo ""
-crontab -l | grep -A 15 "Carette"
+crontab -l | grep -A 18 "Carette"
 echo ""
 echo "📝 Logs disponibles dans: /var/log/carette_cron.log"
 echo ""
@@ -51,4 +60,7 @@ echo "  python3 cron_jobs.py expire           # Expirer demandes >24h"
 echo "  python3 cron_jobs.py reminders        # Envoyer rappels J-1"
 echo "  python3 cron_jobs.py send-weekly-rse  # Envoyer récaps RSE hebdo"
 echo "  python3 cron_jobs.py auto-confirm-rse # Auto-confirmer semaines RSE >7j"
+echo "  python3 cron_jobs.py purge-route-cache # Purger le cache de routes OSRM"
+echo "  python3 cron_jobs.py purge-reverse-geocode-cache # Purger le cache de géocodage inversé"
+echo "  python3 cron_jobs.py refresh-carpool-suggestions # Recalculer les suggestions covoiturage invalidées"
 echo "  python3 cron_jobs.py all              # Exécuter tous les jobs"
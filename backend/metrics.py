@@ -0,0 +1,424 @@
+"""
+Instrumentation des requêtes et exposition Prometheus (/metrics).
+
+Mesures collectées :
+- latence par endpoint Flask (histogramme, par règle de route, méthode et statut)
+- requêtes SQL par requête HTTP : nombre et temps cumulé (sql.db_cursor)
+- appels OSRM / BAN / Nominatim : nombre et latence (rate_scheduler.request)
+- envoi SMTP : durée et résultat (email_sender.send_email)
+- caches et files : route_cache, single_flight, rate_scheduler, serveurs OSRM,
+  pool MySQL (lus dans leurs get_stats() au moment de l'export)
+
+Les temps d'une requête HTTP sont cumulés dans un compteur propre à la
+requête ; les tâches lancées dans des pools de threads y sont rattachées par
+bind(). En mode debug, le résumé est renvoyé dans l'en-tête Server-Timing
+(visible dans l'onglet réseau du navigateur).
+
+Les compteurs sont propres à chaque processus (un worker gunicorn par cible
+de collecte, ou agrégation côté Prometheus).
+"""
+import bisect
+import functools
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv('CARETTE_METRICS', 'true').lower() == 'true'
+# Jeton exigé sur /metrics (en-tête Authorization: Bearer <jeton>), vide = accès libre
+METRICS_TOKEN = os.getenv('CARETTE_METRICS_TOKEN', '')
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+INF_LABEL = 'le="+Inf"'
+OSRM_PATH = re.compile(r'/(route|table|nearest|trip|match)/v1/')
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Compteur monotone avec étiquettes"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Histogramme cumulatif (seaux fixes) avec étiquettes"""
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series: Dict[Tuple, list] = {}  # étiquettes → [comptes par seau..., somme, total]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._series.items())
+        for label_values, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, label_values, INF_LABEL)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, label_values)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, label_values)} {series[-1]}")
+        return lines
+
+
+REQUEST_DURATION = Histogram(
+    'carette_http_request_duration_seconds', 'Durée des requêtes HTTP par endpoint',
+    ('endpoint', 'method', 'status'))
+REQUEST_DB_QUERIES = Histogram(
+    'carette_http_request_db_queries', 'Requêtes SQL par requête HTTP',
+    ('endpoint',), QUERY_COUNT_BUCKETS)
+REQUEST_DB_SECONDS = Histogram(
+    'carette_http_request_db_seconds', 'Temps SQL cumulé par requête HTTP', ('endpoint',))
+REQUEST_UPSTREAM_SECONDS = Histogram(
+    'carette_http_request_upstream_seconds',
+    'Temps cumulé des appels externes (OSRM, BAN, Nominatim) par requête HTTP', ('endpoint',))
+DB_QUERY_DURATION = Histogram(
+    'carette_db_query_duration_seconds', 'Durée des requêtes SQL')
+UPSTREAM_DURATION = Histogram(
+    'carette_upstream_request_duration_seconds', 'Durée des appels aux services externes',
+    ('service', 'status'))
+UPSTREAM_ERRORS = Counter(
+    'carette_upstream_errors_total', 'Appels externes en erreur (réseau, timeout, débit)', ('service',))
+SMTP_DURATION = Histogram(
+    'carette_smtp_send_duration_seconds', 'Durée des envois SMTP', ('result',))
+
+_METRICS = [REQUEST_DURATION, REQUEST_DB_QUERIES, REQUEST_DB_SECONDS, REQUEST_UPSTREAM_SECONDS,
+            DB_QUERY_DURATION, UPSTREAM_DURATION, UPSTREAM_ERRORS, SMTP_DURATION]
+
+
+# ============================================================================
+# Compteurs de la requête HTTP en cours
+# ============================================================================
+
+class RequestStats:
+    """Temps et nombres d'appels cumulés pendant une requête HTTP"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.upstream: Dict[str, list] = {}  # service → [appels, secondes]
+        self.smtp_sends = 0
+        self.smtp_seconds = 0.0
+
+    def add_db(self, seconds: float):
+        with self._lock:
+            self.db_queries += 1
+            self.db_seconds += seconds
+
+    def add_upstream(self, service: str, seconds: float):
+        with self._lock:
+            entry = self.upstream.setdefault(service, [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+
+    def add_smtp(self, seconds: float):
+        with self._lock:
+            self.smtp_sends += 1
+            self.smtp_seconds += seconds
+
+    def upstream_seconds(self) -> float:
+        with self._lock:
+            return sum(seconds for _, seconds in self.upstream.values())
+
+    def server_timing(self, total: float) -> str:
+        """Valeur de l'en-tête Server-Timing (durées en ms, cumulées sur tous les threads)"""
+        with self._lock:
+            parts = [f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_queries} requêtes SQL"']
+            for service, (calls, seconds) in sorted(self.upstream.items()):
+                parts.append(f'{service};dur={seconds * 1000:.1f};desc="{calls} appel(s)"')
+            if self.smtp_sends:
+                parts.append(f'smtp;dur={self.smtp_seconds * 1000:.1f};desc="{self.smtp_sends} email(s)"')
+            waited = self.db_seconds + self.smtp_seconds + sum(s for _, s in self.upstream.values())
+        parts.append(f'app;dur={max(total - waited, 0.0) * 1000:.1f};desc="Python (estimé)"')
+        parts.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(parts)
+
+
+_local = threading.local()
+
+
+def current() -> Optional[RequestStats]:
+    """Compteurs de la requête HTTP du thread courant (None hors requête)"""
+    return getattr(_local, 'stats', None)
+
+
+def bind(fn):
+    """
+    Rattache fn (exécutée dans un autre thread, ex: ThreadPoolExecutor) à la
+    requête HTTP en cours : ses requêtes SQL et appels externes y sont comptés.
+    """
+    stats = current()
+    if stats is None:
+        return fn
+
+    @functools.wraps(fn)
+    def bound(*args, **kwargs):
+        previous = current()
+        _local.stats = stats
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _local.stats = previous
+    return bound
+
+
+# ============================================================================
+# Points de mesure (appelés par sql, rate_scheduler, email_sender)
+# ============================================================================
+
+def record_db(seconds: float):
+    """Une requête SQL exécutée"""
+    if not METRICS_ENABLED:
+        return
+    DB_QUERY_DURATION.observe(seconds)
+    stats = current()
+    if stats is not None:
+        stats.add_db(seconds)
+
+
+def upstream_service(url: str) -> str:
+    """Nom du service externe d'une URL (osrm, ban, nominatim ou hôte)"""
+    parts = urlsplit(url)
+    host = (parts.hostname or '').lower()
+    if 'nominatim' in host:
+        return 'nominatim'
+    if host == 'api-adresse.data.gouv.fr':
+        return 'ban'
+    if OSRM_PATH.search(parts.path):
+        return 'osrm'
+    return host or 'unknown'
+
+
+def record_upstream(service: str, seconds: float, status=None):
+    """Un appel à un service externe (status None = erreur réseau / timeout)"""
+    if not METRICS_ENABLED:
+        return
+    if status is None:
+        UPSTREAM_ERRORS.inc(service)
+        status = 'error'
+    UPSTREAM_DURATION.observe(seconds, service, str(status))
+    stats = current()
+    if stats is not None:
+        stats.add_upstream(service, seconds)
+
+
+def timed_smtp(fn):
+    """Décorateur de send_email : durée et résultat (True/False) de l'envoi"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        ok = False
+        try:
+            ok = fn(*args, **kwargs)
+            return ok
+        finally:
+            if METRICS_ENABLED:
+                elapsed = time.perf_counter() - started
+                SMTP_DURATION.observe(elapsed, 'sent' if ok else 'failed')
+                stats = current()
+                if stats is not None:
+                    stats.add_smtp(elapsed)
+    return wrapper
+
+
+# ============================================================================
+# Export
+# ============================================================================
+
+def _gauge(name: str, help_text: str, samples):
+    """Lignes d'une jauge ; samples = [(étiquettes dict, valeur)]"""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        if value is None:
+            continue
+        lines.append(f"{name}{_format_labels(list(labels), list(labels.values()))} {_format_value(value)}")
+    return lines
+
+
+def _collect_components():
+    """Jauges lues dans les statistiques des autres modules"""
+    import address_search
+    import geocoding
+    import osrm_client
+    import rate_scheduler
+    import reverse_geocoding
+    import route_cache
+    import single_flight
+    import sql
+
+    lines = []
+    cache = route_cache.get_stats()
+    lines += _gauge('carette_route_cache_lookups', 'Consultations du cache de routes par résultat',
+                    [({'result': result}, cache[key]) for result, key in
+                     (('memory_hit', 'memory_hits'), ('db_hit', 'db_hits'), ('miss', 'misses'))])
+    lines += _gauge('carette_route_cache_hit_ratio', 'Taux de succès du cache de routes',
+                    [({}, cache['hit_ratio'])])
+    lines += _gauge('carette_route_cache_entries', 'Entrées du cache mémoire de routes',
+                    [({}, cache['memory_size'])])
+
+    geo = geocoding.get_stats()
+    lines += _gauge('carette_geocode_cache_lookups', 'Consultations du cache de géocodage par résultat',
+                    [({'result': result}, geo[key]) for result, key in
+                     (('memory_hit', 'memory_hits'), ('negative_hit', 'negative_hits'),
+                      ('db_hit', 'db_hits'), ('miss', 'misses'))])
+    lines += _gauge('carette_geocode_cache_hit_ratio', 'Taux de succès du cache de géocodage',
+                    [({}, geo['hit_ratio'])])
+    lines += _gauge('carette_geocode_upstream_results', 'Géocodages externes par fournisseur ou issue',
+                    [({'result': result}, geo[result]) for result in ('ban', 'nominatim', 'not_found', 'errors')])
+    lines += _gauge('carette_geocode_ban_csv', 'Géocodeur CSV de la BAN (imports) : adresses envoyées, lots en échec',
+                    [({'kind': 'rows'}, geo['ban_csv_rows']), ({'kind': 'errors'}, geo['ban_csv_errors'])])
+
+    reverse = reverse_geocoding.get_stats()
+    lines += _gauge('carette_reverse_geocode_cache_lookups', 'Consultations du cache de géocodage inversé par résultat',
+                    [({'result': result}, reverse[key]) for result, key in
+                     (('memory_hit', 'memory_hits'), ('db_hit', 'db_hits'), ('miss', 'misses'))])
+    lines += _gauge('carette_reverse_geocode_cache_hit_ratio', 'Taux de succès du cache de géocodage inversé',
+                    [({}, reverse['hit_ratio'])])
+    lines += _gauge('carette_reverse_geocode_errors', 'Géocodages inversés en échec (Nominatim, MySQL)',
+                    [({'kind': 'upstream'}, reverse['errors']), ({'kind': 'db'}, reverse['db_errors'])])
+
+    autocomplete = address_search.get_stats()
+    lines += _gauge('carette_autocomplete_cache_lookups', "Consultations du cache d'autocomplétion par résultat",
+                    [({'result': result}, autocomplete[key]) for result, key in
+                     (('hit', 'hits'), ('prefix_hit', 'prefix_hits'), ('miss', 'misses'))])
+    lines += _gauge('carette_autocomplete_upstream_results', "Recherches d'autocomplétion par fournisseur ou issue",
+                    [({'result': result}, autocomplete[result]) for result in ('ban', 'nominatim', 'empty', 'errors')])
+
+    flights = single_flight.get_stats()
+    lines += _gauge('carette_single_flight_calls', 'Appels dédupliqués par groupe',
+                    [({'group': group, 'kind': kind}, stats.get(kind))
+                     for group, stats in sorted(flights.items())
+                     for kind in ('calls', 'executed', 'shared')])
+    lines += _gauge('carette_single_flight_share_ratio', 'Part des demandes servies par un appel en cours',
+                    [({'group': group}, round(stats['shared'] / stats['calls'], 4) if stats['calls'] else 0.0)
+                     for group, stats in sorted(flights.items())])
+
+    hosts = rate_scheduler.get_stats()
+    lines += _gauge('carette_rate_limit_queued', 'Demandes en attente de jeton par hôte',
+                    [({'host': host}, stats['queued']) for host, stats in sorted(hosts.items())])
+    lines += _gauge('carette_rate_limit_wait_seconds', "Temps d'attente de jeton cumulé par hôte",
+                    [({'host': host}, stats['wait_seconds']) for host, stats in sorted(hosts.items())])
+
+    servers = osrm_client.get_server_stats()
+    lines += _gauge('carette_osrm_server_latency_ms', 'Latence moyenne (EWMA) par serveur OSRM',
+                    [({'server': server}, stats['avg_latency_ms']) for server, stats in servers.items()])
+    lines += _gauge('carette_osrm_server_circuit_open', 'Coupe-circuit ouvert (1) par serveur OSRM',
+                    [({'server': server}, int(stats['circuit_open'])) for server, stats in servers.items()])
+
+    pool = sql.get_pool_stats()
+    lines += _gauge('carette_db_pool_connections', 'Connexions du pool MySQL par état',
+                    [({'state': state}, pool[state]) for state in ('open', 'in_use', 'idle') if state in pool])
+    lines += _gauge('carette_db_pool_waits', 'Emprunts du pool MySQL ayant attendu',
+                    [({}, pool.get('waits'))])
+    return lines
+
+
+def render() -> str:
+    """Toutes les mesures au format texte Prometheus"""
+    lines = []
+    for metric in _METRICS:
+        lines += metric.render()
+    try:
+        lines += _collect_components()
+    except Exception as e:
+        logger.warning(f"⚠️ Statistiques des composants indisponibles: {e}")
+    return '\n'.join(lines) + '\n'
+
+
+def register_metrics(app, limiter=None):
+    """Chronométrage des requêtes Flask et endpoint /metrics"""
+    from flask import Response, request
+
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_request_metrics():
+        _local.stats = RequestStats()
+
+    @app.after_request
+    def _finish_request_metrics(response):
+        stats = current()
+        if stats is None:
+            return response
+        _local.stats = None
+        elapsed = time.perf_counter() - stats.started
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        if endpoint != '/metrics':
+            REQUEST_DURATION.observe(elapsed, endpoint, request.method, str(response.status_code))
+            REQUEST_DB_QUERIES.observe(stats.db_queries, endpoint)
+            REQUEST_DB_SECONDS.observe(stats.db_seconds, endpoint)
+            REQUEST_UPSTREAM_SECONDS.observe(stats.upstream_seconds(), endpoint)
+        if app.debug:
+            response.headers['Server-Timing'] = stats.server_timing(elapsed)
+        return response
+
+    def metrics_endpoint():
+        """Mesures au format Prometheus"""
+        if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint, methods=['GET'])
+    if limiter is not None:
+        limiter.exempt(metrics_endpoint)
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Migration : Recalculer les clés normalisées du cache de géocodage
+(geocoding_cache.address_key) après un changement de geocoding.normalize_address
+Les lignes dont la clé change ne sont plus partagées avec des adresses différentes
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import sql
+import init_carpool_tables
+from geocoding import normalize_address
+
+
+def migrate_address_keys():
+    """Met à jour les clés normalisées qui diffèrent de la normalisation actuelle"""
+
+    print("🔧 Migration : Clés normalisées du cache de géocodage")
+    print("=" * 60)
+
+    # Crée la colonne address_key si nécessaire
+    init_carpool_tables.init_rse_weekly_tables()
+
+    with sql.db_cursor() as cur:
+        cur.execute("SELECT id, address, address_key FROM geocoding_cache")
+        rows = cur.fetchall()
+
+        changed = []
+        for row in rows:
+            key = normalize_address(row['address'])
+            if key != row['address_key']:
+                changed.append((key, row['id']))
+        print(f"\n📦 {len(rows)} adresse(s) en cache, {len(changed)} clé(s) à recalculer")
+
+        for start in range(0, len(changed), 500):
+            cur.executemany("UPDATE geocoding_cache SET address_key = %s WHERE id = %s",
+                            changed[start:start + 500])
+
+    print(f"\n✅ Migration terminée : {len(changed)} clé(s) mise(s) à jour")
+
+
+if __name__ == '__main__':
+    migrate_address_keys()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Migration : Précalculer les trajets directs des offres récurrentes existantes
+(direct_duration_outbound/return, direct_distance_outbound/return)
+La recherche n'a ensuite plus qu'un appel OSRM (via le passager) par sens
+"""
+
+import sys
+import os
+import json
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import sql
+import init_carpool_tables
+import osrm_client
+
+
+def migrate_direct_routes():
+    """Calcule les trajets directs manquants des offres récurrentes actives"""
+
+    print("🔧 Migration : Trajets directs des offres récurrentes")
+    print("=" * 60)
+
+    # Ajoute les colonnes si nécessaire
+    init_carpool_tables.init_carpool_tables()
+
+    with sql.db_cursor() as cur:
+        cur.execute("""
+            SELECT id, departure_coords, destination_coords
+            FROM carpool_offers_recurrent
+            WHERE status = 'active'
+            AND (direct_duration_outbound IS NULL OR direct_duration_return IS NULL)
+        """)
+        offers = cur.fetchall()
+
+    print(f"\n📦 {len(offers)} offre(s) à compléter")
+
+    updated = 0
+    for offer in offers:
+        try:
+            dep = json.loads(offer['departure_coords']) if offer['departure_coords'] else None
+            dest = json.loads(offer['destination_coords']) if offer['destination_coords'] else None
+        except (TypeError, ValueError):
+            dep, dest = None, None
+
+        if not dep or not dest:
+            print(f"  ⚠️  Offre {offer['id']}: coordonnées manquantes, ignorée")
+            continue
+
+        outbound = osrm_client.route_summary([dep, dest])
+        return_trip = osrm_client.route_summary([dest, dep])
+        if not outbound or not return_trip:
+            print(f"  ⚠️  Offre {offer['id']}: échec OSRM, ignorée")
+            continue
+
+        with sql.db_cursor() as cur:
+            cur.execute("""
+                UPDATE carpool_offers_recurrent
+                SET direct_duration_outbound = %s, direct_distance_outbound = %s,
+                    direct_duration_return = %s, direct_distance_return = %s
+                WHERE id = %s
+            """, (outbound[0], outbound[1], return_trip[0], return_trip[1], offer['id']))
+        updated += 1
+        print(f"  ✓ Offre {offer['id']}: aller {outbound[0] / 60:.1f} min, retour {return_trip[0] / 60:.1f} min")
+
+    print(f"\n✅ Migration terminée : {updated}/{len(offers)} offre(s) mises à jour")
+
+
+if __name__ == '__main__':
+    migrate_direct_routes()
@@ -0,0 +1,507 @@
+"""
+Client de routage OSRM partagé par tous les modules backend.
+
+Une seule session HTTP keep-alive (pool de connexions) est réutilisée pour
+tous les appels /route, /table et /nearest : on évite ainsi une poignée de
+main TCP/TLS à chaque calcul de détour.
+
+Configuration (variables d'environnement) :
+- CARETTE_OSRM_URL           : serveur OSRM principal
+- CARETTE_OSRM_FALLBACK_URLS : serveurs de secours, séparés par des virgules
+- CARETTE_OSRM_TIMEOUT       : timeout par défaut en secondes
+- CARETTE_OSRM_POOL_SIZE     : nombre de connexions gardées ouvertes par hôte
+- CARETTE_OSRM_TABLE_MAX_COORDS : nombre maximum de points par requête /table
+- CARETTE_OSRM_HEDGE_DELAY   : délai (s) avant d'interroger le serveur suivant en parallèle
+- CARETTE_OSRM_BREAKER_THRESHOLD / CARETTE_OSRM_BREAKER_COOLDOWN :
+  nombre d'échecs consécutifs avant de mettre un serveur de côté, et durée (s)
+
+Chaque serveur a ses statistiques (latence moyenne, erreurs) et un coupe-circuit :
+après plusieurs échecs consécutifs il est ignoré pendant le cooldown, puis
+retenté. Les itinéraires interactifs (route_hedged) interrogent le serveur
+suivant si le premier n'a pas répondu après le délai de couverture, et
+gardent la première réponse valide.
+
+Les requêtes passent par rate_scheduler (débit par hôte, priorités).
+
+Avec CARETTE_ROUTING_BACKEND=graph|estimate, route/table/nearest sont servis
+par un moteur local (routing_backends) au lieu des serveurs OSRM ; avec
+CARETTE_ROUTING_FALLBACK, ce moteur prend le relais quand OSRM échoue.
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as futures_wait
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+import rate_scheduler
+import route_cache
+import routing_backends
+
+logger = logging.getLogger(__name__)
+
+OSRM_BASE_URL = os.getenv('CARETTE_OSRM_URL', 'https://router.project-osrm.org').rstrip('/')
+OSRM_FALLBACK_URLS = [
+    url.strip().rstrip('/')
+    for url in os.getenv(
+        'CARETTE_OSRM_FALLBACK_URLS',
+        'https://routing.openstreetmap.de/routed-car,http://router.project-osrm.org'
+    ).split(',')
+    if url.strip()
+]
+OSRM_PROFILE = os.getenv('CARETTE_OSRM_PROFILE', 'driving')
+OSRM_TIMEOUT = float(os.getenv('CARETTE_OSRM_TIMEOUT', '5'))
+OSRM_POOL_SIZE = int(os.getenv('CARETTE_OSRM_POOL_SIZE', '20'))
+# Le serveur public limite /table à 100 points par requête
+OSRM_TABLE_MAX_COORDS = int(os.getenv('CARETTE_OSRM_TABLE_MAX_COORDS', '100'))
+OSRM_HEDGE_DELAY = float(os.getenv('CARETTE_OSRM_HEDGE_DELAY', '0.5'))
+OSRM_BREAKER_THRESHOLD = int(os.getenv('CARETTE_OSRM_BREAKER_THRESHOLD', '3'))
+OSRM_BREAKER_COOLDOWN = float(os.getenv('CARETTE_OSRM_BREAKER_COOLDOWN', '30'))
+
+Coord = Tuple[float, float]  # (lon, lat)
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+# Santé des serveurs : url → compteurs, latence moyenne, coupe-circuit
+_server_stats: Dict[str, Dict] = {}
+_stats_lock = threading.Lock()
+
+# Requêtes de couverture (hedging) : les perdants finissent en arrière-plan
+_hedge_executor = ThreadPoolExecutor(max_workers=OSRM_POOL_SIZE, thread_name_prefix='osrm-hedge')
+
+_local = threading.local()
+
+# Débit local dépassé (voir raise_rate_limited)
+RateLimited = rate_scheduler.RateLimited
+
+
+@contextmanager
+def raise_rate_limited():
+    """
+    Dans ce bloc, un débit local dépassé lève RateLimited
+    (thread courant) au lieu de renvoyer None comme une erreur OSRM :
+    l'appelant peut distinguer "pas encore calculé" de "pas d'itinéraire".
+    """
+    previous = getattr(_local, 'raise_rate_limited', False)
+    _local.raise_rate_limited = True
+    try:
+        yield
+    finally:
+        _local.raise_rate_limited = previous
+
+
+def get_session() -> requests.Session:
+    """Retourne la session HTTP partagée (créée au premier appel)"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=OSRM_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'User-Agent': 'Carette/1.0'})
+                _session = session
+    return _session
+
+
+def get_all_servers() -> List[str]:
+    """Liste configurée des serveurs OSRM : principal puis secours"""
+    return [OSRM_BASE_URL] + [url for url in OSRM_FALLBACK_URLS if url != OSRM_BASE_URL]
+
+
+def _server_entry(server: str) -> Dict:
+    return _server_stats.setdefault(server, {
+        'requests': 0,
+        'errors': 0,
+        'consecutive_failures': 0,
+        'avg_latency_ms': None,
+        'open_until': 0.0,
+    })
+
+
+def record_result(server: str, ok: bool, latency_s: float):
+    """Met à jour les statistiques d'un serveur et son coupe-circuit"""
+    with _stats_lock:
+        entry = _server_entry(server)
+        entry['requests'] += 1
+        if ok:
+            entry['consecutive_failures'] = 0
+            latency_ms = latency_s * 1000
+            # Moyenne mobile exponentielle
+            entry['avg_latency_ms'] = latency_ms if entry['avg_latency_ms'] is None \
+                else 0.8 * entry['avg_latency_ms'] + 0.2 * latency_ms
+        else:
+            entry['errors'] += 1
+            entry['consecutive_failures'] += 1
+            if entry['consecutive_failures'] >= OSRM_BREAKER_THRESHOLD:
+                if entry['open_until'] <= time.time():
+                    logger.warning(f"⚠️ OSRM {server} mis de côté {OSRM_BREAKER_COOLDOWN:.0f}s "
+                                   f"({entry['consecutive_failures']} échecs consécutifs)")
+                entry['open_until'] = time.time() + OSRM_BREAKER_COOLDOWN
+
+
+def is_available(server: str) -> bool:
+    """False si le coupe-circuit du serveur est ouvert"""
+    with _stats_lock:
+        entry = _server_stats.get(server)
+        return entry is None or entry['open_until'] <= time.time()
+
+
+def get_servers() -> List[str]:
+    """
+    Serveurs OSRM à utiliser, dans l'ordre : principal puis secours, en
+    ignorant ceux dont le coupe-circuit est ouvert (tous si aucun n'est sain).
+    """
+    servers = get_all_servers()
+    healthy = [server for server in servers if is_available(server)]
+    return healthy or servers
+
+
+def get_server_stats() -> Dict[str, Dict]:
+    """Statistiques par serveur (requêtes, erreurs, latence moyenne, coupe-circuit)"""
+    now = time.time()
+    with _stats_lock:
+        stats = {}
+        for server in get_all_servers():
+            entry = dict(_server_entry(server))
+            entry['circuit_open'] = entry.pop('open_until') > now
+            if entry['avg_latency_ms'] is not None:
+                entry['avg_latency_ms'] = round(entry['avg_latency_ms'], 1)
+            stats[server] = entry
+    return stats
+
+
+def format_coords(coords: Sequence[Sequence[float]]) -> str:
+    """Formate une liste de (lon, lat) au format OSRM 'lon,lat;lon,lat'"""
+    return ';'.join(f"{float(c[0])},{float(c[1])}" for c in coords)
+
+
+def request_osrm(service: str,
+                 coords: Sequence[Sequence[float]],
+                 params: Optional[Dict] = None,
+                 base_url: Optional[str] = None,
+                 timeout: Optional[float] = None) -> Optional[Dict]:
+    """
+    Exécute une requête OSRM brute via la session partagée.
+
+    Args:
+        service: 'route', 'table' ou 'nearest'
+        coords: Liste de (lon, lat)
+        params: Paramètres de requête OSRM
+        base_url: Serveur à interroger (défaut: premier serveur disponible)
+        timeout: Timeout en secondes (défaut: OSRM_TIMEOUT)
+
+    Returns:
+        Réponse JSON si code == 'Ok', None sinon
+
+    Raises:
+        RateLimited: débit dépassé, dans un bloc raise_rate_limited()
+    """
+    server = base_url or get_servers()[0]
+    url = f"{server}/{service}/v1/{OSRM_PROFILE}/{format_coords(coords)}"
+    started = time.monotonic()
+    try:
+        resp = rate_scheduler.request(url, session=get_session(), params=params,
+                                      timeout=timeout or OSRM_TIMEOUT)
+        if not resp.ok:
+            # 4xx : requête invalide, le serveur n'est pas en cause
+            record_result(server, resp.status_code < 500, time.monotonic() - started)
+            logger.warning(f"⚠️ OSRM {service} HTTP {resp.status_code} ({server})")
+            return None
+        data = resp.json()
+    except rate_scheduler.RateLimited as e:
+        # Débit local dépassé : le serveur n'est pas en cause
+        logger.warning(f"⚠️ OSRM {service} skipped ({server}): {e}")
+        if getattr(_local, 'raise_rate_limited', False):
+            raise
+        return None
+    except (requests.RequestException, ValueError) as e:
+        record_result(server, False, time.monotonic() - started)
+        logger.warning(f"⚠️ OSRM {service} failed ({server}): {e}")
+        return None
+    record_result(server, True, time.monotonic() - started)
+
+    if data.get('code') != 'Ok':
+        logger.warning(f"⚠️ OSRM {service} code={data.get('code')}")
+        return None
+    return data
+
+
+def _fallback(service: str, *args, **kwargs) -> Optional[Dict]:
+    """Moteur de secours (CARETTE_ROUTING_FALLBACK) quand OSRM a échoué"""
+    backend = routing_backends.fallback_backend()
+    if backend is None:
+        return None
+    logger.warning(f"⚠️ OSRM {service} indisponible, repli sur le moteur '{backend.name}'")
+    return getattr(backend, service)(*args, **kwargs)
+
+
+def route(coords: Sequence[Sequence[float]],
+          overview: str = 'false',
+          geometries: Optional[str] = None,
+          steps: bool = False,
+          alternatives: Optional[int] = None,
+          base_url: Optional[str] = None,
+          timeout: Optional[float] = None) -> Optional[Dict]:
+    """
+    Service /route : itinéraire passant par tous les points dans l'ordre.
+
+    Returns:
+        Réponse OSRM complète (avec au moins une route), ou None si erreur
+    """
+    local = routing_backends.active_backend()
+    if local is not None:
+        return local.route(coords, overview=overview, geometries=geometries,
+                           steps=steps, alternatives=alternatives)
+
+    params = {'overview': overview}
+    if geometries:
+        params['geometries'] = geometries
+    if steps:
+        params['steps'] = 'true'
+    if alternatives:
+        params['alternatives'] = alternatives
+
+    data = request_osrm('route', coords, params, base_url=base_url, timeout=timeout)
+    if not data or not data.get('routes'):
+        # Serveur imposé (couverture) : le secours est géré par route_hedged
+        if base_url is None:
+            return _fallback('route', coords, overview=overview, geometries=geometries,
+                             steps=steps, alternatives=alternatives)
+        return None
+    return data
+
+
+def hedged(call, servers: Optional[Sequence[str]] = None,
+           hedge_delay: Optional[float] = None,
+           timeout: Optional[float] = None):
+    """
+    Exécute call(server) sur plusieurs serveurs en couverture (hedging).
+
+    Le premier serveur est interrogé tout de suite ; si aucune réponse valide
+    n'est arrivée après hedge_delay secondes (ou si un serveur échoue), le
+    suivant est lancé en parallèle. La première réponse non None gagne ; les
+    requêtes perdantes se terminent en arrière-plan (elles alimentent les
+    statistiques des serveurs).
+
+    Returns:
+        Première réponse non None, ou None si tous échouent avant timeout
+    """
+    servers = list(servers or get_servers())
+    hedge_delay = OSRM_HEDGE_DELAY if hedge_delay is None else hedge_delay
+    deadline = time.monotonic() + (timeout or OSRM_TIMEOUT)
+    pending = set()
+    next_index = 0
+
+    while True:
+        if not pending:
+            if next_index >= len(servers):
+                return None
+            pending.add(_hedge_executor.submit(metrics.bind(call), servers[next_index]))
+            next_index += 1
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        wait_time = min(hedge_delay, remaining) if next_index < len(servers) else remaining
+        done, _ = futures_wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+        for future in done:
+            pending.discard(future)
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.warning(f"⚠️ OSRM hedged call failed: {e}")
+                result = None
+            if result is not None:
+                return result
+
+        # Pas de réponse valide : lancer le serveur suivant en parallèle
+        if next_index < len(servers):
+            pending.add(_hedge_executor.submit(metrics.bind(call), servers[next_index]))
+            next_index += 1
+
+
+def route_hedged(coords: Sequence[Sequence[float]],
+                 overview: str = 'false',
+                 geometries: Optional[str] = None,
+                 steps: bool = False,
+                 alternatives: Optional[int] = None,
+                 timeout: Optional[float] = None,
+                 hedge_delay: Optional[float] = None) -> Optional[Dict]:
+    """
+    Service /route sur les serveurs disponibles en couverture (voir hedged).
+    À utiliser pour les calculs interactifs (widget) sensibles à la latence.
+    """
+    if routing_backends.active_backend() is not None:
+        return route(coords, overview=overview, geometries=geometries, steps=steps,
+                     alternatives=alternatives)
+
+    timeout = timeout or OSRM_TIMEOUT
+
+    def call(server):
+        return route(coords, overview=overview, geometries=geometries, steps=steps,
+                     alternatives=alternatives, base_url=server, timeout=timeout)
+
+    data = hedged(call, hedge_delay=hedge_delay, timeout=timeout)
+    if data is None:
+        return _fallback('route', coords, overview=overview, geometries=geometries,
+                         steps=steps, alternatives=alternatives)
+    return data
+
+
+def route_summary(coords: Sequence[Sequence[float]],
+                  timeout: Optional[float] = None,
+                  use_cache: bool = True) -> Optional[Tuple[float, float]]:
+    """
+    Durée et distance de la première route, sans géométrie.
+    Passe par le cache route_cache (mémoire + MySQL) sauf si use_cache=False
+    ou si un moteur local est configuré ; seules les réponses OSRM y sont stockées.
+
+    Returns:
+        Tuple (durée en secondes, distance en mètres) ou None si erreur
+    """
+    use_cache = use_cache and routing_backends.active_backend() is None
+    if use_cache:
+        cached = route_cache.get_route(coords)
+        if cached is not None:
+            return cached
+
+    data = route(coords, timeout=timeout)
+    if not data:
+        return None
+    best = data['routes'][0]
+
+    if use_cache and 'backend' not in data:
+        route_cache.set_route(coords, best['duration'], best['distance'])
+    return best['duration'], best['distance']
+
+
+def route_duration(coords: Sequence[Sequence[float]],
+                   timeout: Optional[float] = None,
+                   use_cache: bool = True) -> Optional[float]:
+    """Durée de la première route en secondes, ou None si erreur"""
+    summary = route_summary(coords, timeout=timeout, use_cache=use_cache)
+    return summary[0] if summary else None
+
+
+def table(coords: Sequence[Sequence[float]],
+          sources: Optional[Sequence[int]] = None,
+          destinations: Optional[Sequence[int]] = None,
+          annotations: str = 'duration',
+          timeout: Optional[float] = None) -> Optional[Dict]:
+    """
+    Service /table : matrice de durées (et/ou distances) entre points.
+
+    Args:
+        coords: Liste de (lon, lat)
+        sources: Indices des points de départ (défaut: tous)
+        destinations: Indices des points d'arrivée (défaut: tous)
+        annotations: 'duration', 'distance' ou 'duration,distance'
+
+    Returns:
+        Réponse OSRM avec 'durations' (secondes) et/ou 'distances' (mètres),
+        matrices len(sources) × len(destinations). Les paires non routables
+        valent None.
+    """
+    local = routing_backends.active_backend()
+    if local is not None:
+        return local.table(coords, sources=sources, destinations=destinations, annotations=annotations)
+
+    params = {'annotations': annotations}
+    if sources is not None:
+        params['sources'] = ';'.join(str(i) for i in sources)
+    if destinations is not None:
+        params['destinations'] = ';'.join(str(i) for i in destinations)
+    data = request_osrm('table', coords, params, timeout=timeout)
+    if data is None:
+        return _fallback('table', coords, sources=sources, destinations=destinations,
+                         annotations=annotations)
+    return data
+
+
+def duration_matrix(coords: Sequence[Sequence[float]],
+                    sources: Optional[Sequence[int]] = None,
+                    destinations: Optional[Sequence[int]] = None,
+                    max_coords: Optional[int] = None,
+                    timeout: Optional[float] = None) -> np.ndarray:
+    """
+    Matrice des durées sources × destinations, découpée en blocs.
+
+    Au-delà de max_coords points distincts, la matrice est reconstituée bloc
+    par bloc : chaque requête /table porte sur un bloc de sources et un bloc
+    de destinations (max_coords / 2 points chacun).
+
+    Args:
+        coords: Liste de (lon, lat)
+        sources: Indices des points de départ (défaut: tous)
+        destinations: Indices des points d'arrivée (défaut: tous)
+
+    Returns:
+        np.ndarray (len(sources), len(destinations)) en secondes ; NaN pour
+        les paires non routables ou les blocs en échec
+    """
+    sources = list(range(len(coords))) if sources is None else list(sources)
+    destinations = list(range(len(coords))) if destinations is None else list(destinations)
+    matrix = np.full((len(sources), len(destinations)), np.nan)
+    if not sources or not destinations:
+        return matrix
+
+    max_coords = max(2, max_coords or OSRM_TABLE_MAX_COORDS)
+    if len(set(sources) | set(destinations)) <= max_coords:
+        src_blocks = [list(range(len(sources)))]
+        dst_blocks = [list(range(len(destinations)))]
+    else:
+        chunk = max_coords // 2
+        src_blocks = [list(range(i, min(i + chunk, len(sources)))) for i in range(0, len(sources), chunk)]
+        dst_blocks = [list(range(j, min(j + chunk, len(destinations)))) for j in range(0, len(destinations), chunk)]
+
+    failed = 0
+    for src_block in src_blocks:
+        for dst_block in dst_blocks:
+            # Points distincts du bloc (une source peut aussi être une destination)
+            block_points = list(dict.fromkeys([sources[i] for i in src_block] + [destinations[j] for j in dst_block]))
+            position = {point: k for k, point in enumerate(block_points)}
+
+            data = table(
+                [coords[point] for point in block_points],
+                sources=[position[sources[i]] for i in src_block],
+                destinations=[position[destinations[j]] for j in dst_block],
+                timeout=timeout
+            )
+            if not data or not data.get('durations'):
+                failed += 1
+                continue
+            matrix[np.ix_(src_block, dst_block)] = np.array(data['durations'], dtype=float)
+
+    if failed:
+        logger.warning(f"⚠️ OSRM table {len(sources)}x{len(destinations)}: "
+                       f"{failed}/{len(src_blocks) * len(dst_blocks)} bloc(s) en échec")
+    return matrix
+
+
+def nearest(coord: Sequence[float],
+            number: int = 1,
+            timeout: Optional[float] = None) -> Optional[Dict]:
+    """
+    Service /nearest : accroche un point au réseau routier.
+
+    Returns:
+        Réponse OSRM avec 'waypoints' (location [lon, lat], distance en m),
+        ou None si erreur
+    """
+    local = routing_backends.active_backend()
+    if local is not None:
+        return local.nearest(coord, number=number)
+
+    data = request_osrm('nearest', [coord], {'number': number}, timeout=timeout)
+    if not data or not data.get('waypoints'):
+        return _fallback('nearest', coord, number=number)
+    return data
@@ -0,0 +1,212 @@
+"""
+Ordonnanceur de débit pour les services publics (Nominatim, OSRM, BAN).
+
+Chaque hôte limité a un seau à jetons (CARETTE_RATE_LIMITS, requêtes/s).
+Les demandes en attente sont servies par priorité puis par ordre d'arrivée :
+- INTERACTIVE (défaut) : widget, formulaires. Passe devant les traitements
+  de fond, mais abandonne après CARETTE_RATE_INTERACTIVE_WAIT secondes.
+- BATCH : imports, géocodage en masse, matching entreprise. Attend son tour
+  sans limite de temps et réessaie après un 429.
+
+Un 429 met l'hôte en pause (Retry-After, sinon CARETTE_RATE_PENALTY s).
+Les seaux sont propres à chaque processus.
+
+Usage :
+    with rate_scheduler.batch():
+        resp = rate_scheduler.request(url, params=..., timeout=5)
+"""
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+import metrics
+import routing_cassette
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 0
+BATCH = 1
+
+RATE_LIMITS = os.getenv(
+    'CARETTE_RATE_LIMITS',
+    'nominatim.openstreetmap.org:1,router.project-osrm.org:2,'
+    'routing.openstreetmap.de:2,api-adresse.data.gouv.fr:40'
+)
+RATE_INTERACTIVE_WAIT = float(os.getenv('CARETTE_RATE_INTERACTIVE_WAIT', '2'))
+RATE_BATCH_RETRIES = int(os.getenv('CARETTE_RATE_BATCH_RETRIES', '3'))
+RATE_PENALTY = float(os.getenv('CARETTE_RATE_PENALTY', '5'))
+
+
+class RateLimited(requests.RequestException):
+    """Pas de jeton obtenu à temps (requête interactive)"""
+
+
+def parse_limits(spec: str) -> Dict[str, float]:
+    """'hôte:req/s,hôte:req/s' → {hôte: req/s}"""
+    limits = {}
+    for item in spec.split(','):
+        host, _, rate = item.strip().rpartition(':')
+        if host and rate:
+            limits[host.lower()] = float(rate)
+    return limits
+
+
+class TokenBucket:
+    """Seau à jetons avec file d'attente par priorité"""
+
+    def __init__(self, host: str, rate: float):
+        self.host = host
+        self.rate = rate
+        self.burst = max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self.stats = {'granted_interactive': 0, 'granted_batch': 0, 'timeouts': 0,
+                      'throttled': 0, 'wait_seconds': 0.0}
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, priority: int, timeout: Optional[float]) -> bool:
+        """Prend un jeton ; False si timeout écoulé avant notre tour"""
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    at_head = self._waiting[0] == ticket
+                    if at_head and now >= self.paused_until and self.tokens >= 1:
+                        self.tokens -= 1
+                        key = 'granted_batch' if priority == BATCH else 'granted_interactive'
+                        self.stats[key] += 1
+                        self.stats['wait_seconds'] += now - started
+                        return True
+
+                    # En tête : attendre le prochain jeton ; sinon, qu'on nous réveille
+                    wait = max(self.paused_until - now, (1 - self.tokens) / self.rate) if at_head else None
+                    if deadline is not None:
+                        remaining = deadline - now
+                        if remaining <= 0:
+                            self.stats['timeouts'] += 1
+                            return False
+                        wait = remaining if wait is None else min(wait, remaining)
+                    self._cond.wait(wait)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        """Suspend l'hôte (réponse 429)"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.stats['throttled'] += 1
+            self._cond.notify_all()
+
+
+_buckets: Dict[str, TokenBucket] = {
+    host: TokenBucket(host, rate) for host, rate in parse_limits(RATE_LIMITS).items() if rate > 0
+}
+_local = threading.local()
+
+
+def current_priority() -> int:
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+@contextmanager
+def batch():
+    """Les requêtes du thread courant passent en priorité BATCH"""
+    previous = current_priority()
+    _local.priority = BATCH
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def acquire(url: str, priority: Optional[int] = None) -> bool:
+    """Attend un jeton pour l'hôte de l'URL (toujours True si hôte non limité)"""
+    bucket = _buckets.get((urlsplit(url).hostname or '').lower())
+    if bucket is None:
+        return True
+    priority = current_priority() if priority is None else priority
+    return bucket.acquire(priority, None if priority == BATCH else RATE_INTERACTIVE_WAIT)
+
+
+def _retry_after(resp) -> float:
+    try:
+        return max(float(resp.headers.get('Retry-After', RATE_PENALTY)), 0.0)
+    except (TypeError, ValueError):
+        return RATE_PENALTY
+
+
+def request(url: str, session=None, method: str = 'GET', **kwargs):
+    """
+    requests.get/post avec respect du débit de l'hôte.
+
+    En priorité BATCH, un 429 est réessayé (CARETTE_RATE_BATCH_RETRIES fois)
+    après la pause de l'hôte.
+
+    Les URL sont redirigées vers le serveur de rejeu et les réponses
+    enregistrées si routing_cassette est configuré.
+
+    Raises:
+        RateLimited: jeton non obtenu à temps (priorité INTERACTIVE)
+    """
+    service = metrics.upstream_service(url)
+    url = routing_cassette.rewrite_url(url)
+    http = session or requests
+    bucket = _buckets.get((urlsplit(url).hostname or '').lower())
+    attempts = 1 + (RATE_BATCH_RETRIES if current_priority() == BATCH else 0)
+
+    for attempt in range(attempts):
+        if not acquire(url):
+            raise RateLimited(f"Débit dépassé pour {urlsplit(url).hostname}")
+        started = time.perf_counter()
+        try:
+            resp = http.request(method, url, **kwargs)
+        except requests.RequestException:
+            metrics.record_upstream(service, time.perf_counter() - started)
+            raise
+        metrics.record_upstream(service, time.perf_counter() - started, resp.status_code)
+        routing_cassette.record(resp)
+        if resp.status_code != 429:
+            return resp
+        delay = _retry_after(resp)
+        logger.warning(f"⚠️ 429 de {urlsplit(url).hostname}, pause {delay:.1f}s "
+                       f"(essai {attempt + 1}/{attempts})")
+        if bucket is not None:
+            bucket.pause(delay)
+        elif attempt + 1 < attempts:
+            time.sleep(delay)
+    return resp
+
+
+def get_stats() -> Dict[str, Dict]:
+    """Compteurs par hôte (jetons accordés, attentes, 429)"""
+    stats = {}
+    for host, bucket in _buckets.items():
+        with bucket._cond:
+            entry = dict(bucket.stats)
+            entry['queued'] = len(bucket._waiting)
+        entry['rate'] = bucket.rate
+        entry['wait_seconds'] = round(entry['wait_seconds'], 2)
+        stats[host] = entry
+    return stats
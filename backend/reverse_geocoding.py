@@ -0,0 +1,219 @@
+"""
+Cache à deux niveaux du géocodage inversé (/api/geocode/reverse, clics carte).
+
+- Niveau 1 : LRU en mémoire du processus (CARETTE_REVERSE_GEOCODE_CACHE_SIZE)
+- Niveau 2 : table MySQL reverse_geocoding_cache (partagée entre workers)
+
+Les coordonnées sont ramenées à une grille fixe d'environ
+CARETTE_REVERSE_GEOCODE_GRID_M mètres (défaut: 25) : des clics répétés
+autour d'un même site ou dans une même rue tombent dans la même case.
+Nominatim est interrogé au centre de la case, pour que la réponse en cache
+ne dépende pas du premier clic. Les entrées expirent après
+CARETTE_REVERSE_GEOCODE_TTL secondes (défaut: 30 jours) ; les lignes
+expirées sont supprimées par cron_jobs.py purge-reverse-geocode-cache.
+
+Les géocodages simultanés d'une même case partagent un seul appel (single_flight).
+"""
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+import rate_scheduler
+import single_flight
+
+logger = logging.getLogger(__name__)
+
+REVERSE_GEOCODE_CACHE_SIZE = int(os.getenv('CARETTE_REVERSE_GEOCODE_CACHE_SIZE', '5000'))
+REVERSE_GEOCODE_TTL = int(os.getenv('CARETTE_REVERSE_GEOCODE_TTL', str(30 * 86400)))
+REVERSE_GEOCODE_GRID_M = float(os.getenv('CARETTE_REVERSE_GEOCODE_GRID_M', '25'))
+
+NOMINATIM_REVERSE_URL = 'https://nominatim.openstreetmap.org/reverse'
+USER_AGENT = 'Carette-Carpool-Widget/1.0'
+METERS_PER_DEGREE_LAT = 111320.0
+
+# case → (réponse Nominatim, expiration)
+_memory: "OrderedDict[str, Tuple[Dict, float]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {
+    'memory_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+    'evictions': 0,
+    'errors': 0,
+    'db_errors': 0,
+}
+_flights = single_flight.get_group('reverse_geocode')
+
+
+def _incr(counter: str):
+    with _lock:
+        _stats[counter] += 1
+
+
+def grid_cell(lon: float, lat: float) -> Tuple[str, float, float]:
+    """
+    Case de la grille contenant un point.
+
+    Les rangées font GRID_M mètres de haut ; dans chaque rangée, la largeur
+    des cases en degrés de longitude est corrigée par le cosinus de la
+    latitude du centre de la rangée (cases ~carrées à toute latitude).
+
+    Returns:
+        (clé de la case, lon du centre, lat du centre)
+    """
+    step_lat = REVERSE_GEOCODE_GRID_M / METERS_PER_DEGREE_LAT
+    row = math.floor(lat / step_lat)
+    center_lat = (row + 0.5) * step_lat
+    step_lon = step_lat / max(math.cos(math.radians(center_lat)), 0.01)
+    col = math.floor(lon / step_lon)
+    center_lon = (col + 0.5) * step_lon
+    return f"{REVERSE_GEOCODE_GRID_M:g}:{row}:{col}", round(center_lon, 7), round(center_lat, 7)
+
+
+# ============================================================================
+# Cache
+# ============================================================================
+
+def _memory_get(key: str) -> Optional[Dict]:
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        data, expires_at = entry
+        if expires_at < time.time():
+            del _memory[key]
+            _stats['evictions'] += 1
+            return None
+        _memory.move_to_end(key)
+        return data
+
+
+def _memory_set(key: str, data: Dict, expires_at: float):
+    with _lock:
+        _memory[key] = (data, expires_at)
+        _memory.move_to_end(key)
+        while len(_memory) > REVERSE_GEOCODE_CACHE_SIZE:
+            _memory.popitem(last=False)
+            _stats['evictions'] += 1
+
+
+def _db_get(key: str) -> Optional[Tuple[Dict, float]]:
+    import sql
+    with sql.db_cursor() as cur:
+        cur.execute("""
+            SELECT response, UNIX_TIMESTAMP(expires_at) AS expires_ts
+            FROM reverse_geocoding_cache
+            WHERE cell_key = %s AND expires_at > NOW()
+        """, (key,))
+        row = cur.fetchone()
+    if not row:
+        return None
+    return json.loads(row['response']), float(row['expires_ts'])
+
+
+def _db_set(key: str, lon: float, lat: float, data: Dict):
+    import sql
+    with sql.db_cursor() as cur:
+        cur.execute("""
+            INSERT INTO reverse_geocoding_cache (cell_key, longitude, latitude, response, expires_at)
+            VALUES (%s, %s, %s, %s, NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE
+                response = VALUES(response),
+                expires_at = VALUES(expires_at)
+        """, (key, lon, lat, json.dumps(data, ensure_ascii=False), REVERSE_GEOCODE_TTL))
+
+
+# ============================================================================
+# API
+# ============================================================================
+
+def _nominatim_reverse(lon: float, lat: float) -> Dict:
+    response = rate_scheduler.request(NOMINATIM_REVERSE_URL, params={'format': 'json', 'lat': lat, 'lon': lon},
+                                      headers={'User-Agent': USER_AGENT}, timeout=10)
+    response.raise_for_status()
+    return response.json()
+
+
+def _lookup(key: str, lon: float, lat: float) -> Optional[Dict]:
+    data = _memory_get(key)
+    if data is not None:
+        return data
+
+    try:
+        row = _db_get(key)
+    except Exception as e:
+        logger.warning(f"⚠️ Cache géocodage inversé illisible: {e}")
+        _incr('db_errors')
+        row = None
+    if row is not None:
+        _incr('db_hits')
+        _memory_set(key, row[0], row[1])
+        return row[0]
+
+    _incr('misses')
+    try:
+        data = _nominatim_reverse(lon, lat)
+    except Exception as e:
+        logger.warning(f"⚠️ Géocodage inversé Nominatim indisponible ({lat}, {lon}): {e}")
+        _incr('errors')
+        return None
+
+    # Réponses "Unable to geocode" (mer, zone vide) aussi mises en cache
+    _memory_set(key, data, time.time() + REVERSE_GEOCODE_TTL)
+    try:
+        _db_set(key, lon, lat, data)
+    except Exception as e:
+        logger.warning(f"⚠️ Cache géocodage inversé non enregistré: {e}")
+        _incr('db_errors')
+    return data
+
+
+def reverse_geocode(lon: float, lat: float) -> Optional[Dict]:
+    """
+    Adresse d'un point (réponse JSON Nominatim /reverse pour le centre de sa case).
+
+    Returns:
+        Réponse Nominatim, ou None si Nominatim est injoignable
+    """
+    key, center_lon, center_lat = grid_cell(lon, lat)
+    data = _memory_get(key)
+    if data is not None:
+        _incr('memory_hits')
+        return data
+    return _flights.do(key, _lookup, key, center_lon, center_lat)
+
+
+def purge_expired() -> int:
+    """Supprime les entrées expirées (mémoire + MySQL). Retourne le nombre de lignes MySQL supprimées."""
+    now = time.time()
+    with _lock:
+        expired = [k for k, (_, exp) in _memory.items() if exp < now]
+        for k in expired:
+            del _memory[k]
+        _stats['evictions'] += len(expired)
+
+    import sql
+    with sql.db_cursor() as cur:
+        cur.execute("DELETE FROM reverse_geocoding_cache WHERE expires_at <= NOW()")
+        return cur.rowcount
+
+
+def clear_memory():
+    """Vide le niveau mémoire (les compteurs sont conservés)"""
+    with _lock:
+        _memory.clear()
+
+
+def get_stats() -> Dict:
+    """Compteurs hits/misses et taux de succès du cache"""
+    with _lock:
+        stats = dict(_stats)
+        stats['memory_size'] = len(_memory)
+    lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+    stats['hit_ratio'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 4) if lookups else 0.0
+    return stats
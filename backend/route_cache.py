@@ -0,0 +1,191 @@
+"""
+Cache à deux niveaux des durées/distances OSRM.
+
+- Niveau 1 : LRU en mémoire du processus (accès immédiat)
+- Niveau 2 : table MySQL osrm_route_cache (partagée entre workers et cron)
+
+Les clés sont construites à partir des coordonnées arrondies à 4 décimales
+(~10 m) : un domicile ou un site géocodé deux fois avec un léger écart
+tombe sur la même entrée. Les entrées expirent après CARETTE_ROUTE_CACHE_TTL
+secondes (défaut: 30 jours).
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROUTE_CACHE_ENABLED = os.getenv('CARETTE_ROUTE_CACHE', 'true').lower() == 'true'
+ROUTE_CACHE_DB_ENABLED = os.getenv('CARETTE_ROUTE_CACHE_DB', 'true').lower() == 'true'
+ROUTE_CACHE_SIZE = int(os.getenv('CARETTE_ROUTE_CACHE_SIZE', '10000'))
+ROUTE_CACHE_TTL = int(os.getenv('CARETTE_ROUTE_CACHE_TTL', str(30 * 86400)))
+
+# 4 décimales ≈ 11 m en latitude, ~8 m en longitude en France
+SNAP_DECIMALS = 4
+
+_memory: "OrderedDict[str, Tuple[float, float, float]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {
+    'memory_hits': 0,
+    'db_hits': 0,
+    'misses': 0,
+    'stores': 0,
+    'evictions': 0,
+    'db_errors': 0,
+}
+
+
+def snap_coord(coord: Sequence[float]) -> Tuple[float, float]:
+    """Arrondit (lon, lat) à la grille de ~10 m"""
+    return round(float(coord[0]), SNAP_DECIMALS), round(float(coord[1]), SNAP_DECIMALS)
+
+
+def make_key(coords: Sequence[Sequence[float]]) -> str:
+    """Clé de cache (sha1) d'une séquence ordonnée de points"""
+    snapped = ';'.join('%.*f,%.*f' % (SNAP_DECIMALS, lon, SNAP_DECIMALS, lat)
+                       for lon, lat in (snap_coord(c) for c in coords))
+    return hashlib.sha1(snapped.encode()).hexdigest()
+
+
+def _incr(counter: str):
+    with _lock:
+        _stats[counter] += 1
+
+
+def _memory_get(key: str) -> Optional[Tuple[float, float]]:
+    with _lock:
+        entry = _memory.get(key)
+        if entry is None:
+            return None
+        duration, distance, expires_at = entry
+        if expires_at < time.time():
+            del _memory[key]
+            _stats['evictions'] += 1
+            return None
+        _memory.move_to_end(key)
+        return duration, distance
+
+
+def _memory_set(key: str, duration: float, distance: float, expires_at: float):
+    with _lock:
+        _memory[key] = (duration, distance, expires_at)
+        _memory.move_to_end(key)
+        while len(_memory) > ROUTE_CACHE_SIZE:
+            _memory.popitem(last=False)
+            _stats['evictions'] += 1
+
+
+def _db_get(key: str) -> Optional[Tuple[float, float, float]]:
+    import sql
+    with sql.db_cursor() as cur:
+        cur.execute("""
+            SELECT duration, distance, UNIX_TIMESTAMP(expires_at) AS expires_ts
+            FROM osrm_route_cache
+            WHERE route_key = %s AND expires_at > NOW()
+        """, (key,))
+        row = cur.fetchone()
+    if not row:
+        return None
+    return float(row['duration']), float(row['distance']), float(row['expires_ts'])
+
+
+def _db_set(key: str, coords: Sequence[Sequence[float]], duration: float, distance: float):
+    import sql
+    snapped = ';'.join(f"{lon},{lat}" for lon, lat in (snap_coord(c) for c in coords))
+    with sql.db_cursor() as cur:
+        cur.execute("""
+            INSERT INTO osrm_route_cache (route_key, coords, duration, distance, expires_at)
+            VALUES (%s, %s, %s, %s, NOW() + INTERVAL %s SECOND)
+            ON DUPLICATE KEY UPDATE
+                duration = VALUES(duration),
+                distance = VALUES(distance),
+                expires_at = VALUES(expires_at)
+        """, (key, snapped[:1000], duration, distance, ROUTE_CACHE_TTL))
+
+
+def get_route(coords: Sequence[Sequence[float]]) -> Optional[Tuple[float, float]]:
+    """
+    Cherche une route en cache (mémoire puis MySQL).
+
+    Returns:
+        Tuple (durée en secondes, distance en mètres) ou None si absent
+    """
+    if not ROUTE_CACHE_ENABLED:
+        return None
+
+    key = make_key(coords)
+    cached = _memory_get(key)
+    if cached is not None:
+        _incr('memory_hits')
+        return cached
+
+    if ROUTE_CACHE_DB_ENABLED:
+        try:
+            row = _db_get(key)
+        except Exception as e:
+            logger.warning(f"⚠️ Route cache DB read failed: {e}")
+            _incr('db_errors')
+            row = None
+        if row is not None:
+            duration, distance, expires_at = row
+            _memory_set(key, duration, distance, expires_at)
+            _incr('db_hits')
+            return duration, distance
+
+    _incr('misses')
+    return None
+
+
+def set_route(coords: Sequence[Sequence[float]], duration: float, distance: float):
+    """Enregistre la durée (s) et la distance (m) d'une route dans les deux niveaux"""
+    if not ROUTE_CACHE_ENABLED:
+        return
+
+    key = make_key(coords)
+    _memory_set(key, duration, distance, time.time() + ROUTE_CACHE_TTL)
+    _incr('stores')
+
+    if ROUTE_CACHE_DB_ENABLED:
+        try:
+            _db_set(key, coords, duration, distance)
+        except Exception as e:
+            logger.warning(f"⚠️ Route cache DB write failed: {e}")
+            _incr('db_errors')
+
+
+def purge_expired() -> int:
+    """Supprime les entrées expirées (mémoire + MySQL). Retourne le nombre de lignes MySQL supprimées."""
+    now = time.time()
+    with _lock:
+        expired = [k for k, (_, _, exp) in _memory.items() if exp < now]
+        for k in expired:
+            del _memory[k]
+        _stats['evictions'] += len(expired)
+
+    if not ROUTE_CACHE_DB_ENABLED:
+        return 0
+
+    import sql
+    with sql.db_cursor() as cur:
+        cur.execute("DELETE FROM osrm_route_cache WHERE expires_at <= NOW()")
+        return cur.rowcount
+
+
+def clear_memory():
+    """Vide le niveau mémoire (les compteurs sont conservés)"""
+    with _lock:
+        _memory.clear()
+
+
+def get_stats() -> Dict:
+    """Compteurs hits/misses et taux de succès du cache"""
+    with _lock:
+        stats = dict(_stats)
+        stats['memory_size'] = len(_memory)
+    lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+    stats['hit_ratio'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 4) if lookups else 0.0
+    return stats
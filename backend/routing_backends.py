@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Moteurs de routage alternatifs aux serveurs OSRM (hors ligne, secours).
+
+- 'osrm'     : serveurs OSRM publics ou auto-hébergés (osrm_client, défaut)
+- 'graph'    : graphe routier local (CARETTE_ROUTING_GRAPH_FILE, .npz),
+               plus courts chemins Dijkstra sur matrice d'adjacence creuse (CSR)
+- 'estimate' : distance à vol d'oiseau × coefficient de détour (circuité),
+               durée = temps fixe + distance / vitesse moyenne
+
+CARETTE_ROUTING_BACKEND choisit le moteur utilisé par osrm_client ;
+CARETTE_ROUTING_FALLBACK (optionnel, ex. 'estimate') prend le relais quand
+tous les serveurs OSRM échouent.
+
+Les réponses reprennent le format JSON d'OSRM (routes, durations, waypoints)
+pour que osrm_client et ses appelants restent inchangés ; elles portent en
+plus 'backend' (ces valeurs ne sont pas mises dans route_cache). Les
+géométries sont toujours en GeoJSON, les étapes (steps) toujours vides.
+
+Format du graphe (.npz, arcs orientés : une rue à double sens = deux arcs) :
+    node_coords    float (N, 2)   lon, lat
+    edge_from      int   (E,)
+    edge_to        int   (E,)
+    edge_duration  float (E,)     secondes
+    edge_distance  float (E,)     mètres
+
+Calibrage de l'estimateur sur les routes du cache OSRM :
+    python routing_backends.py calibrate
+"""
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+ROUTING_BACKEND = os.getenv('CARETTE_ROUTING_BACKEND', 'osrm').lower()
+ROUTING_FALLBACK = os.getenv('CARETTE_ROUTING_FALLBACK', '').lower()
+ROUTING_GRAPH_FILE = os.getenv('CARETTE_ROUTING_GRAPH_FILE', '')
+ROUTING_CIRCUITY = float(os.getenv('CARETTE_ROUTING_CIRCUITY', '1.3'))
+ROUTING_SPEED_KMH = float(os.getenv('CARETTE_ROUTING_SPEED_KMH', '55'))
+ROUTING_OVERHEAD_S = float(os.getenv('CARETTE_ROUTING_OVERHEAD_S', '90'))
+
+EARTH_RADIUS_M = 6371000.0
+# Trajet entre un point et le nœud du graphe le plus proche (~30 km/h)
+ACCESS_SPEED_MS = 30 / 3.6
+
+_backends: Dict[str, object] = {}
+_backends_lock = threading.Lock()
+
+
+def haversine_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Distances (m) entre deux ensembles de points (lon, lat) : matrice len(a) × len(b)"""
+    a = np.radians(np.asarray(a, dtype=float).reshape(-1, 2))
+    b = np.radians(np.asarray(b, dtype=float).reshape(-1, 2))
+    lat1, lat2 = a[:, 1][:, None], b[:, 1][None, :]
+    dlat = lat2 - lat1
+    dlon = b[:, 0][None, :] - a[:, 0][:, None]
+    h = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+
+def _route_response(backend: str, coords, legs: List[Tuple[float, float]],
+                    geometry: Optional[List[List[float]]], overview: str,
+                    snapped: Optional[List[List[float]]] = None) -> Dict:
+    """Réponse au format OSRM /route (une seule route, pas d'alternative)"""
+    route = {
+        'duration': float(sum(d for d, _ in legs)),
+        'distance': float(sum(m for _, m in legs)),
+        'legs': [{'duration': float(d), 'distance': float(m), 'steps': [], 'summary': ''} for d, m in legs],
+        'weight': float(sum(d for d, _ in legs)),
+        'weight_name': 'duration',
+    }
+    if overview != 'false' and geometry is not None:
+        route['geometry'] = {'type': 'LineString', 'coordinates': geometry}
+    waypoints = snapped or [list(map(float, c)) for c in coords]
+    return {
+        'code': 'Ok',
+        'backend': backend,
+        'routes': [route],
+        'waypoints': [{'location': location, 'name': ''} for location in waypoints],
+    }
+
+
+def _table_response(backend: str, durations: np.ndarray, distances: Optional[np.ndarray],
+                    annotations: str) -> Dict:
+    """Réponse au format OSRM /table (None pour les paires non routables)"""
+    def to_lists(matrix):
+        return [[None if not np.isfinite(v) else float(v) for v in row] for row in matrix]
+
+    data = {'code': 'Ok', 'backend': backend}
+    if 'duration' in annotations:
+        data['durations'] = to_lists(durations)
+    if 'distance' in annotations and distances is not None:
+        data['distances'] = to_lists(distances)
+    return data
+
+
+class EstimateBackend:
+    """Estimation sans réseau routier : vol d'oiseau × circuité"""
+
+    name = 'estimate'
+
+    def __init__(self, circuity: float = ROUTING_CIRCUITY, speed_kmh: float = ROUTING_SPEED_KMH,
+                 overhead_s: float = ROUTING_OVERHEAD_S):
+        self.circuity = circuity
+        self.speed_ms = speed_kmh / 3.6
+        self.overhead_s = overhead_s
+
+    def _estimate(self, crow_m: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        distance = crow_m * self.circuity
+        duration = np.where(distance > 0, self.overhead_s + distance / self.speed_ms, 0.0)
+        return duration, distance
+
+    def route(self, coords, overview='false', geometries=None, steps=False, alternatives=None) -> Optional[Dict]:
+        points = np.asarray(coords, dtype=float)
+        crow = np.array([haversine_matrix(points[i], points[i + 1])[0, 0] for i in range(len(points) - 1)])
+        duration, distance = self._estimate(crow)
+        return _route_response(self.name, coords, list(zip(duration, distance)),
+                               points.tolist(), overview)
+
+    def table(self, coords, sources=None, destinations=None, annotations='duration') -> Optional[Dict]:
+        points = np.asarray(coords, dtype=float)
+        src = points if sources is None else points[list(sources)]
+        dst = points if destinations is None else points[list(destinations)]
+        duration, distance = self._estimate(haversine_matrix(src, dst))
+        return _table_response(self.name, duration, distance, annotations)
+
+    def nearest(self, coord, number=1) -> Optional[Dict]:
+        return {'code': 'Ok', 'backend': self.name,
+                'waypoints': [{'location': list(map(float, coord)), 'distance': 0.0, 'name': ''}]}
+
+
+class GraphBackend:
+    """Routage sur un graphe routier local chargé depuis un fichier .npz"""
+
+    name = 'graph'
+
+    def __init__(self, path: str):
+        from scipy.sparse import csr_matrix
+        from scipy.spatial import cKDTree
+
+        data = np.load(path)
+        self.node_coords = np.asarray(data['node_coords'], dtype=float)
+        n = len(self.node_coords)
+        edge_from = np.asarray(data['edge_from'], dtype=np.int64)
+        edge_to = np.asarray(data['edge_to'], dtype=np.int64)
+        # Dijkstra ignore les poids nuls d'une matrice creuse
+        edge_duration = np.maximum(np.asarray(data['edge_duration'], dtype=float), 1e-3)
+        edge_distance = np.asarray(data['edge_distance'], dtype=float)
+
+        # Arcs parallèles : garder le plus rapide (csr_matrix additionnerait les doublons)
+        order = np.lexsort((edge_duration, edge_to, edge_from))
+        edge_from, edge_to = edge_from[order], edge_to[order]
+        edge_duration, edge_distance = edge_duration[order], edge_distance[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (edge_from[1:] != edge_from[:-1]) | (edge_to[1:] != edge_to[:-1])
+        edge_from, edge_to = edge_from[first], edge_to[first]
+
+        self.durations = csr_matrix((edge_duration[first], (edge_from, edge_to)), shape=(n, n))
+        self.distances = csr_matrix((edge_distance[first], (edge_from, edge_to)), shape=(n, n))
+
+        # Projection équirectangulaire locale pour la recherche du nœud le plus proche
+        self._lat0 = np.radians(self.node_coords[:, 1].mean()) if n else 0.0
+        self._tree = cKDTree(self._project(self.node_coords))
+        logger.info(f"🗺️ Graphe routier chargé: {n} nœuds, {int(first.sum())} arcs ({path})")
+
+    def _project(self, points: np.ndarray) -> np.ndarray:
+        points = np.radians(np.asarray(points, dtype=float).reshape(-1, 2))
+        return np.column_stack((points[:, 0] * np.cos(self._lat0), points[:, 1])) * EARTH_RADIUS_M
+
+    def snap(self, coords) -> Tuple[np.ndarray, np.ndarray]:
+        """Nœud le plus proche de chaque point et distance d'accès (m)"""
+        points = np.asarray(coords, dtype=float).reshape(-1, 2)
+        _, nodes = self._tree.query(self._project(points))
+        nodes = np.asarray(nodes, dtype=np.int64).reshape(-1)
+        access = np.diag(haversine_matrix(points, self.node_coords[nodes])) if len(points) else np.zeros(0)
+        return nodes, access
+
+    def _dijkstra(self, source: int, predecessors: bool = False):
+        from scipy.sparse.csgraph import dijkstra
+        return dijkstra(self.durations, directed=True, indices=source, return_predecessors=predecessors)
+
+    def _tree_distances(self, pred: np.ndarray) -> np.ndarray:
+        """Distance (m) de la source à chaque nœud le long de l'arbre des plus courts chemins"""
+        nodes = np.arange(len(pred))
+        has_parent = pred >= 0
+        acc = np.zeros(len(pred))
+        acc[has_parent] = np.asarray(self.distances[pred[has_parent], nodes[has_parent]]).ravel()
+        parent = np.where(has_parent, pred, nodes)
+        # Saut de pointeurs : log2(profondeur) passes vectorisées
+        while True:
+            grandparent = parent[parent]
+            if np.array_equal(grandparent, parent):
+                return acc
+            acc = acc + acc[parent]
+            parent = grandparent
+
+    def route(self, coords, overview='false', geometries=None, steps=False, alternatives=None) -> Optional[Dict]:
+        nodes, access = self.snap(coords)
+        legs = []
+        geometry = [list(map(float, coords[0]))]
+        for i in range(len(nodes) - 1):
+            src, dst = int(nodes[i]), int(nodes[i + 1])
+            durations, pred = self._dijkstra(src, predecessors=True)
+            if not np.isfinite(durations[dst]):
+                return None
+
+            path = [dst]
+            while path[-1] != src:
+                path.append(int(pred[path[-1]]))
+            path.reverse()
+            path = np.array(path)
+            distance = float(np.asarray(self.distances[path[:-1], path[1:]]).sum()) if len(path) > 1 else 0.0
+
+            access_m = access[i] + access[i + 1]
+            legs.append((durations[dst] + access_m / ACCESS_SPEED_MS, distance + access_m))
+            geometry.extend(self.node_coords[path].tolist())
+            geometry.append(list(map(float, coords[i + 1])))
+
+        return _route_response(self.name, coords, legs, geometry, overview,
+                               snapped=self.node_coords[nodes].tolist())
+
+    def table(self, coords, sources=None, destinations=None, annotations='duration') -> Optional[Dict]:
+        sources = list(range(len(coords))) if sources is None else list(sources)
+        destinations = list(range(len(coords))) if destinations is None else list(destinations)
+        nodes, access = self.snap(coords)
+        dst_nodes = nodes[destinations]
+        dst_access = access[destinations]
+        want_distance = 'distance' in annotations
+
+        durations = np.full((len(sources), len(destinations)), np.inf)
+        distances = np.full((len(sources), len(destinations)), np.inf) if want_distance else None
+        rows_by_node = {}
+        for row, index in enumerate(sources):
+            rows_by_node.setdefault(int(nodes[index]), []).append(row)
+
+        # Un Dijkstra par nœud source distinct
+        for node, rows in rows_by_node.items():
+            if want_distance:
+                tree, pred = self._dijkstra(node, predecessors=True)
+                along = self._tree_distances(pred)[dst_nodes]
+            else:
+                tree = self._dijkstra(node)
+            for row in rows:
+                access_m = access[sources[row]] + dst_access
+                durations[row] = tree[dst_nodes] + access_m / ACCESS_SPEED_MS
+                if want_distance:
+                    distances[row] = along + access_m
+
+        # Un point vers lui-même : 0, comme OSRM
+        same = np.array(sources)[:, None] == np.array(destinations)[None, :]
+        durations[same] = 0.0
+        if want_distance:
+            distances[same] = 0.0
+        return _table_response(self.name, durations, distances, annotations)
+
+    def nearest(self, coord, number=1) -> Optional[Dict]:
+        nodes, access = self.snap([coord])
+        return {'code': 'Ok', 'backend': self.name,
+                'waypoints': [{'location': self.node_coords[nodes[0]].tolist(),
+                               'distance': float(access[0]), 'name': ''}]}
+
+
+def get_backend(name: str):
+    """Instance du moteur 'graph' ou 'estimate' (None pour 'osrm' ou si indisponible)"""
+    if not name or name == 'osrm':
+        return None
+    with _backends_lock:
+        if name not in _backends:
+            try:
+                if name == 'estimate':
+                    _backends[name] = EstimateBackend()
+                elif name == 'graph':
+                    if not ROUTING_GRAPH_FILE:
+                        raise ValueError("CARETTE_ROUTING_GRAPH_FILE non défini")
+                    _backends[name] = GraphBackend(ROUTING_GRAPH_FILE)
+                else:
+                    raise ValueError(f"moteur inconnu '{name}'")
+            except Exception as e:
+                logger.error(f"❌ Moteur de routage '{name}' indisponible, OSRM utilisé: {e}")
+                _backends[name] = None
+        return _backends[name]
+
+
+def active_backend():
+    """Moteur configuré (None = serveurs OSRM)"""
+    return get_backend(ROUTING_BACKEND)
+
+
+def fallback_backend():
+    """Moteur de secours quand OSRM échoue (None si non configuré)"""
+    return get_backend(ROUTING_FALLBACK)
+
+
+def calibrate(limit: int = 5000) -> Optional[Dict]:
+    """
+    Calibre l'estimateur sur les routes à deux points du cache OSRM :
+    circuité = médiane(distance routière / vol d'oiseau), puis
+    durée ≈ temps fixe + distance / vitesse (moindres carrés).
+    """
+    import sql
+    with sql.db_cursor() as cur:
+        cur.execute("""
+            SELECT coords, duration, distance FROM osrm_route_cache
+            WHERE expires_at > NOW() AND distance > 0
+            LIMIT %s
+        """, (limit,))
+        rows = cur.fetchall()
+
+    samples = []
+    for row in rows:
+        points = row['coords'].split(';')
+        if len(points) != 2:
+            continue
+        a, b = ([float(v) for v in p.split(',')] for p in points)
+        crow = haversine_matrix(a, b)[0, 0]
+        if crow > 500:
+            samples.append((crow, float(row['distance']), float(row['duration'])))
+    if len(samples) < 10:
+        return None
+
+    crow, distance, duration = (np.array(col) for col in zip(*samples))
+    slope, intercept = np.polyfit(distance, duration, 1)
+    return {
+        'samples': len(samples),
+        'circuity': round(float(np.median(distance / crow)), 3),
+        'speed_kmh': round(3.6 / slope, 1) if slope > 0 else ROUTING_SPEED_KMH,
+        'overhead_s': round(max(float(intercept), 0.0), 0),
+    }
+
+
+if __name__ == '__main__':
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'calibrate':
+        result = calibrate()
+        if not result:
+            print("⚠️ Pas assez de routes en cache pour calibrer")
+            sys.exit(1)
+        print(f"📊 Calibrage sur {result['samples']} routes du cache OSRM :")
+        print(f"CARETTE_ROUTING_CIRCUITY={result['circuity']}")
+        print(f"CARETTE_ROUTING_SPEED_KMH={result['speed_kmh']}")
+        print(f"CARETTE_ROUTING_OVERHEAD_S={result['overhead_s']:.0f}")
+    else:
+        print("Usage: python routing_backends.py calibrate")
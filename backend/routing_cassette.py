@@ -0,0 +1,356 @@
+#!/usr/bin/env python3
+"""
+Enregistrement / rejeu des réponses OSRM, BAN et Nominatim (cassette).
+
+Pour mesurer nos propres chemins de code (recherche, buffers, matching) sans
+dépendre de la latence des serveurs publics :
+
+1. Enregistrer : CARETTE_CASSETTE_RECORD=/chemin/cassette.json
+   Chaque réponse obtenue via rate_scheduler.request est ajoutée au fichier.
+
+2. Rejouer : lancer le serveur local de remplacement
+       python routing_cassette.py serve cassette.json --port 5900 --latency 0.08
+   puis CARETTE_HTTP_REPLAY_URL=http://127.0.0.1:5900 (et CARETTE_OSRM_URL /
+   CARETTE_OSRM_FALLBACK_URLS inchangés) : toutes les requêtes sortantes
+   https://hôte/chemin sont redirigées vers http://127.0.0.1:5900/hôte/chemin.
+   Avec --synthesize, les requêtes OSRM absentes de la cassette sont calculées
+   par routing_backends (estimate, ou graph avec --graph fichier.npz), et les
+   géocodages BAN absents (/search/ et géocodeur CSV /search/csv/) reçoivent
+   des coordonnées déterministes autour de SYNTH_CENTER.
+
+Clés : méthode + hôte + chemin + paramètres triés (les requêtes OSRM sont
+indépendantes du serveur : un trajet enregistré sur le principal est rejoué
+pour les secours), plus une empreinte du corps pour les POST (la frontière
+aléatoire des corps multipart est neutralisée).
+"""
+import atexit
+import csv
+import hashlib
+import io
+import json
+import math
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qsl, unquote, urlencode, urlsplit
+
+logger = logging.getLogger(__name__)
+
+CASSETTE_RECORD = os.getenv('CARETTE_CASSETTE_RECORD', '')
+HTTP_REPLAY_URL = os.getenv('CARETTE_HTTP_REPLAY_URL', '').rstrip('/')
+
+OSRM_PATH = re.compile(r'/(route|table|nearest|trip|match)/v1/.*$')
+BAN_HOST = 'api-adresse.data.gouv.fr'
+# Centre des géocodages BAN synthétiques (site de benchmarks/synthetic.py), rayon en km
+SYNTH_CENTER = (4.8357, 45.7640)
+SYNTH_RADIUS_KM = 25.0
+# Écriture du fichier toutes les N réponses enregistrées (et à la sortie)
+FLUSH_EVERY = 50
+
+_entries: Dict[str, Dict] = {}
+_lock = threading.Lock()
+_unsaved = 0
+
+
+def make_key(method: str, url: str, body=None) -> str:
+    """Clé de cassette d'une requête"""
+    parts = urlsplit(url)
+    path = unquote(parts.path)
+    osrm = OSRM_PATH.search(path)
+    target = 'osrm' + osrm.group(0) if osrm else (parts.hostname or '') + path
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    key = f"{method.upper()} {target}" + (f"?{query}" if query else '')
+    if body:
+        if isinstance(body, str):
+            body = body.encode()
+        if body.startswith(b'--'):
+            # multipart/form-data : frontière aléatoire à chaque envoi
+            boundary = body.split(b'\r\n', 1)[0]
+            body = body.replace(boundary, b'--boundary')
+        key += ' #' + hashlib.sha1(body).hexdigest()[:16]
+    return key
+
+
+def load(path: str) -> Dict[str, Dict]:
+    """Entrées d'une cassette ({} si le fichier n'existe pas)"""
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f).get('entries', {})
+
+
+def save(path: str, entries: Dict[str, Dict]):
+    """Écrit la cassette (remplacement atomique)"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 1, 'entries': entries}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def rewrite_url(url: str) -> str:
+    """Redirige une URL externe vers le serveur de rejeu (si configuré)"""
+    if not HTTP_REPLAY_URL or url.startswith(HTTP_REPLAY_URL):
+        return url
+    parts = urlsplit(url)
+    rewritten = f"{HTTP_REPLAY_URL}/{parts.hostname}{parts.path}"
+    return f"{rewritten}?{parts.query}" if parts.query else rewritten
+
+
+def record(resp):
+    """Ajoute une réponse à la cassette (si CARETTE_CASSETTE_RECORD est défini)"""
+    global _unsaved
+    if not CASSETTE_RECORD or resp.status_code == 429 or resp.status_code >= 500:
+        return
+    request = resp.request
+    key = make_key(request.method, request.url, request.body)
+    entry = {
+        'status': resp.status_code,
+        'content_type': resp.headers.get('Content-Type', 'application/json'),
+        'body': resp.text,
+    }
+    with _lock:
+        if not _entries:
+            _entries.update(load(CASSETTE_RECORD))
+        _entries[key] = entry
+        _unsaved += 1
+        if _unsaved >= FLUSH_EVERY:
+            flush()
+
+
+def flush():
+    """Écrit les réponses enregistrées en attente (appelant : _lock tenu)"""
+    global _unsaved
+    if CASSETTE_RECORD and _unsaved:
+        save(CASSETTE_RECORD, _entries)
+        _unsaved = 0
+
+
+def _flush_at_exit():
+    with _lock:
+        flush()
+
+
+if CASSETTE_RECORD:
+    atexit.register(_flush_at_exit)
+
+
+def synthesize_osrm(path: str, query: str, backend) -> Optional[Dict]:
+    """Réponse OSRM calculée par un moteur local pour une requête absente de la cassette"""
+    match = OSRM_PATH.search(unquote(path))
+    if not match:
+        return None
+    service = match.group(1)
+    # /service/v1/profil/lon,lat;lon,lat
+    coords_part = match.group(0).split('/', 4)[-1]
+    coords = [[float(v) for v in point.split(',')] for point in coords_part.split(';') if point]
+    params = dict(parse_qsl(query))
+
+    def indices(name):
+        value = params.get(name)
+        return [int(i) for i in value.split(';')] if value and value != 'all' else None
+
+    if service == 'route':
+        data = backend.route(coords, overview=params.get('overview', 'simplified'))
+    elif service == 'table':
+        data = backend.table(coords, sources=indices('sources'), destinations=indices('destinations'),
+                             annotations=params.get('annotations', 'duration'))
+    elif service == 'nearest':
+        data = backend.nearest(coords[0])
+    else:
+        return None
+    if data:
+        data.pop('backend', None)
+    return data
+
+
+def synthetic_address_coords(address: str):
+    """Coordonnées (lon, lat) déterministes d'une adresse, à moins de SYNTH_RADIUS_KM du centre"""
+    from geocoding import normalize_address
+    digest = hashlib.sha1(normalize_address(address).encode('utf-8')).digest()
+    angle = int.from_bytes(digest[:4], 'big') / 2 ** 32 * 2 * math.pi
+    radius = math.sqrt(int.from_bytes(digest[4:8], 'big') / 2 ** 32) * SYNTH_RADIUS_KM
+    lat = SYNTH_CENTER[1] + radius * math.sin(angle) / 110.574
+    lon = SYNTH_CENTER[0] + radius * math.cos(angle) / (111.320 * math.cos(math.radians(SYNTH_CENTER[1])))
+    return round(lon, 6), round(lat, 6)
+
+
+def _ban_search_coords(entries: Dict[str, Dict], address: str):
+    """Réponse /search/ enregistrée pour une adresse, sinon coordonnées synthétiques"""
+    url = f"http://{BAN_HOST}/search/?" + urlencode({'q': address, 'limit': 1})
+    entry = entries.get(make_key('GET', url))
+    if entry is not None:
+        try:
+            feature = json.loads(entry['body'])['features'][0]
+            lon, lat = feature['geometry']['coordinates'][:2]
+            return lon, lat, feature['properties'].get('score', 0.9), feature['properties'].get('label', address)
+        except (ValueError, KeyError, IndexError):
+            return None
+    lon, lat = synthetic_address_coords(address)
+    return lon, lat, 0.9, address
+
+
+def _multipart_fields(body: bytes, content_type: str) -> Dict[str, bytes]:
+    """Champs d'un corps multipart/form-data"""
+    from email.parser import BytesParser
+    from email.policy import HTTP
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+
+def synthesize_ban(path: str, query: str, body: Optional[bytes], content_type: str,
+                   entries: Dict[str, Dict]) -> Optional[Dict]:
+    """Réponse BAN (/search/ ou /search/csv/) pour une requête absente de la cassette"""
+    if path.rstrip('/') == '/search':
+        q = dict(parse_qsl(query)).get('q', '')
+        found = _ban_search_coords(entries, q) if q else None
+        features = [] if found is None else [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [found[0], found[1]]},
+            'properties': {'label': found[3], 'score': found[2], 'type': 'housenumber'},
+        }]
+        return {'content_type': 'application/json',
+                'body': json.dumps({'type': 'FeatureCollection', 'features': features})}
+
+    if path.rstrip('/') == '/search/csv' and body:
+        fields = _multipart_fields(body, content_type)
+        data = (fields.get('data') or b'').decode('utf-8-sig')
+        column = (fields.get('columns') or b'adresse').decode('utf-8')
+        delimiter = ';' if ';' in data.split('\n', 1)[0] else ','
+        reader = csv.DictReader(io.StringIO(data), delimiter=delimiter)
+        output = io.StringIO()
+        writer = csv.writer(output, delimiter=delimiter)
+        writer.writerow(list(reader.fieldnames or []) + ['latitude', 'longitude', 'result_label', 'result_score'])
+        for row in reader:
+            address = (row.get(column) or '').strip()
+            found = _ban_search_coords(entries, address) if address else None
+            values = [row.get(name, '') for name in reader.fieldnames]
+            writer.writerow(values + ([found[1], found[0], found[3], found[2]] if found else ['', '', '', '']))
+        return {'content_type': 'text/csv; charset=utf-8', 'body': output.getvalue()}
+    return None
+
+
+def serve(cassette_path: str, host: str = '127.0.0.1', port: int = 5900,
+          latency: float = 0.0, jitter: float = 0.0, synthesize: bool = False,
+          graph_file: Optional[str] = None):
+    """Serveur HTTP local qui rejoue la cassette avec une latence artificielle"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    entries = load(cassette_path)
+    backend = None
+    if synthesize:
+        import routing_backends
+        backend = routing_backends.GraphBackend(graph_file) if graph_file else routing_backends.EstimateBackend()
+    stats = {'hits': 0, 'synthesized': 0, 'misses': 0}
+    stats_lock = threading.Lock()
+
+    class ReplayHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _reply(self, method: str):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else None
+            # /hôte/chemin?query → URL d'origine
+            url = 'http://' + self.path.lstrip('/')
+            entry = entries.get(make_key(method, url, body))
+            outcome = 'hits'
+
+            if entry is None and synthesize:
+                parts = urlsplit(url)
+                if parts.hostname == BAN_HOST:
+                    entry = synthesize_ban(parts.path, parts.query, body,
+                                           self.headers.get('Content-Type', ''), entries)
+                    if entry:
+                        entry['status'] = 200
+                else:
+                    data = synthesize_osrm(parts.path, parts.query, backend)
+                    if data:
+                        entry = {'status': 200, 'content_type': 'application/json', 'body': json.dumps(data)}
+                if entry:
+                    outcome = 'synthesized'
+            if entry is None:
+                entry = {'status': 404, 'content_type': 'application/json',
+                         'body': json.dumps({'code': 'NoCassetteEntry', 'message': self.path})}
+                outcome = 'misses'
+
+            with stats_lock:
+                stats[outcome] += 1
+            if latency or jitter:
+                time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+
+            payload = entry['body'].encode('utf-8')
+            self.send_response(entry['status'])
+            self.send_header('Content-Type', entry['content_type'])
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._reply('GET')
+
+        def do_POST(self):
+            self._reply('POST')
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    server = ThreadingHTTPServer((host, port), ReplayHandler)
+    server.daemon_threads = True
+    print(f"📼 Rejeu de {len(entries)} réponse(s) sur http://{host}:{port} "
+          f"(latence {latency * 1000:.0f}±{jitter * 1000:.0f} ms"
+          f"{', OSRM/BAN synthétisés' if synthesize else ''})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"📊 {stats['hits']} rejouée(s), {stats['synthesized']} synthétisée(s), {stats['misses']} absente(s)")
+    return server
+
+
+def info(cassette_path: str):
+    """Nombre de réponses enregistrées par service"""
+    counts = {}
+    for key in load(cassette_path):
+        target = key.split(' ', 1)[1]
+        service = target.split('/', 2)[1] if target.startswith('osrm/') else target.split('/', 1)[0]
+        name = f"osrm {service}" if target.startswith('osrm/') else service
+        counts[name] = counts.get(name, 0) + 1
+    print(f"📼 {cassette_path}: {sum(counts.values())} réponse(s)")
+    for name, count in sorted(counts.items()):
+        print(f"  {name}: {count}")
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    parser = argparse.ArgumentParser(description='Cassette OSRM/BAN/Nominatim')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    serve_parser = sub.add_parser('serve', help='Serveur local de rejeu')
+    serve_parser.add_argument('cassette')
+    serve_parser.add_argument('--host', default='127.0.0.1')
+    serve_parser.add_argument('--port', type=int, default=5900)
+    serve_parser.add_argument('--latency', type=float, default=0.0, help='Latence ajoutée (s)')
+    serve_parser.add_argument('--jitter', type=float, default=0.0, help='Variation aléatoire ± (s)')
+    serve_parser.add_argument('--synthesize', action='store_true',
+                              help='Calculer les requêtes OSRM (routing_backends) et BAN absentes')
+    serve_parser.add_argument('--graph', help='Graphe .npz pour --synthesize (défaut: estimation)')
+
+    info_parser = sub.add_parser('info', help='Contenu d\'une cassette')
+    info_parser.add_argument('cassette')
+
+    args = parser.parse_args()
+    if args.command == 'serve':
+        logging.basicConfig(level=logging.INFO)
+        serve(args.cassette, args.host, args.port, args.latency, args.jitter, args.synthesize, args.graph)
+    else:
+        info(args.cassette)
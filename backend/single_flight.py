@@ -0,0 +1,104 @@
+"""
+Regroupement (single-flight) des appels identiques en cours.
+
+Quand plusieurs threads demandent la même chose en même temps (même
+itinéraire OSRM, même adresse à géocoder), seul le premier appelle le
+service externe ; les autres attendent et reçoivent le même résultat (ou
+la même exception). Rien n'est conservé une fois l'appel terminé : le
+cache durable reste le rôle de route_cache / geocoding_cache.
+
+Désactivable avec CARETTE_SINGLE_FLIGHT=false.
+"""
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+SINGLE_FLIGHT_ENABLED = os.getenv('CARETTE_SINGLE_FLIGHT', 'true').lower() == 'true'
+
+_groups: Dict[str, "Group"] = {}
+_groups_lock = threading.Lock()
+
+
+class _Call:
+    """Appel en cours : résultat partagé entre le leader et ceux qui attendent"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class Group:
+    """Espace de clés indépendant (un par type d'appel)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, _Call] = {}
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'executed': 0, 'shared': 0}
+
+    def do(self, key: Hashable, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Exécute fn(*args, **kwargs), ou attend le résultat de l'appel
+        identique (même clé) déjà en cours dans un autre thread.
+        """
+        if not SINGLE_FLIGHT_ENABLED:
+            return fn(*args, **kwargs)
+
+        with self._lock:
+            self._stats['calls'] += 1
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._stats['shared'] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._stats['executed'] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn(*args, **kwargs)
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.debug(f"🔗 {self.name}: 1 appel partagé par {call.waiters + 1} demandes")
+            call.done.set()
+
+    def get_stats(self) -> Dict:
+        """Compteurs : appels demandés, exécutés, servis par un appel en cours"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = len(self._calls)
+        return stats
+
+
+def get_group(name: str) -> Group:
+    """Groupe nommé (créé au premier usage)"""
+    with _groups_lock:
+        group = _groups.get(name)
+        if group is None:
+            group = _groups[name] = Group(name)
+        return group
+
+
+def get_stats() -> Dict[str, Dict]:
+    """Compteurs de tous les groupes"""
+    with _groups_lock:
+        groups = list(_groups.values())
+    return {group.name: group.get_stats() for group in groups}
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Capture des requêtes SQL lentes (sql.db_cursor) et échantillonnage d'EXPLAIN.
+
+Toute requête plus longue que CARETTE_SLOW_QUERY_MS est :
+- normalisée (littéraux et paramètres → ?, listes IN (...) et VALUES multiples
+  repliées) pour regrouper les variantes d'une même requête dynamique
+- journalisée avec la forme de ses paramètres (types, tailles des listes),
+  jamais leurs valeurs (emails, adresses)
+- accompagnée de son plan EXPLAIN à la première occurrence dans le processus,
+  puis pour une fraction CARETTE_SLOW_QUERY_EXPLAIN_RATE des suivantes
+
+Les entrées sont ajoutées (une ligne JSON) à CARETTE_SLOW_QUERY_LOG.
+
+Usage :
+    python slow_queries.py top                 # requêtes les plus coûteuses (temps total)
+    python slow_queries.py top --hours 24 --limit 10
+    python slow_queries.py show <digest>       # détail et dernier plan EXPLAIN
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SLOW_QUERY_MS = float(os.getenv('CARETTE_SLOW_QUERY_MS', '200'))  # 0 = capture désactivée
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv('CARETTE_SLOW_QUERY_EXPLAIN_RATE', '0.1'))
+SLOW_QUERY_LOG = os.getenv('CARETTE_SLOW_QUERY_LOG', '/var/log/carette_slow_queries.jsonl')
+
+SLOW_QUERY_SECONDS = SLOW_QUERY_MS / 1000 if SLOW_QUERY_MS > 0 else float('inf')
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+MAX_SQL_LENGTH = 4000
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|%\(\w+\)s')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_VALUES_ROWS = re.compile(r'(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+')
+_COMMENT = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+_WHITESPACE = re.compile(r'\s+')
+
+_explained = set()
+_lock = threading.Lock()
+_log_failed = False
+
+
+def normalize(query: str) -> str:
+    """Forme canonique d'une requête (sans valeurs)"""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    query = _COMMENT.sub(' ', query)
+    query = _STRING.sub('?', query)
+    query = _PLACEHOLDER.sub('?', query)
+    query = _NUMBER.sub('?', query)
+    query = _IN_LIST.sub('IN (?+)', query)
+    query = _VALUES_ROWS.sub(r'\1, ...', query)
+    return _WHITESPACE.sub(' ', query).strip()
+
+
+def digest(normalized: str) -> str:
+    """Identifiant court d'une requête normalisée"""
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def _value_shape(value) -> str:
+    if isinstance(value, (list, tuple, set)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}({len(value)})"
+    return type(value).__name__
+
+
+def param_shape(args):
+    """Types (et tailles) des paramètres, sans leurs valeurs"""
+    if args is None:
+        return None
+    if isinstance(args, dict):
+        return {key: _value_shape(value) for key, value in args.items()}
+    if isinstance(args, (list, tuple)):
+        return [_value_shape(value) for value in args]
+    return _value_shape(args)
+
+
+def _request_endpoint() -> Optional[str]:
+    """Règle de route Flask de la requête en cours (None hors requête)"""
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            return request.url_rule.rule if request.url_rule is not None else request.path
+    except Exception:
+        pass
+    return None
+
+
+def explain(connection, query: str, args=None) -> Optional[List[Dict]]:
+    """Plan EXPLAIN d'une requête (colonnes utiles seulement), None si impossible"""
+    import pymysql
+
+    if not query.lstrip().upper().startswith(EXPLAINABLE):
+        return None
+    cursor = connection.cursor(pymysql.cursors.DictCursor)
+    try:
+        cursor.execute('EXPLAIN ' + query, args)
+        return [
+            {key: row.get(key) for key in ('table', 'type', 'possible_keys', 'key', 'rows', 'filtered', 'Extra')}
+            for row in cursor.fetchall()
+        ]
+    finally:
+        cursor.close()
+
+
+def plan_warnings(plan: Optional[List[Dict]]) -> List[str]:
+    """Signaux d'alerte d'un plan : parcours complet, tri ou table temporaire"""
+    warnings = []
+    for row in plan or []:
+        table = row.get('table')
+        extra = row.get('Extra') or ''
+        if row.get('type') == 'ALL':
+            warnings.append(f"full scan {table} ({row.get('rows')} lignes)")
+        if 'Using filesort' in extra:
+            warnings.append(f"filesort {table}")
+        if 'Using temporary' in extra:
+            warnings.append(f"temporary {table}")
+    return warnings
+
+
+def _should_explain(key: str) -> bool:
+    with _lock:
+        if key not in _explained:
+            _explained.add(key)
+            return True
+    return random.random() < SLOW_QUERY_EXPLAIN_RATE
+
+
+def _append(entry: Dict):
+    global _log_failed
+    if not SLOW_QUERY_LOG or _log_failed:
+        return
+    line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+    try:
+        with _lock, open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+            f.write(line)
+    except OSError as e:
+        _log_failed = True
+        logger.warning(f"⚠️ Journal des requêtes lentes indisponible ({SLOW_QUERY_LOG}): {e}")
+
+
+def capture(cursor, query: str, args, elapsed: float):
+    """Enregistre une requête lente (appelé par sql.TimedDictCursor)"""
+    try:
+        normalized = normalize(query)
+        key = digest(normalized)
+        plan = None
+        if _should_explain(key):
+            try:
+                plan = explain(cursor.connection, query, args)
+            except Exception as e:
+                logger.debug(f"EXPLAIN impossible pour {key}: {e}")
+        warnings = plan_warnings(plan)
+
+        logger.warning(f"🐢 Requête lente {elapsed * 1000:.0f} ms [{key}] {normalized[:200]}"
+                       + (f" — {', '.join(warnings)}" if warnings else ''))
+        _append({
+            'ts': datetime.now().isoformat(timespec='seconds'),
+            'digest': key,
+            'ms': round(elapsed * 1000, 1),
+            'sql': normalized[:MAX_SQL_LENGTH],
+            'params': param_shape(args),
+            'rows': cursor.rowcount,
+            'endpoint': _request_endpoint(),
+            'explain': plan,
+            'warnings': warnings,
+        })
+    except Exception as e:
+        logger.debug(f"Capture de requête lente impossible: {e}")
+
+
+# ============================================================================
+# Analyse du journal (CLI)
+# ============================================================================
+
+def read_log(path: str, hours: Optional[float] = None) -> List[Dict]:
+    """Entrées du journal (les hours dernières heures si précisé)"""
+    since = datetime.fromtimestamp(time.time() - hours * 3600).isoformat() if hours else None
+    entries = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if since is None or entry.get('ts', '') >= since:
+                entries.append(entry)
+    return entries
+
+
+def aggregate(entries: List[Dict]) -> List[Dict]:
+    """Regroupement par requête normalisée, trié par temps total décroissant"""
+    groups: Dict[str, Dict] = {}
+    for entry in entries:
+        group = groups.setdefault(entry['digest'], {
+            'digest': entry['digest'], 'sql': entry['sql'], 'count': 0, 'total_ms': 0.0,
+            'max_ms': 0.0, 'endpoints': set(), 'warnings': set(), 'explain': None, 'params': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['ms']
+        group['max_ms'] = max(group['max_ms'], entry['ms'])
+        group['params'] = entry.get('params')
+        if entry.get('endpoint'):
+            group['endpoints'].add(entry['endpoint'])
+        if entry.get('explain'):
+            group['explain'] = entry['explain']
+            group['warnings'] = set(entry.get('warnings') or [])
+    for group in groups.values():
+        group['avg_ms'] = group['total_ms'] / group['count']
+    return sorted(groups.values(), key=lambda g: g['total_ms'], reverse=True)
+
+
+def print_top(groups: List[Dict], limit: int):
+    total = sum(g['total_ms'] for g in groups) or 1.0
+    print(f"🐢 {len(groups)} requête(s) lente(s) distincte(s), {total / 1000:.1f} s au total\n")
+    print(f"{'digest':<17} {'nb':>6} {'total s':>9} {'%':>5} {'moy ms':>8} {'max ms':>8}  requête")
+    for group in groups[:limit]:
+        print(f"{group['digest']:<17} {group['count']:>6} {group['total_ms'] / 1000:>9.2f} "
+              f"{group['total_ms'] * 100 / total:>5.1f} {group['avg_ms']:>8.0f} {group['max_ms']:>8.0f}  "
+              f"{group['sql'][:90]}")
+        if group['warnings']:
+            print(f"{'':<17} ⚠️  {', '.join(sorted(group['warnings']))}")
+        if group['endpoints']:
+            print(f"{'':<17} ↳ {', '.join(sorted(group['endpoints']))}")
+
+
+def print_detail(group: Dict):
+    print(f"🔎 {group['digest']} : {group['count']} occurrence(s), {group['total_ms'] / 1000:.2f} s au total, "
+          f"moyenne {group['avg_ms']:.0f} ms, max {group['max_ms']:.0f} ms\n")
+    print(group['sql'])
+    print(f"\nParamètres : {group['params']}")
+    if group['endpoints']:
+        print(f"Endpoints : {', '.join(sorted(group['endpoints']))}")
+    if group['explain']:
+        print("\nEXPLAIN :")
+        for row in group['explain']:
+            print(f"  {row.get('table')}: type={row.get('type')} key={row.get('key')} "
+                  f"rows={row.get('rows')} extra={row.get('Extra') or ''}")
+    else:
+        print("\n(aucun EXPLAIN capturé)")
+
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Requêtes SQL lentes capturées par sql.db_cursor')
+    parser.add_argument('--file', default=SLOW_QUERY_LOG, help='Journal JSONL (CARETTE_SLOW_QUERY_LOG)')
+    parser.add_argument('--hours', type=float, help='Seulement les N dernières heures')
+    sub = parser.add_subparsers(dest='command', required=True)
+    top_parser = sub.add_parser('top', help='Requêtes les plus coûteuses (temps total)')
+    top_parser.add_argument('--limit', type=int, default=20)
+    show_parser = sub.add_parser('show', help="Détail d'une requête")
+    show_parser.add_argument('digest')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.file):
+        print(f"❌ Journal introuvable: {args.file}")
+        sys.exit(1)
+    groups = aggregate(read_log(args.file, args.hours))
+    if args.command == 'top':
+        print_top(groups, args.limit)
+    else:
+        matches = [g for g in groups if g['digest'].startswith(args.digest)]
+        if not matches:
+            print(f"❌ Aucune requête {args.digest}")
+            sys.exit(1)
+        print_detail(matches[0])
@@ -6,6 +6,11 @@ import pymysql
 from contextlib import contextmanager
 import os
 import sys
+import threading
+import time
+
+import metrics
+import slow_queries
 
 # Configuration DB (variables d'environnement - OBLIGATOIRES)
 DB_NAME = os.getenv('CARETTE_DB_NAME', 'carette_db')
@@ -47,16 +52,256 @@ def get_connection(user='app', autocommit=True):
         )
 
 
+# Pool de connexions (utilisateur applicatif uniquement, root reste non poolé)
+DB_POOL_ENABLED = os.getenv('CARETTE_DB_POOL', 'true').lower() == 'true'
+DB_POOL_SIZE = int(os.getenv('CARETTE_DB_POOL_SIZE', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('CARETTE_DB_POOL_TIMEOUT', '10'))
+DB_POOL_RECYCLE = int(os.getenv('CARETTE_DB_POOL_RECYCLE', '3600'))
+DB_POOL_PRE_PING = int(os.getenv('CARETTE_DB_POOL_PRE_PING', '30'))
+
+# Erreurs après lesquelles une connexion n'est pas remise dans le pool
+_BROKEN_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
+
+class PoolTimeout(Exception):
+    """Aucune connexion libérée avant CARETTE_DB_POOL_TIMEOUT secondes"""
+
+
+class ConnectionPool:
+    """
+    Pool de connexions MySQL thread-safe.
+    
+    - max_size : nombre maximum de connexions ouvertes (en usage + au repos)
+    - timeout : attente maximum d'une connexion libre quand le pool est plein
+    - recycle : une connexion plus vieille que recycle secondes est rouverte
+    - pre_ping : une connexion au repos depuis plus de pre_ping secondes est
+      vérifiée (ping) avant d'être prêtée (0 = à chaque emprunt)
+    """
+    
+    def __init__(self, max_size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT,
+                 recycle=DB_POOL_RECYCLE, pre_ping=DB_POOL_PRE_PING):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, created_at, last_used)] - LIFO
+        self._created_at = {}  # id(conn) → timestamp d'ouverture
+        self._open = 0
+        self._in_use = 0
+        self._stats = {
+            'acquired': 0,
+            'created': 0,
+            'reused': 0,
+            'recycled': 0,
+            'ping_failures': 0,
+            'discarded': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'wait_time_total': 0.0,
+        }
+    
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _incr(self, counter):
+        with self._cond:
+            self._stats[counter] += 1
+    
+    def _new_connection(self):
+        conn = get_connection('app', autocommit=True)
+        self._created_at[id(conn)] = time.time()
+        self._incr('created')
+        return conn
+    
+    def _discard(self, conn):
+        """Ferme une connexion et libère sa place (appelé sans le verrou)"""
+        self._created_at.pop(id(conn), None)
+        self._close_quietly(conn)
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+    
+    def acquire(self, autocommit=True):
+        """Emprunte une connexion (bloque au plus timeout secondes si le pool est plein)"""
+        start = time.time()
+        deadline = start + self.timeout
+        waited = False
+        
+        while True:
+            conn, last_used = None, None
+            with self._cond:
+                while not self._idle and self._open >= self.max_size:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeout(f"Pool MySQL saturé ({self.max_size} connexions) après {self.timeout}s")
+                    waited = True
+                    self._cond.wait(remaining)
+                
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    self._open += 1
+                self._in_use += 1
+                self._stats['acquired'] += 1
+                if waited:
+                    self._stats['waits'] += 1
+                    self._stats['wait_time_total'] += time.time() - start
+            
+            try:
+                if conn is None:
+                    conn = self._new_connection()
+                else:
+                    now = time.time()
+                    if self.recycle and now - self._created_at.get(id(conn), now) > self.recycle:
+                        self._incr('recycled')
+                        self._created_at.pop(id(conn), None)
+                        self._close_quietly(conn)
+                        conn = self._new_connection()
+                    elif now - last_used >= self.pre_ping:
+                        try:
+                            conn.ping(reconnect=False)
+                        except Exception:
+                            self._incr('ping_failures')
+                            self._created_at.pop(id(conn), None)
+                            self._close_quietly(conn)
+                            conn = self._new_connection()
+                        else:
+                            self._incr('reused')
+                    else:
+                        self._incr('reused')
+                
+                if conn.get_autocommit() != autocommit:
+                    conn.autocommit(autocommit)
+                return conn
+            except Exception:
+                with self._cond:
+                    self._in_use -= 1
+                    self._open -= 1
+                    self._cond.notify()
+                raise
+    
+    def release(self, conn, broken=False):
+        """Rend une connexion au pool (fermée si cassée)"""
+        if not broken:
+            try:
+                # Annule tout travail non commité (comportement identique à close())
+                if not conn.get_autocommit():
+                    conn.rollback()
+                    conn.autocommit(True)
+            except Exception:
+                broken = True
+        
+        if broken or not conn.open:
+            with self._cond:
+                self._in_use -= 1
+                self._stats['discarded'] += 1
+            self._discard(conn)
+            return
+        
+        with self._cond:
+            self._in_use -= 1
+            self._idle.append((conn, time.time()))
+            self._cond.notify()
+    
+    def close_all(self):
+        """Ferme les connexions au repos (les connexions empruntées seront fermées à leur retour)"""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._created_at.pop(id(conn), None)
+            self._close_quietly(conn)
+    
+    def get_stats(self):
+        """Statistiques du pool (connexions ouvertes, empruntées, attentes...)"""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'max_size': self.max_size,
+                'open': self._open,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+            })
+        stats['wait_time_total'] = round(stats['wait_time_total'], 3)
+        return stats
+
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool du processus courant (recréé après un fork, ex: workers gunicorn)"""
+    global _pool, _pool_pid
+    pid = os.getpid()
+    if _pool is None or _pool_pid != pid:
+        with _pool_lock:
+            if _pool is None or _pool_pid != pid:
+                # Ne pas partager les sockets du processus parent
+                _pool = ConnectionPool()
+                _pool_pid = pid
+    return _pool
+
+
+def get_pool_stats():
+    """Statistiques du pool de connexions (vide si le pool est désactivé)"""
+    if not DB_POOL_ENABLED:
+        return {}
+    return get_pool().get_stats()
+
+
+class TimedDictCursor(pymysql.cursors.DictCursor):
+    """DictCursor dont chaque requête est chronométrée (voir metrics, slow_queries)"""
+    
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            result = super().execute(query, args)
+        except Exception:
+            metrics.record_db(time.perf_counter() - started)
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.record_db(elapsed)
+        if elapsed >= slow_queries.SLOW_QUERY_SECONDS:
+            slow_queries.capture(self, query, args, elapsed)
+        return result
+
+
 @contextmanager
 def db_cursor(root=False, autocommit=True):
     """Context manager pour exécuter des requêtes SQL avec curseur dictionnaire"""
-    conn = get_connection('root' if root else 'app', autocommit=autocommit)
-    cursor = conn.cursor(pymysql.cursors.DictCursor)
+    if root or not DB_POOL_ENABLED:
+        conn = get_connection('root' if root else 'app', autocommit=autocommit)
+        cursor = conn.cursor(TimedDictCursor)
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            conn.close()
+        return
+    
+    pool = get_pool()
+    conn = pool.acquire(autocommit=autocommit)
+    broken = False
+    cursor = conn.cursor(TimedDictCursor)
     try:
         yield cursor
+    except _BROKEN_ERRORS:
+        broken = True
+        raise
     finally:
-        cursor.close()
-        conn.close()
+        try:
+            cursor.close()
+        except Exception:
+            broken = True
+        pool.release(conn, broken=broken)
 
 
 def bootstrap_database():
@@ -9,13 +9,20 @@ Principe :
 - Génère un polygone (convex hull ou alpha shape) de ces points
 """
 
-import requests
 from typing import List, Tuple, Optional, Dict
-import json
 import math
+import os
 from scipy.spatial import ConvexHull
 import numpy as np
 
+import osrm_client
+
+# Le serveur OSRM public limite /table à 100 coordonnées (départ + arrivée + points)
+MAX_TABLE_SAMPLE_POINTS = 80
+# Repli /route : chaque point coûte un appel (~2-3s), on reste sous le timeout
+MAX_ROUTE_SAMPLE_POINTS = 8
+# Vitesse maximale supposée (km/h) pour les bornes inférieures de détour sans OSRM
+DETOUR_MAX_SPEED_KMH = float(os.getenv('CARETTE_DETOUR_MAX_SPEED_KMH', '130'))
 
 def haversine_distance(coord1: Tuple[float, float], coord2: Tuple[float, float]) -> float:
     """
@@ -36,6 +43,30 @@ def haversine_distance(coord1: Tuple[float, float], coord2: Tuple[float, float])
     return R * c
 
 
+def detour_lower_bound(start: Tuple[float, float],
+                       via: Tuple[float, float],
+                       end: Tuple[float, float],
+                       direct_duration_min: Optional[float] = None,
+                       max_speed_kmh: float = DETOUR_MAX_SPEED_KMH) -> float:
+    """
+    Borne inférieure (minutes) du détour start → via → end, sans appel réseau.
+    
+    start → via → end dure au moins sa longueur à vol d'oiseau parcourue à
+    vitesse maximale ; le détour est au moins cette durée moins le trajet
+    direct. La distance du point à l'itinéraire ne donne pas de borne : un
+    point à 4 km du milieu d'un trajet de 20 km ne coûte qu'environ 1,5 km.
+    
+    Returns:
+        Détour minimum en minutes (0 si la durée directe est inconnue)
+    """
+    if direct_duration_min is None:
+        return 0.0
+    
+    meters_per_min = max_speed_kmh * 1000 / 60
+    crow_flies = haversine_distance(start, via) + haversine_distance(via, end)
+    return max(0.0, crow_flies / meters_per_min - direct_duration_min)
+
+
 def sample_points_around_route(route_coords: List[List[float]], 
                                  sample_distance_km: float = 2.0,
                                  lateral_distance_km: float = 10.0,
@@ -95,34 +126,20 @@ def calculate_detour_time_osrm(start: Tuple[float, float],
     """
     try:
         # Route avec détour : A → via → B
-        detour_url = f"https://router.project-osrm.org/route/v1/driving/{start[0]},{start[1]};{via[0]},{via[1]};{end[0]},{end[1]}?overview=false"
-        detour_resp = requests.get(detour_url, timeout=5)
-        
-        if not detour_resp.ok:
-            return None
-        
-        detour_data = detour_resp.json()
-        if detour_data.get('code') != 'Ok' or not detour_data.get('routes'):
+        detour_duration = osrm_client.route_duration([start, via, end])
+        if detour_duration is None:
             return None
         
-        detour_duration = detour_data['routes'][0]['duration'] / 60  # en minutes
-        
         # Route directe : A → B
-        direct_url = f"https://router.project-osrm.org/route/v1/driving/{start[0]},{start[1]};{end[0]},{end[1]}?overview=false"
-        direct_resp = requests.get(direct_url, timeout=5)
-        
-        if not direct_resp.ok:
+        direct_duration = osrm_client.route_duration([start, end])
+        if direct_duration is None:
             return None
         
-        direct_data = direct_resp.json()
-        if direct_data.get('code') != 'Ok' or not direct_data.get('routes'):
-            return None
-        
-        direct_duration = direct_data['routes'][0]['duration'] / 60  # en minutes
-        
-        # Temps de détour = différence
-        return detour_duration - direct_duration
+        # Temps de détour = différence (en minutes)
+        return (detour_duration - direct_duration) / 60
         
+    except osrm_client.RateLimited:
+        raise
     except Exception as e:
         print(f"Error calculating detour time: {e}")
         return None
@@ -137,100 +154,131 @@ def calculate_detour_time_osrm_fast(start: Tuple[float, float],
     Version optimisée : direct_duration déjà calculé, on ne calcule que le détour.
     Économise 1 appel OSRM par point (15 appels pour route directe → 1 seul appel).
     """
-    try:
-        detour_url = f"https://router.project-osrm.org/route/v1/driving/{start[0]},{start[1]};{via[0]},{via[1]};{end[0]},{end[1]}?overview=false"
-        detour_resp = requests.get(detour_url, timeout=5)
-        
-        if not detour_resp.ok:
-            return None
-        
-        detour_data = detour_resp.json()
-        if detour_data.get('code') != 'Ok' or not detour_data.get('routes'):
-            return None
-        
-        detour_duration = detour_data['routes'][0]['duration'] / 60
-        return detour_duration - direct_duration_min
-        
-    except Exception as e:
+    detour_duration = osrm_client.route_duration([start, via, end])
+    if detour_duration is None:
         return None
+    return detour_duration / 60 - direct_duration_min
 
-def create_temporal_buffer(route_coords: List[List[float]], 
-                             max_detour_time_minutes: int = 60,
-                             sample_distance_km: float = 5.0,
-                             lateral_distance_km: float = 15.0) -> Optional[Dict]:
+def calculate_detour_times_batch(start: Tuple[float, float],
+                                 points: List[Tuple[float, float]],
+                                 end: Tuple[float, float]) -> Optional[List[Optional[float]]]:
     """
-    Crée une zone de détour basée sur le temps.
+    Calcule le temps de détour (A → point → B) - (A → B) pour tous les points
+    avec UNE seule requête OSRM /table.
     
-    Args:
-        route_coords: Coordonnées de la route [[lon, lat], ...]
-        max_detour_time_minutes: Budget temps maximum en minutes
-        sample_distance_km: Distance d'échantillonnage le long de la route
-        lateral_distance_km: Distance d'échantillonnage latérale
+    Sources = [A, points...], destinations = [B, points...] :
+    - ligne 0 : A → B puis A → point_i
+    - ligne i : point_i → B
     
     Returns:
-        GeoJSON Polygon de la zone temporelle, ou None si erreur
+        Liste des détours en minutes (None pour un point non routable),
+        ou None si la requête /table échoue
     """
-    if not route_coords or len(route_coords) < 2:
+    if not points:
+        return []
+    
+    n = len(points)
+    coords = [start, end] + list(points)
+    point_indices = list(range(2, n + 2))
+    
+    data = osrm_client.table(
+        coords,
+        sources=[0] + point_indices,
+        destinations=[1] + point_indices
+    )
+    if not data or not data.get('durations'):
         return None
     
-    start = tuple(route_coords[0])
-    end = tuple(route_coords[-1])
+    durations = data['durations']
+    direct = durations[0][0]
+    if direct is None:
+        return None
     
-    print(f"🕐 Calculating temporal buffer: {max_detour_time_minutes} min budget")
+    detour_times = []
+    for i in range(n):
+        to_point = durations[0][i + 1]
+        from_point = durations[i + 1][0]
+        if to_point is None or from_point is None:
+            detour_times.append(None)
+        else:
+            detour_times.append((to_point + from_point - direct) / 60)
     
-    # Pour les longues routes, sous-échantillonner d'abord
+    return detour_times
+
+
+def reduce_route_coords(route_coords: List[List[float]]) -> List[List[float]]:
+    """
+    Sous-échantillonne les longues routes avant de générer les points autour.
+    """
     total_route_points = len(route_coords)
     if total_route_points > 100:
-        # Route très longue : prendre 1 point sur 10
+        # Route très longue : garder ~20 points
         step = total_route_points // 20
         route_coords = route_coords[::step]
         print(f"📏 Long route detected ({total_route_points} points), reduced to {len(route_coords)} points")
     elif total_route_points > 50:
-        # Route longue : prendre 1 point sur 5
+        # Route longue : garder ~30 points
         step = total_route_points // 30
         route_coords = route_coords[::step]
         print(f"📏 Long route detected ({total_route_points} points), reduced to {len(route_coords)} points")
+    return route_coords
+
+
+def limit_sample_points(points: List[Tuple[float, float]], max_points: int) -> List[Tuple[float, float]]:
+    """
+    Réduit la liste à max_points en prenant des points régulièrement espacés,
+    pour couvrir toute la longueur de la route (contrairement à un tirage aléatoire).
+    """
+    if len(points) <= max_points:
+        return points
+    step = len(points) / max_points
+    return [points[int(i * step)] for i in range(max_points)]
+
+
+def filter_points_batch(start: Tuple[float, float],
+                        points: List[Tuple[float, float]],
+                        end: Tuple[float, float],
+                        max_detour_time_minutes: float) -> Optional[List[Tuple[float, float]]]:
+    """
+    Garde les points dont le détour tient dans le budget (1 requête /table).
     
-    # Échantillonner des points autour de la route
-    sample_points = sample_points_around_route(
-        route_coords, 
-        sample_distance_km=sample_distance_km,
-        lateral_distance_km=lateral_distance_km,
-        points_per_segment=3  # 3 points de chaque côté = 6 points par segment
-    )
-    
-    # Limiter à 15 points maximum pour rester dans le timeout (chaque appel OSRM ~2-3s)
-    if len(sample_points) > 8:
-        import random
-        sample_points = random.sample(sample_points, 8)
-        print(f"⚠️ Too many sample points, reduced to 15 for performance")
-    
-    print(f"📍 Sampled {len(sample_points)} points around route")
+    Returns:
+        Points valides, ou None si la requête /table échoue
+    """
+    detour_times = calculate_detour_times_batch(start, points, end)
+    if detour_times is None:
+        return None
     
+    valid_points = [
+        point for point, detour_time in zip(points, detour_times)
+        if detour_time is not None and detour_time <= max_detour_time_minutes
+    ]
+    print(f"✅ Table: {len(valid_points)}/{len(points)} points within {max_detour_time_minutes} min")
+    return valid_points
+
+
+def filter_points_per_route(start: Tuple[float, float],
+                            points: List[Tuple[float, float]],
+                            end: Tuple[float, float],
+                            max_detour_time_minutes: float) -> List[Tuple[float, float]]:
+    """
+    Repli point par point via /route (1 appel par point + 1 pour la route directe).
+    """
     # 🚀 OPTIMISATION : Calculer route directe UNE SEULE FOIS
-    print(f"🔍 Calculating direct route once...")
-    direct_url = f"https://router.project-osrm.org/route/v1/driving/{start[0]},{start[1]};{end[0]},{end[1]}?overview=false"
-    try:
-        direct_resp = requests.get(direct_url, timeout=5)
-        if direct_resp.ok:
-            direct_data = direct_resp.json()
-            if direct_data.get('code') == 'Ok' and direct_data.get('routes'):
-                direct_duration_min = direct_data['routes'][0]['duration'] / 60
-                print(f"✅ Direct route: {direct_duration_min:.1f} min")
-            else:
-                direct_duration_min = None
-        else:
-            direct_duration_min = None
-    except Exception as e:
-        print(f"❌ Direct route error: {e}")
+    print("🔍 Calculating direct route once...")
+    direct_duration_s = osrm_client.route_duration([start, end])
+    if direct_duration_s is not None:
+        direct_duration_min = direct_duration_s / 60
+        print(f"✅ Direct route: {direct_duration_min:.1f} min")
+    else:
+        print("❌ Direct route error")
         direct_duration_min = None
     
-    # Filtrer les points selon le temps de détour
     valid_points = []
     
-    for i, point in enumerate(sample_points):
+    for i, point in enumerate(points):
         if i % 5 == 0:  # Log tous les 5 points
-            print(f"⏱ Processing point {i+1}/{len(sample_points)}...")
+            print(f"⏱ Processing point {i+1}/{len(points)}...")
         
         # Utiliser fonction optimisée si possible
         if direct_duration_min is not None:
@@ -238,15 +286,19 @@ def create_temporal_buffer(route_coords: List[List[float]],
         else:
             detour_time = calculate_detour_time_osrm(start, point, end)
         
-        
-        detour_time = calculate_detour_time_osrm(start, point, end)
-        
         if detour_time is not None and detour_time <= max_detour_time_minutes:
             valid_points.append(point)
             print(f"  ✅ Point valid: +{detour_time:.1f} min")
         elif detour_time is not None:
             print(f"  ❌ Point rejected: +{detour_time:.1f} min > {max_detour_time_minutes} min")
     
+    return valid_points
+
+
+def build_buffer_polygon(valid_points: List[Tuple[float, float]]) -> Optional[Dict]:
+    """
+    Construit le polygone GeoJSON (convex hull) englobant les points valides.
+    """
     print(f"✅ Found {len(valid_points)} valid points within time budget")
     
     if len(valid_points) < 3:
@@ -272,39 +324,110 @@ def create_temporal_buffer(route_coords: List[List[float]],
         
     except Exception as e:
         print(f"❌ Error creating polygon: {e}")
-        # Si trop peu de points ou points coplanaires, créer un buffer simple
-        if len(valid_points) >= 3:
-            # Créer un polygone simple sans ConvexHull
-            # Trier les points par angle depuis le centre
-            center_lon = sum(p[0] for p in valid_points) / len(valid_points)
-            center_lat = sum(p[1] for p in valid_points) / len(valid_points)
-            
-            import math
-            def angle_from_center(point):
-                return math.atan2(point[1] - center_lat, point[0] - center_lon)
-            
-            sorted_points = sorted(valid_points, key=angle_from_center)
-            sorted_points.append(sorted_points[0])  # Fermer le polygone
-            
-            polygon = {
-                "type": "Polygon",
-                "coordinates": [sorted_points]
-            }
-            print(f"🎯 Temporal buffer created (simple polygon) with {len(sorted_points)} vertices")
-            return polygon
+        # Si points coplanaires, créer un polygone simple sans ConvexHull
+        # Trier les points par angle depuis le centre
+        center_lon = sum(p[0] for p in valid_points) / len(valid_points)
+        center_lat = sum(p[1] for p in valid_points) / len(valid_points)
+        
+        def angle_from_center(point):
+            return math.atan2(point[1] - center_lat, point[0] - center_lon)
         
+        sorted_points = sorted(valid_points, key=angle_from_center)
+        sorted_points.append(sorted_points[0])  # Fermer le polygone
+        
+        polygon = {
+            "type": "Polygon",
+            "coordinates": [sorted_points]
+        }
+        print(f"🎯 Temporal buffer created (simple polygon) with {len(sorted_points)} vertices")
+        return polygon
+
+
+def create_temporal_buffer(route_coords: List[List[float]], 
+                             max_detour_time_minutes: int = 60,
+                             sample_distance_km: float = 5.0,
+                             lateral_distance_km: float = 15.0,
+                             max_points: int = MAX_TABLE_SAMPLE_POINTS) -> Optional[Dict]:
+    """
+    Crée une zone de détour basée sur le temps.
+    
+    Utilise d'abord le moteur batch (1 requête /table), et ne repasse sur des
+    appels /route point par point que si /table est indisponible.
+    
+    Args:
+        route_coords: Coordonnées de la route [[lon, lat], ...]
+        max_detour_time_minutes: Budget temps maximum en minutes
+        sample_distance_km: Distance d'échantillonnage le long de la route
+        lateral_distance_km: Distance d'échantillonnage latérale
+        max_points: Nombre maximum de points évalués via /table
+    
+    Returns:
+        GeoJSON Polygon de la zone temporelle, ou None si erreur
+    """
+    if not route_coords or len(route_coords) < 2:
         return None
+    
+    start = tuple(route_coords[0])
+    end = tuple(route_coords[-1])
+    
+    print(f"🕐 Calculating temporal buffer: {max_detour_time_minutes} min budget")
+    
+    # Échantillonner des points autour de la route
+    sample_points = sample_points_around_route(
+        reduce_route_coords(route_coords), 
+        sample_distance_km=sample_distance_km,
+        lateral_distance_km=lateral_distance_km,
+        points_per_segment=3  # 3 points de chaque côté = 6 points par segment
+    )
+    print(f"📍 Sampled {len(sample_points)} points around route")
+    
+    valid_points = filter_points_batch(
+        start, limit_sample_points(sample_points, max_points), end, max_detour_time_minutes
+    )
+    
+    if valid_points is None:
+        # /table indisponible : limiter le nombre d'appels /route pour rester dans le timeout
+        print("⚠️ OSRM table failed, falling back to per-point /route")
+        valid_points = filter_points_per_route(
+            start, limit_sample_points(sample_points, MAX_ROUTE_SAMPLE_POINTS), end, max_detour_time_minutes
+        )
+    
+    return build_buffer_polygon(valid_points)
 
 
 def calculate_temporal_buffer_batch(route_coords: List[List[float]], 
-                                      max_detour_time_minutes: int = 60) -> Optional[Dict]:
+                                      max_detour_time_minutes: int = 60,
+                                      sample_distance_km: float = 5.0,
+                                      lateral_distance_km: float = 15.0,
+                                      max_points: int = MAX_TABLE_SAMPLE_POINTS) -> Optional[Dict]:
     """
-    Version optimisée utilisant l'API OSRM table pour des calculs par batch.
-    Plus rapide mais nécessite plus de mémoire.
+    Version batch utilisant l'API OSRM table : un seul aller-retour HTTP
+    pour tous les points échantillonnés (au lieu de 1 à 2 appels /route par point).
+    http://project-osrm.org/docs/v5.24.0/api/#table-service
+    
+    Returns:
+        GeoJSON Polygon de la zone temporelle, ou None si erreur (pas de repli /route)
     """
-    # TODO: Implémenter avec OSRM Table API pour améliorer les performances
-    # http://project-osrm.org/docs/v5.24.0/api/#table-service
-    pass
+    if not route_coords or len(route_coords) < 2:
+        return None
+    
+    start = tuple(route_coords[0])
+    end = tuple(route_coords[-1])
+    
+    sample_points = sample_points_around_route(
+        reduce_route_coords(route_coords),
+        sample_distance_km=sample_distance_km,
+        lateral_distance_km=lateral_distance_km,
+        points_per_segment=3
+    )
+    
+    valid_points = filter_points_batch(
+        start, limit_sample_points(sample_points, max_points), end, max_detour_time_minutes
+    )
+    if valid_points is None:
+        return None
+    
+    return build_buffer_polygon(valid_points)
 
 
 def create_buffer_simple(route_coords: List[List[float]], buffer_km: float) -> Optional[Dict]:
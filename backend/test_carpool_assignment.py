@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test de l'affectation conducteurs/passagers (suggestions RSE)
+Places et budget respectés, un passager par conducteur au plus, plan optimal
+meilleur que le glouton, et repli glouton quand l'affectation optimale échoue
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import carpool_assignment
+from carpool_assignment import assign_carpools, greedy_assign, pair_gain
+
+
+def match(driver_id, passenger_id, co2_saved_week, detour_minutes=0):
+    """Paire au format find_carpool_matches_for_company (champs utiles ici)"""
+    return {
+        'driver_id': driver_id,
+        'passenger_id': passenger_id,
+        'detour_minutes': detour_minutes,
+        'co2_saved_week': co2_saved_week,
+    }
+
+
+def pairs(plan):
+    return sorted((m['driver_id'], m['passenger_id']) for m in plan)
+
+
+def total_gain(plan):
+    return sum(map(pair_gain, plan))
+
+
+def test_seats_and_detour_budget_respected():
+    """3 passagers pour 2 places, budget 10 min : seules les paires tenant dans le budget"""
+    matches = [match(1, 3, 10, 4), match(1, 4, 9, 7), match(1, 5, 8, 3)]
+
+    plan = assign_carpools(matches, {1: {'seats': 2, 'detour_budget': 10}})
+    assert len(plan) == 2
+    assert sum(m['detour_minutes'] for m in plan) <= 10
+    assert pairs(plan) == [(1, 3), (1, 5)]
+
+    plan = assign_carpools(matches, {1: {'seats': 2, 'detour_budget': 30}})
+    assert pairs(plan) == [(1, 3), (1, 4)]
+
+
+def test_passenger_assigned_once():
+    """Passagers faisables avec plusieurs conducteurs : chacun placé une seule fois"""
+    matches = [match(d, p, 5 + d + p) for d in (1, 2, 3) for p in (4, 5, 6, 7)]
+
+    plan = assign_carpools(matches, {d: {'seats': 2} for d in (1, 2, 3)})
+    passengers = [m['passenger_id'] for m in plan]
+    assert len(passengers) == len(set(passengers)) == 4
+    assert not {m['driver_id'] for m in plan} & set(passengers)
+
+
+def test_optimal_beats_greedy():
+    """Une place par conducteur : le glouton prend la meilleure paire (10), l'optimum 9 + 8"""
+    matches = [match(1, 3, 10), match(1, 4, 9), match(2, 3, 8)]
+    constraints = {1: {'seats': 1}, 2: {'seats': 1}}
+
+    greedy = greedy_assign(sorted(matches, key=pair_gain, reverse=True), constraints)
+    assert pairs(greedy) == [(1, 3)]
+
+    plan = assign_carpools(matches, constraints)
+    print(f"   gain glouton {total_gain(greedy):.1f}, plan {total_gain(plan):.1f}")
+    assert pairs(plan) == [(1, 4), (2, 3)]
+    assert total_gain(plan) >= total_gain(greedy)
+
+
+def test_no_feasible_pair():
+    """Aucune paire faisable (auto-paire, détour hors budget) : plan vide"""
+    matches = [match(1, 1, 10), match(1, 2, 10, 40)]
+    assert assign_carpools(matches, {1: {'detour_budget': 25}}) == []
+    assert assign_carpools([], {}) == []
+
+
+def test_greedy_fallback_when_optimal_fails():
+    """Affectation optimale en erreur ou trop d'utilisateurs : plan glouton"""
+    matches = [match(1, 3, 10), match(1, 4, 9), match(2, 3, 8)]
+    constraints = {1: {'seats': 1}, 2: {'seats': 1}}
+
+    def broken(edges, constraints):
+        raise ValueError("cost matrix is infeasible")
+
+    original = carpool_assignment.optimal_pairs
+    carpool_assignment.optimal_pairs = broken
+    try:
+        assert pairs(assign_carpools(matches, constraints)) == [(1, 3)]
+    finally:
+        carpool_assignment.optimal_pairs = original
+
+    original = carpool_assignment.ASSIGNMENT_MAX_USERS
+    carpool_assignment.ASSIGNMENT_MAX_USERS = 2
+    try:
+        assert pairs(assign_carpools(matches, constraints)) == [(1, 3)]
+    finally:
+        carpool_assignment.ASSIGNMENT_MAX_USERS = original
+
+
+if __name__ == '__main__':
+    print("\n🧪 Test de l'affectation conducteurs/passagers")
+    print("=" * 60)
+    for test in (test_seats_and_detour_budget_respected, test_passenger_assigned_once,
+                 test_optimal_beats_greedy, test_no_feasible_pair,
+                 test_greedy_fallback_when_optimal_fails):
+        print(f"\n▶️  {test.__doc__}")
+        test()
+        print("   ✅ OK")
+    print("")
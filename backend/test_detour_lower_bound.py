@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Test de la borne inférieure de détour (recherche récurrente)
+Vérifie qu'aucune offre acceptée par le calcul OSRM n'est écartée par la borne
+"""
+import sys
+import os
+import math
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from routing_backends import EstimateBackend
+from temporal_buffer import detour_lower_bound, haversine_distance
+
+METERS_PER_DEG_LAT = 111320.0
+
+
+def offset(point, east_m, north_m):
+    """Point (lon, lat) décalé de quelques mètres vers l'est et le nord"""
+    lon, lat = point
+    meters_per_deg_lon = METERS_PER_DEG_LAT * math.cos(math.radians(lat))
+    return (lon + east_m / meters_per_deg_lon, lat + north_m / METERS_PER_DEG_LAT)
+
+
+def osrm_detour(backend, start, via, end):
+    """(détour, durée directe) en minutes, comme calculate_detour_time_osrm_fast"""
+    direct = backend.route([start, end])['routes'][0]['duration'] / 60
+    with_via = backend.route([start, via, end])['routes'][0]['duration'] / 60
+    return with_via - direct, direct
+
+
+def test_point_beside_route_midpoint():
+    """Trajet droit de 20 km, passager à 4 km du milieu : ~1,5 km de plus, pas écarté"""
+    start = (4.85, 45.75)
+    end = offset(start, 20000, 0)
+    via = offset(start, 10000, 4000)
+    budget = 3.0
+
+    extra_m = haversine_distance(start, via) + haversine_distance(via, end) - haversine_distance(start, end)
+    assert 1400 < extra_m < 1700
+
+    backend = EstimateBackend(circuity=1.0, speed_kmh=130, overhead_s=0)
+    detour, direct = osrm_detour(backend, start, via, end)
+    assert detour <= budget
+
+    bound = detour_lower_bound(start, via, end, direct)
+    print(f"   détour {detour:.2f} min, borne {bound:.2f} min")
+    assert bound <= detour
+    assert not bound > budget
+
+
+def test_accepted_candidates_never_pruned():
+    """Trajets aléatoires : la borne ne dépasse jamais le détour routé"""
+    rng = random.Random(42)
+    backends = [
+        EstimateBackend(circuity=1.0, speed_kmh=130, overhead_s=0),
+        EstimateBackend(),
+    ]
+    checked = accepted = 0
+    for backend in backends:
+        for _ in range(2000):
+            start = (rng.uniform(4.6, 5.1), rng.uniform(45.5, 46.0))
+            end = offset(start, rng.uniform(-40000, 40000), rng.uniform(-40000, 40000))
+            via = offset(start, rng.uniform(-50000, 50000), rng.uniform(-50000, 50000))
+            budget = rng.uniform(0, 30)
+
+            detour, direct = osrm_detour(backend, start, via, end)
+            bound = detour_lower_bound(start, via, end, direct)
+            assert bound <= detour + 1e-9, (start, via, end, bound, detour)
+            checked += 1
+            if detour <= budget:
+                accepted += 1
+                assert not bound > budget, (start, via, end, bound, detour, budget)
+    print(f"   {checked} trajets vérifiés, {accepted} acceptés, aucun écarté à tort")
+    assert accepted > 0
+
+
+def test_unknown_direct_duration():
+    """Sans durée directe, aucune offre n'est écartée"""
+    start = (4.85, 45.75)
+    assert detour_lower_bound(start, offset(start, 0, 80000), offset(start, 1000, 0)) == 0.0
+
+
+if __name__ == '__main__':
+    print("\n🧪 Test de la borne inférieure de détour")
+    print("=" * 60)
+    for test in (test_point_beside_route_midpoint, test_accepted_candidates_never_pruned,
+                 test_unknown_direct_duration):
+        print(f"\n▶️  {test.__doc__}")
+        test()
+        print("   ✅ OK")
+    print("")
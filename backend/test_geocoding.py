@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Test du service de géocodage
+Normalisation des adresses (clés de cache) et cache négatif (retry_after)
+"""
+import sys
+import os
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+import geocoding
+from geocoding import normalize_address
+from standin_db import StandinDB
+
+
+# ============================================================================
+# Normalisation
+# ============================================================================
+
+def test_saint_is_not_a_street_type():
+    """"12 st jean" et "12 r st jean" sont deux adresses différentes"""
+    assert normalize_address('12 st jean') == '12 saint jean'
+    assert normalize_address('12 r st jean') == '12 rue saint jean'
+    assert normalize_address('12 st jean') != normalize_address('12 r st jean')
+
+
+def test_street_type_expanded_after_house_number():
+    """Type de voie développé juste après le numéro (ou son indice bis/ter)"""
+    assert normalize_address('12 bd des Belges') == '12 boulevard des belges'
+    assert normalize_address('3 av. Jean Jaurès') == '3 avenue jean jaures'
+    assert normalize_address('12 bis av Foch') == '12 bis avenue foch'
+    assert normalize_address('12b r de la Paix') == '12b rue de la paix'
+    assert normalize_address('Bd des Belges') == 'boulevard des belges'
+
+
+def test_street_type_words_kept_elsewhere():
+    """Ailleurs qu'à la place du type de voie, "lot", "ch", "all"... restent des mots"""
+    assert normalize_address('Route du Lot 46000 Cahors') == 'route du lot 46000 cahors'
+    assert normalize_address('Route du Lot') != normalize_address('Route du Lotissement')
+    assert normalize_address('5 chemin de ch') == '5 chemin de ch'
+    assert normalize_address('10 rue du bd') == '10 rue du bd'
+
+
+def test_accents_case_and_punctuation():
+    """Accents, casse, ponctuation et code postal découpé donnent la même clé"""
+    key = normalize_address('12, Rue de l\'Église  69 000 LYON')
+    assert key == '12 rue de l eglise 69000 lyon'
+    assert normalize_address('12 RUE DE L EGLISE 69000 Lyon') == key
+    assert normalize_address('12 r. de l’église, 69000 lyon') == key
+
+
+def test_partial_last_word():
+    """Autocomplétion : le dernier mot, en cours de frappe, n'est pas développé"""
+    assert normalize_address('12 r', partial=True) == '12 r'
+    assert normalize_address('12 r', partial=False) == '12 rue'
+
+
+# ============================================================================
+# Cache négatif
+# ============================================================================
+
+class FakeUpstream:
+    """Remplace geocoding.geocode_upstream et compte les appels"""
+
+    def __init__(self, result):
+        self.result = result
+        self.calls = []
+
+    def __call__(self, address, providers=None):
+        self.calls.append(address)
+        return self.result
+
+
+def _lookup(db, address, upstream):
+    geocoding.clear_memory()
+    original = geocoding.geocode_upstream
+    geocoding.geocode_upstream = upstream
+    try:
+        with db.db_cursor() as cur:
+            return geocoding._lookup(address, normalize_address(address), cur)
+    finally:
+        geocoding.geocode_upstream = original
+
+
+def test_negative_cache_skips_upstream_until_retry_after():
+    """Adresse introuvable en base avec retry_after futur : pas d'appel aux fournisseurs"""
+    db = StandinDB()
+    db.conn.execute("""
+        INSERT INTO geocoding_cache (address, address_key, retry_after)
+        VALUES ('1 impasse inconnue 99999', '1 impasse inconnue 99999', datetime('now', '+3600 seconds'))
+    """)
+    upstream = FakeUpstream(((2.35, 48.85), 'ban', True))
+    before = geocoding.get_stats()['negative_hits']
+
+    assert _lookup(db, '1 Imp. Inconnue 99999', upstream) is None
+    assert upstream.calls == []
+    assert geocoding.get_stats()['negative_hits'] == before + 1
+
+
+def test_expired_negative_cache_asks_upstream_again():
+    """retry_after dépassé : l'adresse est redemandée et les coordonnées enregistrées"""
+    db = StandinDB()
+    db.conn.execute("""
+        INSERT INTO geocoding_cache (address, address_key, retry_after)
+        VALUES ('2 impasse inconnue 99999', '2 impasse inconnue 99999', datetime('now', '-60 seconds'))
+    """)
+    upstream = FakeUpstream(((2.35, 48.85), 'ban', True))
+
+    assert _lookup(db, '2 impasse inconnue 99999', upstream) == (2.35, 48.85)
+    assert upstream.calls == ['2 impasse inconnue 99999']
+    row = db.conn.execute("SELECT latitude, longitude, retry_after FROM geocoding_cache "
+                          "WHERE address = '2 impasse inconnue 99999'").fetchone()
+    assert row == (48.85, 2.35, None)
+
+
+def test_not_found_sets_retry_after():
+    """Introuvable (réponse définitive) : ligne avec retry_after, pas de nouvel appel ensuite"""
+    db = StandinDB()
+    upstream = FakeUpstream((None, None, True))
+
+    assert _lookup(db, '3 impasse inconnue 99999', upstream) is None
+    row = db.conn.execute("SELECT latitude, retry_after FROM geocoding_cache "
+                          "WHERE address = '3 impasse inconnue 99999'").fetchone()
+    assert row[0] is None and row[1] is not None
+
+    assert _lookup(db, '3 impasse inconnue 99999', upstream) is None
+    assert len(upstream.calls) == 1
+
+
+def test_provider_error_is_not_cached():
+    """Fournisseur injoignable : aucun cache négatif, l'adresse est redemandée"""
+    db = StandinDB()
+    upstream = FakeUpstream((None, None, False))
+
+    assert _lookup(db, '4 impasse inconnue 99999', upstream) is None
+    assert db.conn.execute("SELECT COUNT(*) FROM geocoding_cache").fetchone()[0] == 0
+    assert _lookup(db, '4 impasse inconnue 99999', upstream) is None
+    assert len(upstream.calls) == 2
+
+
+if __name__ == '__main__':
+    print("\n🧪 Test du service de géocodage")
+    print("=" * 60)
+    for test in (test_saint_is_not_a_street_type, test_street_type_expanded_after_house_number,
+                 test_street_type_words_kept_elsewhere, test_accents_case_and_punctuation,
+                 test_partial_last_word, test_negative_cache_skips_upstream_until_retry_after,
+                 test_expired_negative_cache_asks_upstream_again, test_not_found_sets_retry_after,
+                 test_provider_error_is_not_cached):
+        print(f"\n▶️  {test.__doc__}")
+        test()
+        print("   ✅ OK")
+    print("")
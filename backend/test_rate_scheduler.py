@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Test de l'ordonnanceur de débit (services publics)
+Priorité INTERACTIVE avant BATCH, réessai des 429 en BATCH et RateLimited
+quand une requête interactive n'obtient pas de jeton à temps
+"""
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rate_scheduler
+from rate_scheduler import BATCH, INTERACTIVE, RateLimited, TokenBucket
+
+HOST = 'api.test'
+URL = f"https://{HOST}/search?q=lyon"
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+
+
+class FakeSession:
+    """Renvoie les codes HTTP donnés dans l'ordre et compte les appels"""
+
+    def __init__(self, *status_codes):
+        self.status_codes = list(status_codes)
+        self.calls = 0
+
+    def request(self, method, url, **kwargs):
+        self.calls += 1
+        return FakeResponse(self.status_codes.pop(0), {'Retry-After': '0'})
+
+
+def with_bucket(bucket, test):
+    """Exécute test() avec un seau déclaré pour HOST"""
+    rate_scheduler._buckets[HOST] = bucket
+    try:
+        return test()
+    finally:
+        del rate_scheduler._buckets[HOST]
+
+
+def wait_queued(bucket, count):
+    deadline = time.monotonic() + 2
+    while time.monotonic() < deadline:
+        with bucket._cond:
+            if len(bucket._waiting) >= count:
+                return
+        time.sleep(0.005)
+    raise AssertionError(f"{count} demandes attendues en file")
+
+
+def test_interactive_served_before_batch():
+    """Hôte en pause : la demande INTERACTIVE arrivée après la BATCH passe devant"""
+    bucket = TokenBucket(HOST, 1000)
+    bucket.pause(0.2)
+    served = []
+
+    def take(priority):
+        assert bucket.acquire(priority, None)
+        served.append(priority)
+
+    batch_thread = threading.Thread(target=take, args=(BATCH,))
+    batch_thread.start()
+    wait_queued(bucket, 1)
+    interactive_thread = threading.Thread(target=take, args=(INTERACTIVE,))
+    interactive_thread.start()
+    wait_queued(bucket, 2)
+
+    batch_thread.join(2)
+    interactive_thread.join(2)
+    assert served == [INTERACTIVE, BATCH]
+    assert bucket.stats['granted_interactive'] == bucket.stats['granted_batch'] == 1
+
+
+def test_interactive_timeout():
+    """Plus de jeton : l'attente interactive est bornée par son timeout"""
+    bucket = TokenBucket(HOST, 1)
+    assert bucket.acquire(INTERACTIVE, 0.05)
+
+    started = time.monotonic()
+    assert not bucket.acquire(INTERACTIVE, 0.05)
+    assert time.monotonic() - started < 0.5
+    assert bucket.stats['timeouts'] == 1
+    assert bucket._waiting == []
+
+
+def test_batch_retries_429():
+    """BATCH : deux 429 puis 200, l'hôte est mis en pause à chaque 429"""
+    bucket = TokenBucket(HOST, 1000)
+    session = FakeSession(429, 429, 200)
+
+    def run():
+        with rate_scheduler.batch():
+            return rate_scheduler.request(URL, session=session)
+
+    resp = with_bucket(bucket, run)
+    assert resp.status_code == 200
+    assert session.calls == 3
+    assert bucket.stats['throttled'] == 2
+
+
+def test_batch_gives_up_after_retries():
+    """BATCH : toujours 429, la dernière réponse est rendue après les réessais"""
+    bucket = TokenBucket(HOST, 1000)
+    session = FakeSession(*[429] * (1 + rate_scheduler.RATE_BATCH_RETRIES))
+
+    def run():
+        with rate_scheduler.batch():
+            return rate_scheduler.request(URL, session=session)
+
+    assert with_bucket(bucket, run).status_code == 429
+    assert session.calls == 1 + rate_scheduler.RATE_BATCH_RETRIES
+
+
+def test_interactive_429_not_retried():
+    """INTERACTIVE : un 429 est rendu tel quel, sans réessai"""
+    bucket = TokenBucket(HOST, 1000)
+    session = FakeSession(429, 200)
+
+    resp = with_bucket(bucket, lambda: rate_scheduler.request(URL, session=session))
+    assert resp.status_code == 429
+    assert session.calls == 1
+
+
+def test_rate_limited_after_wait_budget():
+    """INTERACTIVE : hôte en pause au-delà de CARETTE_RATE_INTERACTIVE_WAIT → RateLimited"""
+    bucket = TokenBucket(HOST, 1000)
+    bucket.pause(10)
+    session = FakeSession(200)
+
+    original = rate_scheduler.RATE_INTERACTIVE_WAIT
+    rate_scheduler.RATE_INTERACTIVE_WAIT = 0.05
+    try:
+        with_bucket(bucket, lambda: rate_scheduler.request(URL, session=session))
+    except RateLimited:
+        pass
+    else:
+        raise AssertionError("RateLimited attendu")
+    finally:
+        rate_scheduler.RATE_INTERACTIVE_WAIT = original
+    assert session.calls == 0
+    assert bucket.stats['timeouts'] == 1
+
+
+if __name__ == '__main__':
+    print("\n🧪 Test de l'ordonnanceur de débit")
+    print("=" * 60)
+    for test in (test_interactive_served_before_batch, test_interactive_timeout,
+                 test_batch_retries_429, test_batch_gives_up_after_retries,
+                 test_interactive_429_not_retried, test_rate_limited_after_wait_budget):
+        print(f"\n▶️  {test.__doc__}")
+        test()
+        print("   ✅ OK")
+    print("")
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Test du recalcul d'itinéraire des offres récurrentes quand OSRM est indisponible
+(acceptation d'une demande, retrait d'un passager) : le détour total enregistré
+est la somme des détours individuels des passagers confirmés
+"""
+import sys
+import os
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks'))
+
+# Configuration minimale pour importer l'API sans MySQL
+os.environ.setdefault('CARETTE_DEBUG', 'true')
+os.environ.setdefault('CARETTE_SECRET_KEY', 'test-secret')
+os.environ.setdefault('CARETTE_DB_PASSWORD', 'test')
+os.environ.setdefault('CARETTE_DB_ROOT_PASSWORD', 'test')
+
+from standin_db import StandinDB
+
+DB = StandinDB()
+DB.install()
+
+# Colonnes lues par les deux endpoints, absentes du schéma des benchmarks
+for table, columns in {
+    'carpool_offers_recurrent': ['color_outbound TEXT', 'color_return TEXT'],
+    'carpool_reservations_recurrent': [
+        'passenger_phone TEXT', 'confirmation_token TEXT', 'confirmed_at TIMESTAMP',
+        'pickup_order INTEGER DEFAULT 0', 'pickup_time_outbound TIME', 'dropoff_time_return TIME',
+        'computed_departure_time TIMESTAMP', 'computed_arrival_home_time TIMESTAMP',
+    ],
+}.items():
+    for column in columns:
+        DB.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+
+import api
+import emails
+import osrm_client
+
+DIRECT_DURATION_S = 1200  # 20 min domicile → bureau
+
+osrm_client.route = lambda *args, **kwargs: None  # OSRM indisponible
+osrm_client.route_duration = lambda *args, **kwargs: DIRECT_DURATION_S
+emails.send_email = lambda *args, **kwargs: True
+
+client = api.app.test_client()
+
+
+def create_offer():
+    cursor = DB.conn.execute("""
+        INSERT INTO carpool_offers_recurrent
+            (company_id, site_id, departure, destination, departure_coords, destination_coords,
+             recurrent_time, time_return, monday, seats, max_detour_time, driver_email, driver_name)
+        VALUES (1, 1, 'Villeurbanne', 'Lyon Part-Dieu', '[4.88, 45.77]', '[4.86, 45.76]',
+                '08:30:00', '17:30:00', 1, 3, 25, 'driver@example.com', 'Jean Dupont')
+    """)
+    return cursor.lastrowid
+
+
+def add_passenger(offer_id, name, status, detour_outbound, detour_return, coords):
+    cursor = DB.conn.execute("""
+        INSERT INTO carpool_reservations_recurrent
+            (offer_id, passenger_email, passenger_name, monday, meeting_point_coords,
+             meeting_point_address, detour_time_outbound, detour_time_return, status, confirmation_token)
+        VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?)
+    """, (offer_id, f"{name.lower()}@example.com", name, json.dumps(coords), f"Adresse de {name}",
+          detour_outbound, detour_return, status, f"token-{name.lower()}"))
+    return cursor.lastrowid
+
+
+def stored_routes(offer_id):
+    row = DB.conn.execute("SELECT route_outbound, route_return FROM carpool_offers_recurrent WHERE id = ?",
+                          (offer_id,)).fetchone()
+    return json.loads(row[0]), json.loads(row[1])
+
+
+def test_accept_without_osrm_sums_detours():
+    """Acceptation sans OSRM : détour total = somme des détours des passagers confirmés"""
+    offer_id = create_offer()
+    add_passenger(offer_id, 'Marie', 'confirmed', 4, 3, [4.87, 45.775])
+    add_passenger(offer_id, 'Paul', 'confirmed', 6, 5, [4.875, 45.765])
+    pending_id = add_passenger(offer_id, 'Lea', 'pending', 2, 1, [4.865, 45.77])
+
+    response = client.get(f"/api/v2/reservations/recurrent/{pending_id}/accept?token=token-lea")
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+    route_outbound, route_return = stored_routes(offer_id)
+    print(f"   aller {route_outbound['duration'] / 60:.0f} min, retour {route_return['duration'] / 60:.0f} min")
+    assert route_outbound['duration'] == DIRECT_DURATION_S + (4 + 6 + 2) * 60
+    assert route_return['duration'] == DIRECT_DURATION_S + (3 + 5 + 1) * 60
+    assert len(route_outbound['waypoints']) == 3
+
+
+def test_remove_without_osrm_sums_remaining_detours():
+    """Retrait sans OSRM : détour total = somme des détours des passagers restants"""
+    offer_id = create_offer()
+    add_passenger(offer_id, 'Hugo', 'confirmed', 4, 3, [4.87, 45.775])
+    removed_id = add_passenger(offer_id, 'Emma', 'confirmed', 6, 5, [4.875, 45.765])
+
+    response = client.get(f"/api/v2/reservations/recurrent/{removed_id}/remove?token=token-emma")
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+    route_outbound, route_return = stored_routes(offer_id)
+    print(f"   aller {route_outbound['duration'] / 60:.0f} min, retour {route_return['duration'] / 60:.0f} min")
+    assert route_outbound['duration'] == DIRECT_DURATION_S + 4 * 60
+    assert route_return['duration'] == DIRECT_DURATION_S + 3 * 60
+    assert [wp['passenger_name'] for wp in route_outbound['waypoints']] == ['Hugo']
+
+
+if __name__ == '__main__':
+    print("\n🧪 Test du recalcul d'itinéraire sans OSRM")
+    print("=" * 60)
+    for test in (test_accept_without_osrm_sums_detours, test_remove_without_osrm_sums_remaining_detours):
+        print(f"\n▶️  {test.__doc__}")
+        test()
+        print("   ✅ OK")
+    print("")
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Test du pool de connexions MySQL (sans serveur MySQL)
+Timeout d'emprunt, recyclage, pre_ping et abandon des connexions cassées,
+avec des connexions factices à la place de pymysql
+"""
+import sys
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault('CARETTE_DB_PASSWORD', 'test')
+os.environ.setdefault('CARETTE_DB_ROOT_PASSWORD', 'test')
+
+import sql
+from sql import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+    """Sous-ensemble de pymysql.Connection utilisé par le pool"""
+
+    def __init__(self, autocommit=True):
+        self.open = True
+        self._autocommit = autocommit
+        self.ping_error = None
+        self.rollback_error = None
+        self.pings = 0
+        self.rollbacks = 0
+
+    def ping(self, reconnect=True):
+        self.pings += 1
+        if self.ping_error:
+            raise self.ping_error
+
+    def close(self):
+        self.open = False
+
+    def get_autocommit(self):
+        return self._autocommit
+
+    def autocommit(self, value):
+        self._autocommit = value
+
+    def rollback(self):
+        self.rollbacks += 1
+        if self.rollback_error:
+            raise self.rollback_error
+
+
+@contextmanager
+def fake_connections():
+    """Remplace sql.get_connection ; donne la liste des connexions ouvertes"""
+    created = []
+
+    def connect(user='app', autocommit=True):
+        conn = FakeConnection(autocommit)
+        created.append(conn)
+        return conn
+
+    original = sql.get_connection
+    sql.get_connection = connect
+    try:
+        yield created
+    finally:
+        sql.get_connection = original
+
+
+def test_idle_connection_reused():
+    """Connexion rendue puis réempruntée : pas de nouvelle connexion"""
+    with fake_connections() as created:
+        pool = ConnectionPool(max_size=2, timeout=1, recycle=3600, pre_ping=30)
+        conn = pool.acquire()
+        pool.release(conn)
+        assert pool.acquire() is conn
+        assert len(created) == 1
+        stats = pool.get_stats()
+        assert stats['created'] == 1 and stats['reused'] == 1 and stats['in_use'] == 1
+
+
+def test_acquire_timeout():
+    """Pool plein : PoolTimeout après timeout secondes"""
+    with fake_connections():
+        pool = ConnectionPool(max_size=1, timeout=0.05, recycle=3600, pre_ping=30)
+        pool.acquire()
+
+        started = time.time()
+        try:
+            pool.acquire()
+        except PoolTimeout:
+            pass
+        else:
+            raise AssertionError("PoolTimeout attendu")
+        assert 0.05 <= time.time() - started < 1
+        stats = pool.get_stats()
+        assert stats['timeouts'] == 1 and stats['open'] == 1 and stats['in_use'] == 1
+
+
+def test_waiter_gets_released_connection():
+    """Pool plein : une connexion rendue pendant l'attente est prêtée à l'attente"""
+    with fake_connections() as created:
+        pool = ConnectionPool(max_size=1, timeout=2, recycle=3600, pre_ping=30)
+        conn = pool.acquire()
+        threading.Timer(0.05, pool.release, args=(conn,)).start()
+
+        assert pool.acquire() is conn
+        assert len(created) == 1
+        assert pool.get_stats()['waits'] == 1
+
+
+def test_old_connection_recycled():
+    """Connexion plus vieille que recycle : fermée et rouverte à l'emprunt"""
+    with fake_connections() as created:
+        pool = ConnectionPool(max_size=1, timeout=1, recycle=60, pre_ping=30)
+        old = pool.acquire()
+        pool.release(old)
+        pool._created_at[id(old)] -= 120
+
+        conn = pool.acquire()
+        assert conn is not old and conn is created[1]
+        assert not old.open
+        stats = pool.get_stats()
+        assert stats['recycled'] == 1 and stats['open'] == 1
+
+
+def test_pre_ping():
+    """pre_ping=0 : ping à chaque emprunt, connexion remplacée si le ping échoue"""
+    with fake_connections() as created:
+        pool = ConnectionPool(max_size=1, timeout=1, recycle=3600, pre_ping=0)
+        conn = pool.acquire()
+        pool.release(conn)
+        assert pool.acquire() is conn
+        assert conn.pings == 1
+
+        conn.ping_error = ConnectionResetError("MySQL server has gone away")
+        pool.release(conn)
+        fresh = pool.acquire()
+        assert fresh is created[1] and not conn.open
+        stats = pool.get_stats()
+        assert stats['ping_failures'] == 1 and stats['open'] == 1
+
+
+def test_recent_connection_not_pinged():
+    """Connexion au repos depuis moins de pre_ping secondes : pas de ping"""
+    with fake_connections():
+        pool = ConnectionPool(max_size=1, timeout=1, recycle=3600, pre_ping=30)
+        conn = pool.acquire()
+        pool.release(conn)
+        assert pool.acquire() is conn
+        assert conn.pings == 0
+
+
+def test_broken_connections_dropped():
+    """Connexion cassée, fermée ou rollback en échec : fermée, place libérée"""
+    with fake_connections() as created:
+        pool = ConnectionPool(max_size=1, timeout=0.05, recycle=3600, pre_ping=30)
+
+        conn = pool.acquire()
+        pool.release(conn, broken=True)
+        assert not conn.open
+
+        conn = pool.acquire()
+        conn.close()
+        pool.release(conn)
+
+        conn = pool.acquire(autocommit=False)
+        conn.rollback_error = ConnectionResetError("Lost connection")
+        pool.release(conn)
+        assert conn.rollbacks == 1 and not conn.open
+
+        assert len(created) == 3
+        stats = pool.get_stats()
+        assert stats['discarded'] == 3
+        assert stats['open'] == stats['in_use'] == stats['idle'] == 0
+        assert pool.acquire() is created[3]
+
+
+def test_uncommitted_work_rolled_back():
+    """Connexion rendue hors autocommit : rollback puis remise en autocommit"""
+    with fake_connections():
+        pool = ConnectionPool(max_size=1, timeout=1, recycle=3600, pre_ping=30)
+        conn = pool.acquire(autocommit=False)
+        assert not conn.get_autocommit()
+        pool.release(conn)
+        assert conn.rollbacks == 1 and conn.get_autocommit()
+        assert pool.get_stats()['idle'] == 1
+
+
+if __name__ == '__main__':
+    print("\n🧪 Test du pool de connexions MySQL")
+    print("=" * 60)
+    for test in (test_idle_connection_reused, test_acquire_timeout, test_waiter_gets_released_connection,
+                 test_old_connection_recycled, test_pre_ping, test_recent_connection_not_pinged,
+                 test_broken_connections_dropped, test_uncommitted_work_rolled_back):
+        print(f"\n▶️  {test.__doc__}")
+        test()
+        print("   ✅ OK")
+    print("")